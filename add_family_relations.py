@@ -1,94 +1,89 @@
 import json
-import copy
-from typing import Dict, Any
+from typing import Dict, Any, List, Set
+
+from family_tree_model import CompactFamilyTree, GENDER_CODES, NO_NODE
+
+MALE = GENDER_CODES['male']
+
+
+def _relation_labels(tree: CompactFamilyTree, self_node: int, self_nodes: Set[int]) -> List[str]:
+    """One relation label per node of tree, as seen from self_node; every node in self_nodes is "self"."""
+    ids, parent, parent_keys, spouse_keys = tree.ids, tree.parent, tree.parent_keys, tree.spouse_keys
+    self_id = ids[self_node]
+    self_parent_key = parent_keys[self_node]
+    self_parent = parent[self_node] if self_parent_key else NO_NODE
+    grandparent_key = parent_keys[self_parent] if self_parent != NO_NODE else None
+
+    labels = []
+    for i in range(len(tree)):
+        male = tree.gender[i] == MALE
+        parent_key = parent_keys[i]
+
+        # First pass - basic relationships
+        if i in self_nodes:
+            labels.append("self")
+        # Direct parents, and spouses of parents (step-parents)
+        elif ids[i] == self_parent_key or spouse_keys[i] == self_parent_key:
+            labels.append("father" if male else "mother")
+        # Siblings (same parents)
+        elif parent_key == self_parent_key:
+            labels.append("brother" if male else "sister")
+        # Spouse
+        elif spouse_keys[i] == self_id or spouse_keys[self_node] == ids[i]:
+            labels.append("husband" if male else "wife")
+        # Children
+        elif parent_key == self_id:
+            labels.append("son" if male else "daughter")
+        # Spouses of children
+        elif parent[i] != NO_NODE and spouse_keys[parent[i]] == self_id:
+            labels.append("son-in-law" if male else "daughter-in-law")
+
+        # Second pass - extended family relationships
+        # Grandparents
+        elif self_parent != NO_NODE and grandparent_key == ids[i]:
+            labels.append("grandfather" if male else "grandmother")
+        # Aunts/Uncles (parents' siblings)
+        elif self_parent != NO_NODE and parent_key == grandparent_key:
+            labels.append("uncle" if male else "aunt")
+        # Cousins (children of aunts/uncles)
+        elif self_parent != NO_NODE and parent[i] != NO_NODE and parent_keys[parent[i]] == grandparent_key:
+            labels.append("cousin")
+        # Nieces/Nephews (children of siblings)
+        elif parent[i] != NO_NODE and parent_keys[parent[i]] == self_parent_key:
+            labels.append("nephew" if male else "niece")
+        else:
+            labels.append("relative")  # Default fallback
+    return labels
+
 
 def add_family_relations(relatives: Dict[str, Any]) -> Dict[str, Any]:
     """
     Add family relation labels to each person in the relatives dictionary.
-    
+
+    The relations are worked out on a CompactFamilyTree of the relatives,
+    without their profile images, and only the result gets new person
+    dicts; the input is left unchanged.
+
     Args:
         relatives (Dict[str, Any]): Dictionary of relatives with IDs as keys
-        
+
     Returns:
         Dict[str, Any]: Dictionary with processed relatives under the '_j' key
     """
-    # Create a clean object with a deep copy of the input data
-    clean_relatives = copy.deepcopy(relatives)
-    
+    people = list(relatives.values())
+
     # Find the self node (marked with isSelf: true)
-    self_node = None
-    for id_key in clean_relatives:
-        if clean_relatives[id_key].get('isSelf') == True:
-            self_node = clean_relatives[id_key]
-            break
-    
-    if not self_node:
+    self_node = next((i for i, person in enumerate(people) if person.get('isSelf') == True), None)
+    if self_node is None:
         print("No self node found in the data")
-        return {"_j": clean_relatives}  # Maintain consistent return structure
-    
-    # First pass - set basic relationships
-    for id_key in clean_relatives:
-        person = clean_relatives[id_key]
-        
-        if person.get('isSelf'):
-            person['relation'] = "self"
-        # Direct parents
-        elif person.get('id') == self_node.get('parentId'):
-            person['relation'] = "father" if person.get('gender') == "male" else "mother"
-        # Spouses of parents (step-parents)
-        elif person.get('spouse') == self_node.get('parentId'):
-            person['relation'] = "father" if person.get('gender') == "male" else "mother"
-        # Siblings (same parents)
-        elif person.get('parentId') == self_node.get('parentId'):
-            person['relation'] = "brother" if person.get('gender') == "male" else "sister"
-        # Spouse
-        elif person.get('spouse') == self_node.get('id') or self_node.get('spouse') == person.get('id'):
-            person['relation'] = "husband" if person.get('gender') == "male" else "wife"
-        # Children
-        elif person.get('parentId') == self_node.get('id'):
-            person['relation'] = "son" if person.get('gender') == "male" else "daughter"
-        # Spouses of children
-        elif (person.get('parentId') in clean_relatives and 
-              clean_relatives[person.get('parentId')].get('spouse') == self_node.get('id')):
-            person['relation'] = "son-in-law" if person.get('gender') == "male" else "daughter-in-law"
-        else:
-            person['relation'] = "relative"  # Default fallback
-    
-    # Second pass - handle extended family relationships
-    for id_key in clean_relatives:
-        person = clean_relatives[id_key]
-        
-        if person.get('relation') != "relative":
-            continue  # Skip already classified
-        
-        # Grandparents
-        if (self_node.get('parentId') and 
-            self_node.get('parentId') in clean_relatives and 
-            clean_relatives[self_node.get('parentId')].get('parentId') == person.get('id')):
-            person['relation'] = "grandfather" if person.get('gender') == "male" else "grandmother"
-        
-        # Aunts/Uncles (parents' siblings)
-        elif (self_node.get('parentId') and 
-              self_node.get('parentId') in clean_relatives and 
-              person.get('parentId') == clean_relatives[self_node.get('parentId')].get('parentId')):
-            person['relation'] = "uncle" if person.get('gender') == "male" else "aunt"
-        
-        # Cousins (children of aunts/uncles)
-        elif (self_node.get('parentId') and 
-              self_node.get('parentId') in clean_relatives and 
-              person.get('parentId') and 
-              person.get('parentId') in clean_relatives and 
-              clean_relatives[person.get('parentId')].get('parentId') == 
-              clean_relatives[self_node.get('parentId')].get('parentId')):
-            person['relation'] = "cousin"
-        
-        # Nieces/Nephews (children of siblings)
-        elif (person.get('parentId') and 
-              person.get('parentId') in clean_relatives and 
-              clean_relatives[person.get('parentId')].get('parentId') == self_node.get('parentId')):
-            person['relation'] = "nephew" if person.get('gender') == "male" else "niece"
-    
-    return {"_j": clean_relatives}  # Maintain consistent return structure
+        return {"_j": {id_key: dict(person) for id_key, person in relatives.items()}}  # Maintain consistent return structure
+
+    self_nodes = {i for i, person in enumerate(people) if person.get('isSelf')}
+    labels = _relation_labels(CompactFamilyTree(people, keep_images=False), self_node, self_nodes)
+    return {"_j": {
+        id_key: {**person, 'relation': label}
+        for (id_key, person), label in zip(relatives.items(), labels)
+    }}  # Maintain consistent return structure
 
 
 if __name__ == "__main__":
@@ -15,6 +15,7 @@ from flask_cors import CORS
 import logging
 from werkzeug.utils import secure_filename
 import hashlib
+import multiprocessing
 from get_connections import get_user_connections
 from family_spouse_manager import (
     add_spouse_relationship, 
@@ -37,6 +38,16 @@ from family_child_manager import add_child_to_family_tree, create_family_tree_wi
 from family_parent_manager import add_parents_to_family_tree, create_family_tree_with_parents, merge_family_trees
 from notification_manager import get_user_notifications, mark_notifications_read, archive_notifications, mark_all_notifications_read
 from firebase_init import get_firestore_client
+from profile_search_index import index_profile
+from profile_snapshot import profile_snapshot
+from relationship_cache import relationship_cache
+from render_cache import render_cache
+from avatar_cache import avatar_cache, avatar_key
+from render_jobs import render_jobs, render_content_key
+from family_tree_email_index import index_family_tree_members, rebuild_family_tree_email_index
+from request_cache import request_scoped_db, request_cache_stats, READS_SAVED_HEADER
+from phonetic_keys import phonetic_name_keys
+from family_duplicates import find_duplicate_people
 
 # Import the new friend manager module
 from friend_manager import add_noprofile_friend
@@ -226,6 +237,20 @@ except Exception as e:
     else:
         raise
 
+
+def _warm_profile_snapshot():
+    """Load the profile snapshot (and with it the search index) at startup."""
+    try:
+        profile_snapshot.ensure_fresh(db)
+    except Exception as e:
+        logger.error(f"Error loading profile snapshot at startup: {e}")
+
+
+# Render workers are spawned processes that may import this module too, only the server warms up
+if db is not None and multiprocessing.parent_process() is None \
+        and os.environ.get('PROFILE_SNAPSHOT_WARM_START', '1') == '1':
+    threading.Thread(target=_warm_profile_snapshot, daemon=True).start()
+
 # File upload configuration
 UPLOAD_FOLDER = './uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -244,6 +269,74 @@ def health_check():
     """Simple endpoint to check if the API is running."""
     return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
 
+
+@app.after_request
+def report_request_cache(response):
+    """Report how many document reads the request-scoped cache saved."""
+    stats = request_cache_stats()
+    if stats:
+        response.headers[READS_SAVED_HEADER] = str(stats['readsSaved'])
+        if stats['readsSaved']:
+            logger.info(f"{request.method} {request.path}: {stats['reads']} document reads, "
+                        f"{stats['readsSaved']} saved by the request cache")
+    return response
+
+
+@app.route('/api/profile-snapshot/metrics', methods=['GET'])
+def profile_snapshot_metrics():
+    """Hit/miss counters, sync statistics and lag of the in-process profile snapshot"""
+    return jsonify({"success": True, "metrics": profile_snapshot.metrics()})
+
+
+@app.route('/api/relationship-cache/metrics', methods=['GET'])
+def relationship_cache_metrics():
+    """Hit/miss counters, evictions and memory use of the relationship label cache"""
+    return jsonify({"success": True, "metrics": relationship_cache.metrics()})
+
+
+@app.route('/api/render-cache/metrics', methods=['GET'])
+def render_cache_metrics():
+    """Hit/miss counters, evictions and memory and disk use of the tree image render cache"""
+    return jsonify({"success": True, "metrics": render_cache.metrics()})
+
+
+@app.route('/api/avatar-cache/metrics', methods=['GET'])
+def avatar_cache_metrics():
+    """Hit/miss counters, evictions, disk use and decode time saved of the avatar thumbnail cache"""
+    return jsonify({"success": True, "metrics": avatar_cache.metrics()})
+
+
+@app.route('/api/render-jobs/metrics', methods=['GET'])
+def render_jobs_metrics():
+    """Job counters and queue depth of the background tree render queue"""
+    return jsonify({"success": True, "metrics": render_jobs.metrics()})
+
+
+@app.route('/api/render-jobs/<job_id>', methods=['GET'])
+def get_render_job(job_id):
+    """Status of a background tree render, with its result once it is done"""
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Render job not found or expired"}), 404
+    return jsonify({"success": True, "job": job})
+
+
+def render_async_requested(data=None):
+    """Whether the client asked for a background render with async=true in the query or body."""
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return bool(data) and data.get('async') is True
+
+
+def queued_render_response(job, extra=None):
+    """202 with the job to poll (and any extra fields), 429 when the render queue is full."""
+    if job is None:
+        return jsonify({"success": False, "error": "Too many renders in progress, try again later"}), 429
+    response = {"success": True, "jobId": job['jobId'], "status": job['status'], "job": job}
+    response.update(extra or {})
+    return jsonify(response), 202
+
+
 @app.route('/api/profile/create', methods=['POST'])
 def create_profile():
     """
@@ -304,8 +397,10 @@ def create_profile():
                 'createdAt': now,
                 'updatedAt': now
             }
+            user_data.update(phonetic_name_keys(user_data['firstName'], user_data['lastName']))
             
             user_doc_ref.set(user_data, merge=True)
+            index_profile(email, user_data)
             
             # Store only profile image in the subcollection if it exists
             if profile_image:
@@ -321,6 +416,7 @@ def create_profile():
                 user_doc_ref.update({
                     'currentProfileImageId': image_entry_id
                 })
+                index_profile(email, {'currentProfileImageId': image_entry_id})
                 
                 logger.info(f"Profile and image created for {email} with image ID: {image_entry_id}")
             else:
@@ -1005,60 +1101,92 @@ def update_profile():
             "error": str(e)
         }), 500
 # write store family tree image in firebase storage
-def store_family_tree_image(img_base64, family_tree_id):
+def store_family_tree_image(img_base64, family_tree_id, render_key=None):
     try:
         # ge thedocument ref of family tree using family tree id
         family_tree_ref = db.collection('family_tree').document(family_tree_id)
-        family_tree_doc = family_tree_ref.get()
+        family_tree_doc = family_tree_ref.get(field_paths=['family_tree_image_key'])
         if not family_tree_doc.exists:
             logger.error("Family tree document not found")
             return jsonify({'error': 'Family tree document not found'}), 404
+        # The stored image already shows this exact tree
+        if render_key and (family_tree_doc.to_dict() or {}).get('family_tree_image_key') == render_key:
+            return jsonify({'success': True, 'message': 'Family tree image is up to date'})
         # create or updatethe field family_tree_image with the image base64
-        family_tree_ref.update({'family_tree_image': img_base64})
+        family_tree_ref.update({'family_tree_image': img_base64, 'family_tree_image_key': render_key})
         return jsonify({'success': True, 'message': 'Family tree image stored successfully'})
     except Exception as e:
         logger.error(f"Error in store_family_tree_image: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-from generate_family_tree import generate_family_tree
+def _finish_family_tree_render(img_base64, family_tree_id, render_key):
+    """Store the image of a background family tree render, runs when the worker is done."""
+    if isinstance(img_base64, str) and img_base64.startswith("Error:"):
+        raise RuntimeError(img_base64)
+    with app.app_context():
+        response = app.make_response(store_family_tree_image(img_base64, family_tree_id, render_key))
+    if response.status_code >= 300:
+        error = (response.get_json(silent=True) or {}).get('error', response.status)
+        raise RuntimeError(f"Error storing family tree image: {error}")
+    return {'image': img_base64}
+
+
+from generate_family_tree import generate_family_tree, family_tree_render_key
+from tree_layout import layout_family_tree
 @app.route('/generate-tree', methods=['POST'])
 def generate_tree():
+    """
+    Layout of a family tree: the coordinates of every member and the size
+    of the layout. Graphviz only runs when "includeImage": true is sent
+    (body or query), the base64 PNG is then returned as 'image' and stored
+    on the family tree.
+    """
     data = request.get_json()
     family_members = data.get('familyMembers', [])
     family_tree_id = data.get('familyTreeId', '')
-    
-    print(family_tree_id)
+    include_image = (data.get('includeImage') is True
+                     or request.args.get('includeImage', '').lower() in ('1', 'true', 'yes'))
     
     if not family_members:
         return jsonify({'error': 'No family data provided'}), 400
 
     try:
-        result = generate_family_tree(family_members)
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 500
-        img_base64 = result["image"]
-        # store the image in firebase storage
-        if family_tree_id:
-            store_family_tree_image(img_base64, family_tree_id)     
-        else:
+        result = layout_family_tree(family_members)
+        if not include_image:
+            return jsonify(result)
+
+        if not family_tree_id:
             logger.error("No family tree ID provided")
             return jsonify({'error': 'No family tree ID provided'}), 400
-        # write store family tree image in firebase storage
-        
-        
-        return jsonify({
-            'image': img_base64,
-            'coordinates': result['coordinates'],
-            'image_width': result['image_width'], 
-            'image_height': result['image_height']
-        })
+
+        render_key = family_tree_render_key(family_members)
+        if render_async_requested(data) and render_cache.get(render_key) is None:
+            job = render_jobs.submit(
+                'family_tree', data.get('email') or family_tree_id, render_key,
+                generate_family_tree, family_members, render_key,
+                on_done=lambda img: _finish_family_tree_render(img, family_tree_id, render_key),
+                notify_email=data.get('email'))
+            return queued_render_response(job, result)
+
+        img_base64 = generate_family_tree(family_members, render_key)
+        # generate_family_tree reports failures as a message instead of raising
+        if img_base64.startswith("Error:"):
+            return jsonify({"error": img_base64}), 500
+        # store the image in firebase storage
+        store_family_tree_image(img_base64, family_tree_id, render_key)
+
+        result['image'] = img_base64
+        return jsonify(result)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-from search_profiles_by_info import search_profiles_by_info    
+from search_profiles_by_info import (
+    search_profiles_by_info, search_profiles_page,
+    IMAGE_MODES, IMAGE_MODE_FULL, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+)
 @app.route('/api/search-profiles', methods=['POST'])
 def search_profiles():
     try:
@@ -1067,28 +1195,89 @@ def search_profiles():
         last_name = data.get('lastName', '')
         email = data.get('email', '')
         phone = data.get('phone', '')
+        image_mode = data.get('imageMode', IMAGE_MODE_FULL)
+        cursor = data.get('cursor')
         
         # Ensure at least one search parameter is provided
         if not any([first_name, last_name, email, phone]):
             return jsonify({"error": "At least one search parameter (firstName, lastName, email, or phone) is required"}), 400
         
+        if image_mode not in IMAGE_MODES:
+            return jsonify({"error": f"imageMode must be one of: {', '.join(IMAGE_MODES)}"}), 400
+        
+        try:
+            limit = int(data.get('limit', SEARCH_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+        if limit <= 0:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, SEARCH_MAX_LIMIT)
+        
         # Pass all search parameters to the function
-        matches = search_profiles_by_info(
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            phone=phone,
-            db=db
-        )
+        try:
+            page = search_profiles_page(
+                first_name=first_name,
+                last_name=last_name,
+                email=email,
+                phone=phone,
+                db=db,
+                image_mode=image_mode,
+                limit=limit,
+                cursor=cursor
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         return jsonify({
             "success": True,
-            "matches": matches
+            "matches": page["matches"],
+            "nextCursor": page["nextCursor"],
+            "hasMore": page["hasMore"]
         })
         
     except Exception as e:
         logger.error(f"Error in search-profiles endpoint: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/family-tree/email-index/rebuild', methods=['POST'])
+def rebuild_email_index():
+    """
+    Index the email -> (familyTreeId, nodeId) mapping of every existing family tree.
+    Run once after deploying; tree mutations keep the index current afterwards.
+    """
+    try:
+        family_trees = rebuild_family_tree_email_index(db)
+        return jsonify({"success": True, "familyTreesIndexed": family_trees})
+    except Exception as e:
+        logger.error(f"Error rebuilding family tree email index: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/family-tree/find-duplicates', methods=['POST'])
+def find_family_tree_duplicates():
+    """
+    Report people that likely appear in more than one family tree.
+
+    Family tree members are grouped by phonetic blocking key and only
+    members sharing a key are compared.
+    Optional body: {"familyTreeId": "..."} to only report pairs involving that tree.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        family_tree_id = data.get('familyTreeId')
+
+        duplicates = find_duplicate_people(db, family_tree_id)
+
+        return jsonify({
+            "success": True,
+            "duplicates": duplicates,
+            "count": len(duplicates)
+        })
+
+    except Exception as e:
+        logger.error(f"Error in find-duplicates endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
     
 
 from sendinvite import save_received_invitation, save_sent_invitation   
@@ -1301,6 +1490,7 @@ def update_family_tree():
             'updatedAt': datetime.now().isoformat(),
             'createdAt': datetime.now().isoformat()
         }, merge=True)
+        index_family_tree_members(family_tree_id, family_members, db)
         
         return jsonify({
             "success": True,
@@ -1701,6 +1891,12 @@ def add_spouse_details():
 from generate_relatives_tree import generate_relatives_tree
 from flask import jsonify, request
 
+def _finish_relatives_tree_render(img_base64):
+    """Result of a background relatives tree render."""
+    if isinstance(img_base64, str) and img_base64.startswith("Error:"):
+        raise RuntimeError(img_base64)
+    return {'image': img_base64}
+
 @app.route('/generate-relatives-tree', methods=['POST'])
 def generate_relatives_tree_route():
     data = request.get_json()
@@ -1710,6 +1906,13 @@ def generate_relatives_tree_route():
         return jsonify({'error': 'No relatives data provided'}), 400
 
     try:
+        if render_async_requested(data):
+            job = render_jobs.submit(
+                'relatives_tree', data.get('email'), render_content_key(relatives_data),
+                generate_relatives_tree, relatives_data,
+                on_done=_finish_relatives_tree_render, notify_email=data.get('email'))
+            return queued_render_response(job)
+
         img_base64 = generate_relatives_tree(relatives_data)
         # Check if the result is an error message (string starting with "Error:")
         if isinstance(img_base64, str) and img_base64.startswith("Error:"):
@@ -1955,6 +2158,14 @@ def get_friends():
         }), 500
         
 
+from generate_friends_tree import generate_friends_tree
+
+def _finish_friends_tree_render(image_base64, user_email):
+    """Result of a background friends tree render."""
+    if image_base64 is None:
+        raise RuntimeError("Error generating friends tree visualization")
+    return {"userEmail": user_email, "image": image_base64}
+
 @app.route('/api/friends-tree/generate-visualization', methods=['GET', 'POST'])
 def generate_friends_tree_visualization():
     """
@@ -1963,6 +2174,7 @@ def generate_friends_tree_visualization():
     """
     try:
         # Get email from either query parameters (GET) or JSON body (POST)
+        data = None
         if request.method == 'GET':
             user_email = request.args.get('email')
         else:  # POST
@@ -2017,6 +2229,15 @@ def generate_friends_tree_visualization():
         else:
             friends_list = []
 
+        if render_async_requested(data):
+            job = render_jobs.submit(
+                'friends_tree', user_email,
+                render_content_key(user_name, avatar_key(user_profile_image), friends_list),
+                generate_friends_tree, user_email, user_name, user_profile_image, friends_list,
+                on_done=lambda img: _finish_friends_tree_render(img, user_email),
+                notify_email=user_email)
+            return queued_render_response(job)
+
         # Generate friends tree visualization
         image_base64 = generate_friends_tree(user_email, user_name, user_profile_image, friends_list)
 
@@ -2037,252 +2258,6 @@ def generate_friends_tree_visualization():
             "details": error_details
         }), 500
 
-def generate_friends_tree(user_email, user_name, user_profile_image, friends_list):
-    """
-    Generate a tree visualization for a user's friends using the same theme as family tree
-    
-    Args:
-        user_email (str): Email of the user
-        user_name (str): Name of the user
-        user_profile_image (str or bytes): Base64 encoded profile image data or bytes
-        friends_list (list): List of friend nodes
-        
-    Returns:
-        str: Base64 encoded image of the friends tree
-    """
-    import tempfile
-    import os
-    import base64
-    from graphviz import Digraph
-    from PIL import Image, ImageDraw, ImageOps
-    import io
-
-    # Create temp directory for profile images
-    temp_dir = tempfile.mkdtemp(prefix='friends_tree_')
-    
-    # Create a Digraph object with enhanced background (same as family tree)
-    dot = Digraph(
-        comment='Friends Tree',
-        format='png',
-        engine='dot',
-        graph_attr={
-            'rankdir': 'TB',  # Top to bottom direction
-            'splines': 'polyline',  # Use polyline for natural connections
-            'bgcolor': '#FFFFFF',  # Pure white background
-            'nodesep': '1.4',  # Increased node separation
-            'ranksep': '2.0',  # Increased rank separation
-            'fontname': 'Arial',
-            'style': 'rounded',  # Rounded style
-            'color': '#000000',  # Black border color
-            'penwidth': '2.0',  # Border thickness
-        },
-        node_attr={
-            'shape': 'box',
-            'style': 'filled,rounded',
-            'fillcolor': 'white',
-            'fontcolor': 'black',
-            'penwidth': '1.5',
-            'fontsize': '22',
-            'fontname': 'Arial',
-            'height': '1.2',
-            'width': '2.8',
-            'margin': '0.5'
-        },
-        edge_attr={
-            'color': '#444444',
-            'penwidth': '4.0'
-        }
-    )
-
-    def create_profile_image_node(profile_image_data, node_id):
-        """Create a temporary profile image file from base64 data or use default icon."""
-        image_path = os.path.join(temp_dir, f'friend_profile_{node_id}.png')
-        
-        try:
-            if profile_image_data:
-                # Handle base64 string
-                if isinstance(profile_image_data, str):
-                    if profile_image_data.startswith('data:image'):
-                        # Extract the base64 data
-                        base64_data = profile_image_data.split(',')[1]
-                        image_data = base64.b64decode(base64_data)
-                        
-                        # Convert to PIL Image
-                        img = Image.open(BytesIO(image_data))
-                        img = img.convert('RGBA')
-                        # Resize to a reasonable size
-                        img = img.resize((100, 100), Image.Resampling.LANCZOS)
-                        img.save(image_path, 'PNG')
-                        return image_path
-                
-                # Handle bytes directly
-                elif isinstance(profile_image_data, bytes):
-                    img = Image.open(BytesIO(profile_image_data))
-                    img = img.convert('RGBA')
-                    img = img.resize((100, 100), Image.Resampling.LANCZOS)
-                    img.save(image_path, 'PNG')
-                    return image_path
-            
-            # Create default profile icon
-            img = Image.new('RGBA', (100, 100), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(img)
-            # Draw a circle for the head
-            draw.ellipse([25, 25, 75, 75], fill=(204, 204, 204, 255))
-            # Draw a path for the body
-            draw.polygon([(50, 70), (30, 100), (70, 100)], fill=(204, 204, 204, 255))
-            img.save(image_path, 'PNG')
-            return image_path
-            
-        except Exception as e:
-            print(f"Error creating profile image: {e}")
-            return None
-
-    # Create center node for the user with special styling
-    user_node_id = "user"
-    user_image_path = create_profile_image_node(user_profile_image, user_node_id)
-    
-    # Create a stylized label for the user node
-    user_label = f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='10'>"
-    if user_image_path:
-        image_path = user_image_path.replace('\\', '/')
-        user_label += f"<TR><TD ROWSPAN='2'><IMG SRC='{image_path}' SCALE='TRUE' FIXEDSIZE='TRUE' WIDTH='90' HEIGHT='90'/></TD>"
-    else:
-        user_label += "<TR><TD ROWSPAN='2'><FONT POINT-SIZE='50'>👤</FONT></TD>"
-    
-    # Add name with larger font
-    user_label += f"<TD ALIGN='LEFT'><FONT POINT-SIZE='35'><B>{user_name}</B></FONT></TD></TR>"
-    user_label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>Myself</FONT></TD></TR>"
-    user_label += "</TABLE>>"
-    
-    # Add user node with special styling
-    dot.node(
-        user_node_id,
-        label=user_label,
-        fillcolor='#00a3ee',  # Special blue color for self node
-        fontcolor='white',
-        style='filled,rounded',
-        penwidth='1.5'
-    )
-
-    # Group friends by category
-    friend_categories = {}
-    for friend in friends_list:
-        category = friend.get('category', 'Other')
-        if category not in friend_categories:
-            friend_categories[category] = []
-        friend_categories[category].append(friend)
-
-    # Category colors (using a softer palette)
-    category_colors = {
-        'Family': '#E8F5E9',  # Soft green
-        'Close Friends': '#E3F2FD',  # Soft blue
-        'Colleagues': '#FFF3E0',  # Soft orange
-        'School': '#F3E5F5',  # Soft purple
-        'Neighbors': '#FFFDE7',  # Soft yellow
-        'Other': '#FAFAFA'  # Light gray
-    }
-
-    # Create a central point for better organization
-    center_point = "center_point"
-    dot.node(center_point, "", shape="point", style="invis")
-    dot.edge(user_node_id, center_point, style="invis")
-
-    # For each category, create a subgraph
-    for category_index, (category, friends) in enumerate(friend_categories.items()):
-        # Create a subgraph for this category
-        with dot.subgraph(name=f'cluster_{category}') as c:
-            c.attr(
-                label=category,
-                style='filled,rounded',
-                fillcolor=category_colors.get(category, '#FAFAFA'),
-                fontname='Arial',
-                fontsize='25',
-                penwidth='2.0'
-            )
-            
-            # Create a chain of nodes for vertical arrangement
-            prev_node_id = None
-            
-            # Add friend nodes in this category
-            for i, friend in enumerate(friends):
-                friend_id = f"friend_{category_index}_{i}"
-                
-                # Create friend profile image
-                friend_image_path = create_profile_image_node(friend.get('profileImage'), friend_id)
-                
-                # Create stylized label for friend node
-                friend_label = f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='10'>"
-                if friend_image_path:
-                    image_path = friend_image_path.replace('\\', '/')
-                    friend_label += f"<TR><TD ROWSPAN='2'><IMG SRC='{image_path}' SCALE='TRUE' FIXEDSIZE='TRUE' WIDTH='90' HEIGHT='90'/></TD>"
-                else:
-                    friend_label += "<TR><TD ROWSPAN='2'><FONT POINT-SIZE='50'>👤</FONT></TD>"
-                
-                # Add name and category
-                friend_label += f"<TD ALIGN='LEFT'><FONT POINT-SIZE='35'><B>{friend.get('name', 'Unknown')}</B></FONT></TD></TR>"
-                friend_label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>{category}</FONT></TD></TR>"
-                friend_label += "</TABLE>>"
-                
-                # Add friend node
-                c.node(
-                    friend_id,
-                    label=friend_label,
-                    fillcolor='white',
-                    style='filled,rounded',
-                    penwidth='1.5'
-                )
-                
-                # Connect to previous node in the category for vertical arrangement
-                if prev_node_id:
-                    # Add invisible edge to force vertical arrangement
-                    c.edge(prev_node_id, friend_id, style="invis", constraint='true')
-                elif i == 0:
-                    # Connect first node of category to center point
-                    dot.edge(center_point, friend_id, 
-                        color='#444444',
-                        penwidth='4.0',
-                        arrowhead='none'
-                    )
-                
-                # Update previous node ID for next iteration
-                prev_node_id = friend_id
-                
-            # Force all nodes in this category to be arranged vertically
-            c.attr(rankdir='TB')  # Top to bottom arrangement within category
-            if len(friends) > 1:
-                c.attr(rank='same')  # Ensure nodes in same category stay together
-
-    # Render the graph to PNG
-    temp_dir = tempfile.gettempdir()
-    output_path = os.path.abspath(os.path.join(temp_dir, 'friends_tree'))
-    
-    try:
-        # Create the output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Render the graph
-        dot.render(output_path, format='png', cleanup=True)
-        
-        # Read the image and encode it to base64
-        with open(f"{output_path}.png", 'rb') as f:
-            img_data = f.read()
-        img_base64 = base64.b64encode(img_data).decode('utf-8')
-        
-        # Clean up temporary files
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                if file.startswith('friend_profile_'):
-                    try:
-                        os.remove(os.path.join(root, file))
-                    except:
-                        pass
-        
-        return img_base64
-        
-    except Exception as e:
-        print(f"Error generating friends tree: {e}")
-        return None
-
 @app.route('/api/get-connections', methods=['GET'])
 def get_connections():
     
@@ -2400,6 +2375,124 @@ def get_member_relatives_tree():
             'details': error_details
         }), 500
 
+from kinship import get_member_kinship
+@app.route('/api/get-member-kinship', methods=['POST'])
+def get_member_kinship_api():
+    """
+    API endpoint to label how members of a family tree are related to a node.
+    Unlike get-member-relatives-tree it answers for any pair of members,
+    including cousin degree and removal.
+
+    Request Body (JSON):
+        family_tree_id (str): ID of the family tree
+        node_id (str): ID of the node the relations are seen from
+        target_node_ids (list, optional): Nodes to label, all members if omitted
+
+    Returns:
+        JSON response containing one kinship entry per target node
+    """
+    try:
+        data = request.get_json() or {}
+        family_tree_id = data.get('family_tree_id')
+        node_id = data.get('node_id')
+        target_node_ids = data.get('target_node_ids')
+
+        if not all([family_tree_id, node_id]):
+            return jsonify({
+                'success': False,
+                'message': 'Missing required parameters: family_tree_id and node_id are required'
+            }), 400
+
+        if target_node_ids is not None and not isinstance(target_node_ids, list):
+            return jsonify({
+                'success': False,
+                'message': 'target_node_ids must be a list'
+            }), 400
+
+        relations = get_member_kinship(family_tree_id, node_id, target_node_ids, db)
+        if relations is None:
+            return jsonify({
+                'success': False,
+                'message': 'Family tree or node not found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'relations': relations,
+                'centered_node_id': node_id
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"Error in get-member-kinship endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+from family_tree_graph import get_users_relatives_within, FAMILY_GRAPH_MAX_HOPS
+
+# Maximum number of users answered by one get-relatives-within-hops request
+RELATIVES_WITHIN_MAX_USERS = 100
+
+@app.route('/api/get-relatives-within-hops', methods=['POST'])
+def get_relatives_within_hops():
+    """
+    API endpoint to list everyone within a number of hops of one or more
+    users, following the relatives links into other family trees.
+    All users of a request share one graph, so linked trees are read once.
+
+    Request Body (JSON):
+        email (str) or emails (list): User(s) to answer for
+        max_hops (int, optional): Hop bound, default 2, at most FAMILY_GRAPH_MAX_HOPS
+
+    Returns:
+        JSON response mapping every email to its relatives, null for users
+        without a family tree node
+    """
+    try:
+        data = request.get_json() or {}
+        emails = data.get('emails')
+        if emails is None and data.get('email'):
+            emails = [data.get('email')]
+        max_hops = data.get('max_hops', 2)
+
+        if not emails or not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+            return jsonify({
+                'success': False,
+                'message': 'Provide an email or a list of emails'
+            }), 400
+        if len(emails) > RELATIVES_WITHIN_MAX_USERS:
+            return jsonify({
+                'success': False,
+                'message': f'At most {RELATIVES_WITHIN_MAX_USERS} emails per request'
+            }), 400
+        if type(max_hops) is not int or not 0 <= max_hops <= FAMILY_GRAPH_MAX_HOPS:
+            return jsonify({
+                'success': False,
+                'message': f'max_hops must be an integer between 0 and {FAMILY_GRAPH_MAX_HOPS}'
+            }), 400
+
+        relatives = get_users_relatives_within(emails, max_hops, db)
+        return jsonify({
+            'success': True,
+            'data': {
+                'relatives': relatives,
+                'max_hops': max_hops
+            }
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error in get-relatives-within-hops endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+# Maximum number of profiles fetched per get_all call by get_user_names
+USER_NAMES_BATCH_SIZE = 100
+
 @app.route('/api/users/get-names', methods=['POST'])
 def get_user_names():
     """
@@ -2426,18 +2519,50 @@ def get_user_names():
         # Initialize results dictionary
         user_names = {}
 
-        # Get users data from Firestore
+        # Build one document reference per distinct valid email
+        refs_by_email = {}
         for email in emails:
             if not email or not isinstance(email, str):
                 user_names[email] = None
                 continue
+            if email in refs_by_email or email in user_names:
+                continue
+            try:
+                refs_by_email[email] = user_profiles_ref.document(email)
+            except Exception as e:
+                print(f"Error processing email {email}: {e}")
+                user_names[email] = {
+                    'fullName': 'Error',
+                    'userProfileExists': False,
+                    'error': str(e)
+                }
 
+        # Fetch the profiles in batched reads, projected to the name fields
+        pending_emails = list(refs_by_email)
+        for start in range(0, len(pending_emails), USER_NAMES_BATCH_SIZE):
+            chunk = pending_emails[start:start + USER_NAMES_BATCH_SIZE]
             try:
-                # Get user document
-                user_doc = user_profiles_ref.document(email).get()
-                
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
+                user_docs = {
+                    user_doc.id: user_doc
+                    for user_doc in db.get_all(
+                        [refs_by_email[email] for email in chunk],
+                        field_paths=['firstName', 'lastName']
+                    )
+                }
+            except Exception as e:
+                print(f"Error fetching names for {len(chunk)} emails: {e}")
+                for email in chunk:
+                    user_names[email] = {
+                        'fullName': 'Error',
+                        'userProfileExists': False,
+                        'error': str(e)
+                    }
+                continue
+
+            for email in chunk:
+                user_doc = user_docs.get(email)
+                if user_doc is not None and user_doc.exists:
+                    user_data = user_doc.to_dict() or {}
                     first_name = user_data.get('firstName', '')
                     last_name = user_data.get('lastName', '')
                     full_name = f"{first_name} {last_name}".strip()
@@ -2455,14 +2580,6 @@ def get_user_names():
                     'fullName': full_name,
                     'userProfileExists': user_profile_exists
                 }
-                
-            except Exception as e:
-                print(f"Error processing email {email}: {e}")
-                user_names[email] = {
-                    'fullName': 'Error',
-                    'userProfileExists': False,
-                    'error': str(e)
-                }
 
         # Return results
         return jsonify({
@@ -3853,8 +3970,8 @@ def add_mutual_friends_api():
                 "message": "Categories for both users are required"
             }), 400
             
-        # Get database instance
-        db = firestore.client()
+        # Get database instance, deduplicating repeated document reads within this request
+        db = request_scoped_db(firestore.client())
         
         # Call the function to establish mutual friendship
         from friend_manager import add_mutual_friends
@@ -5291,11 +5408,16 @@ def get_family_tree_image():
         # get the document ref of family tree using family tree id
         family_tree_ref = db.collection('family_tree').document(family_tree_id)
         print("family tree ref",family_tree_ref)
-        family_tree_doc = family_tree_ref.get()
+        family_tree_doc = family_tree_ref.get(field_paths=['family_tree_image_key'])
         if not family_tree_doc.exists:
             return jsonify({'error': 'Family tree document not found'}), 404
+        # Serve the rendered image from the render cache, read the stored copy only on a miss
+        cached_image = render_cache.get((family_tree_doc.to_dict() or {}).get('family_tree_image_key'))
+        if cached_image is not None:
+            return jsonify({'family_tree_image': base64.b64encode(cached_image).decode('utf-8')})
+        family_tree_doc = family_tree_ref.get(field_paths=['family_tree_image'])
         # get the family tree image from the document
-        family_tree_image = family_tree_doc.get('family_tree_image')
+        family_tree_image = (family_tree_doc.to_dict() or {}).get('family_tree_image')
         print("tree image fetched successfullly")
         return jsonify({'family_tree_image': family_tree_image})
     except Exception as e:
@@ -5412,7 +5534,7 @@ def cleanup_expired_otps():
 def get_email_from_number():
     phone_number = request.args.get('phone_number')
     phone_number = '+91'+phone_number
-    number_collection_ref = db.collection('numbers')
+    number_collection_ref = request_scoped_db(db).collection('numbers')
     if number_collection_ref:
         number_doc_ref = number_collection_ref.document(phone_number)
         if not number_doc_ref.get().exists: 
@@ -5769,12 +5891,14 @@ def delete_family_tree_node():
                 'familyMembers': current_members
             })
             print("Family tree update completed in transaction")
+            return current_members
 
         # Execute the transaction
         print("Executing transaction...")
         transaction = db.transaction()
-        delete_node_transaction(transaction)
+        remaining_members = delete_node_transaction(transaction)
         print("Transaction completed successfully")
+        index_family_tree_members(family_tree_id, remaining_members, db)
 
         # Update user profiles for all affected nodes
         print(f"Processing {len(nodes_to_process)} user profiles for updates")
@@ -5887,6 +6011,7 @@ def update_family_tree_node():
             'familyMembers': updated_members,
             'updatedAt': datetime.now().isoformat()
         })
+        index_family_tree_members(family_tree_id, updated_members, db)
 
         # If email is provided, update the user's profile
         if email:
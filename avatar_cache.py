@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Dict, Optional, Union, Any
+
+from PIL import Image, ImageDraw
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bound in bytes of the avatar thumbnails kept on disk
+AVATAR_CACHE_MAX_BYTES = int(os.environ.get('AVATAR_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Misses between two reads of the whole directory, so the other processes' thumbnails
+# can take it past AVATAR_CACHE_MAX_BYTES by at most this many thumbnails each
+AVATAR_CACHE_RESCAN_MISSES = 16
+AVATAR_CACHE_DIR = os.environ.get('AVATAR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'family_tree_avatars'))
+AVATAR_SIZE = (100, 100)
+# Key of the placeholder drawn for members without a usable image
+DEFAULT_AVATAR_KEY = 'default'
+
+
+def avatar_key(source: Union[str, bytes], variant: str = 'lanczos') -> Optional[str]:
+    """
+    Content address of a profile image (base64 data URL or raw bytes) and
+    the way it is turned into a thumbnail. None without an image.
+    """
+    if not source:
+        return None
+    data = source.encode('utf-8') if isinstance(source, str) else bytes(source)
+    digest = hashlib.blake2b(data, digest_size=16, person=variant.encode('utf-8')[:16])
+    return f"{variant}-{digest.hexdigest()}"
+
+
+def thumbnail_png(image_data: bytes) -> bytes:
+    """Decode an image and resize it to an RGBA AVATAR_SIZE PNG."""
+    img = Image.open(BytesIO(image_data))
+    img = img.convert('RGBA')
+    img = img.resize(AVATAR_SIZE, Image.Resampling.LANCZOS)
+    output = BytesIO()
+    img.save(output, 'PNG')
+    return output.getvalue()
+
+
+def default_avatar_png() -> bytes:
+    """Grey head and shoulders icon on a transparent background."""
+    img = Image.new('RGBA', AVATAR_SIZE, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(img)
+    # Draw a circle for the head
+    draw.ellipse([25, 25, 75, 75], fill=(204, 204, 204, 255))
+    # Draw a path for the body
+    draw.polygon([(50, 70), (30, 100), (70, 100)], fill=(204, 204, 204, 255))
+    output = BytesIO()
+    img.save(output, 'PNG')
+    return output.getvalue()
+
+
+class AvatarThumbnailCache:
+    """
+    Avatar thumbnails on disk, keyed by the content hash of their source image.
+
+    Each image is decoded and resized once. Later renders get the
+    thumbnail hard-linked (or copied) into their own workspace, so evicting
+    a file never breaks a render that is still using it. max_bytes bounds
+    the directory as a whole, which all render processes of a host share:
+    hits refresh a file's mtime, and every AVATAR_CACHE_RESCAN_MISSES
+    misses the directory is re-read before evicting, so the least recently
+    used files of all processes go first.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = AVATAR_CACHE_DIR if directory is None else directory
+        self.max_bytes = AVATAR_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        # key -> (size in bytes, seconds it took to build)
+        self._entries = None
+        self._bytes = 0
+        self._misses_since_scan = 0
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'decodeSecondsSaved': 0.0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load_index(self):
+        """Thumbnails already on disk, read on first use."""
+        if self._entries is None:
+            self._scan()
+
+    def _scan(self):
+        """Thumbnails on disk, least recently used first, including other processes' writes."""
+        known = self._entries or {}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._misses_since_scan = 0
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.png'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    # Evicted by another process in between
+                    continue
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = (size, known.get(key, (0, 0.0))[1])
+            self._bytes += size
+
+    def thumbnail(self, key: str, build: Callable[[], bytes]) -> str:
+        """Path of the cached thumbnail of key, calling build() for its PNG bytes on a miss."""
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            entry = self._entries.get(key)
+            try:
+                # Other processes evict by mtime
+                os.utime(path)
+            except FileNotFoundError:
+                # Never built, or evicted by another process
+                if entry is not None:
+                    del self._entries[key]
+                    self._bytes -= entry[0]
+            else:
+                if entry is None:
+                    # Built by another process
+                    entry = (os.path.getsize(path), 0.0)
+                    self._entries[key] = entry
+                    self._bytes += entry[0]
+                self._entries.move_to_end(key)
+                self._metrics['hits'] += 1
+                self._metrics['decodeSecondsSaved'] += entry[1]
+                return path
+
+        start = time.perf_counter()
+        data = build()
+        seconds = time.perf_counter() - start
+
+        with self._lock:
+            # Write under a temporary name so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._bytes += len(data) - self._entries.pop(key, (0, 0.0))[0]
+            self._entries[key] = (len(data), seconds)
+            self._misses_since_scan += 1
+            if self._bytes > self.max_bytes or self._misses_since_scan >= AVATAR_CACHE_RESCAN_MISSES:
+                # The other render processes write to the same directory
+                self._scan()
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            self._metrics['misses'] += 1
+
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (size, _) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._metrics['evictions'] += 1
+                try:
+                    os.remove(self._path(evicted_key))
+                except OSError:
+                    pass
+        return path
+
+    def place(self, key: str, build: Callable[[], bytes], target_path: str) -> str:
+        """Put the thumbnail of key at target_path, building it only if it is not cached."""
+        path = self.thumbnail(key, build)
+        try:
+            os.link(path, target_path)
+        except FileNotFoundError:
+            # Evicted by a concurrent render in between
+            with open(target_path, 'wb') as f:
+                f.write(build())
+        except OSError:
+            shutil.copyfile(path, target_path)
+        return target_path
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters, evictions, disk use and decode time saved."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics['hits'] + metrics['misses']
+            metrics.update({
+                'decodeSecondsSaved': round(metrics['decodeSecondsSaved'], 3),
+                'entries': len(self._entries) if self._entries is not None else None,
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hitRate': round(metrics['hits'] / lookups, 4) if lookups else None,
+            })
+            return metrics
+
+
+# Process-wide thumbnail cache shared by the family, relatives and friends tree renderers
+avatar_cache = AvatarThumbnailCache()
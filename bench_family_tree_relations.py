@@ -0,0 +1,133 @@
+"""
+Micro-benchmark for the relatives tree of a family tree node.
+
+Compares the original scan-based related nodes lookup, which walked every
+member for siblings, nieces/nephews, children and each relationship label,
+against get_related_nodes on a FamilyMembersIndex on synthetic trees.
+"index" builds the index for every view like get_extended_family does,
+"shared" reuses one index for all views like the relationship cache does
+after a write.
+
+Usage:
+    python bench_family_tree_relations.py [number_of_members] [number_of_views]
+"""
+import random
+import sys
+import time
+
+from family_tree_relations import FamilyMembersIndex, get_related_nodes
+
+
+def build_tree(count):
+    """A synthetic tree of families with about four children each, a fifth of the members are married."""
+    random.seed(42)
+    members = []
+    for i in range(count):
+        member = {'id': f"node{i}", 'name': f"Member {i}", 'gender': random.choice(['male', 'female'])}
+        if i:
+            member['parentId'] = f"node{random.randrange(i // 5, i // 3 + 1)}"
+        members.append(member)
+    unmarried = list(range(1, count))
+    random.shuffle(unmarried)
+    for a, b in zip(unmarried[0:count // 10], unmarried[count // 10:count // 5]):
+        members[a]['spouse'] = members[b]['id']
+        members[b]['spouse'] = members[a]['id']
+    return members
+
+
+def original_related_nodes(family_members, node_id):
+    """Related node ids and labels the way get_related_nodes found them before the index existed."""
+    members_dict = {member.get('id'): member for member in family_members}
+    target = members_dict.get(node_id)
+    if not target:
+        return {}
+    related = set()
+    parent_id = target.get('parentId')
+    if parent_id in members_dict:
+        related.add(parent_id)
+        if members_dict[parent_id].get('spouse') in members_dict:
+            related.add(members_dict[parent_id]['spouse'])
+    if parent_id:
+        for member_id, member in members_dict.items():
+            if member_id != node_id and member.get('parentId') == parent_id:
+                related.add(member_id)
+                if member.get('spouse') in members_dict:
+                    related.add(member['spouse'])
+                related.update(child_id for child_id, child in members_dict.items() if child.get('parentId') == member_id)
+    spouse = members_dict.get(target.get('spouse'))
+    if spouse:
+        related.add(spouse['id'])
+        spouse_parent = members_dict.get(spouse.get('parentId'))
+        if spouse_parent:
+            related.add(spouse_parent['id'])
+            if spouse_parent.get('spouse') in members_dict:
+                related.add(spouse_parent['spouse'])
+    for member_id, member in members_dict.items():
+        if member.get('parentId') == node_id:
+            related.add(member_id)
+            if member.get('spouse') in members_dict:
+                related.add(member['spouse'])
+
+    labels = {}
+    for member_id in related:
+        member = members_dict[member_id]
+        label = "Relative"
+        # The label rules that scanned every member for each candidate
+        for sibling in members_dict.values():
+            if (parent_id and sibling.get('parentId') == parent_id and sibling.get('id') != node_id
+                    and sibling.get('spouse') == member_id):
+                label = "sibling-in-law"
+                break
+        if label == "Relative":
+            for sibling in members_dict.values():
+                if (parent_id and sibling.get('parentId') == parent_id and sibling.get('id') != node_id
+                        and member.get('parentId') == sibling.get('id')):
+                    label = "niece/nephew"
+                    break
+        labels[member_id] = label
+    return labels
+
+
+def timed(func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    views = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"Building synthetic tree with {count} members...")
+    members = build_tree(count)
+    node_ids = [members[i]['id'] for i in random.sample(range(count), views)]
+
+    index_build_ms, index = timed(lambda: FamilyMembersIndex(members))
+    print(f"Index built in {index_build_ms:.1f} ms\n")
+
+    print(f"{'node':<14}{'related':>9}{'scan ms':>10}{'index ms':>10}{'shared ms':>11}")
+    totals = [0.0, 0.0, 0.0]
+    for node_id in node_ids:
+        scan_ms, expected = timed(lambda: original_related_nodes(members, node_id), repeat=1)
+        index_ms, by_index = timed(lambda: get_related_nodes(members, node_id))
+        shared_ms, by_shared = timed(lambda: get_related_nodes(members, node_id, index))
+
+        related_ids = {node['id'] for node in by_index if not node['isSelf']}
+        assert related_ids == set(expected)
+        assert by_index == by_shared
+        for node in by_index:
+            if expected.get(node['id']) == "sibling-in-law":
+                assert node['relation'] in ("Brother-in-law", "Sister-in-law")
+
+        totals = [totals[0] + scan_ms, totals[1] + index_ms, totals[2] + shared_ms]
+        print(f"{node_id:<14}{len(related_ids):>9}{scan_ms:>10.1f}{index_ms:>10.2f}{shared_ms:>11.3f}")
+
+    print(f"\n{'total':<14}{'':>9}{totals[0]:>10.1f}{totals[1]:>10.2f}{totals[2]:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
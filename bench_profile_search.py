@@ -0,0 +1,135 @@
+"""
+Micro-benchmark for profile search scoring.
+
+Compares the original per-profile Python loop against the n-gram candidate
+index and the vectorized NumPy column snapshot on a synthetic user base.
+The "page" columns time what /api/search-profiles does for one page of
+PAGE_SIZE results: full scoring plus top-k selection. The last lines time
+bringing the column snapshot up to date after profile writes, which
+happens on the first search following them.
+
+Usage:
+    python bench_profile_search.py [number_of_profiles]
+"""
+import heapq
+import random
+import string
+import sys
+import time
+
+from profile_search_index import ProfileSearchIndex, score_profile, normalize_name
+
+FIRST_NAMES = ['venkateswara', 'srinivas', 'lakshmi', 'ramesh', 'suresh', 'padma', 'sita', 'ravi',
+               'krishna', 'anjali', 'murali', 'bhavani', 'nagarjuna', 'sravani', 'prasad', 'divya']
+LAST_NAMES = ['megadula', 'reddy', 'naidu', 'rao', 'chowdary', 'varma', 'sharma', 'goud',
+              'raju', 'kumar', 'yadav', 'setty', 'pillai', 'iyer', 'nair', 'das']
+
+QUERIES = [
+    {'last_name': 'rao'},
+    {'first_name': 'sri', 'last_name': 'reddy'},
+    {'first_name': 'lakshmi'},
+    {'first_name': 'laxmi', 'last_name': 'reddi'},
+    {'email': 'gmail'},
+    {'phone': '9032038890'},
+    {'first_name': 'ven', 'last_name': 'meg', 'phone': '9000000001'},
+]
+
+PAGE_SIZE = 50
+
+
+def build_index(count):
+    random.seed(42)
+    index = ProfileSearchIndex()
+    for i in range(count):
+        first = random.choice(FIRST_NAMES) + random.choice(['', 'a', 'u', ' rao', ' kumar'])
+        last = random.choice(LAST_NAMES)
+        suffix = ''.join(random.choice(string.ascii_lowercase) for _ in range(4))
+        index.upsert(f"{first.replace(' ', '')}.{last}{suffix}{i}@{random.choice(['gmail.com', 'yahoo.in'])}", {
+            'firstName': first.title(),
+            'lastName': last.title(),
+            'phone': f"+91 9{random.randint(0, 999999999):09d}",
+            'GENDER': random.choice(['male', 'female']),
+        })
+    index.loaded = True
+    return index
+
+
+def original_loop(index, first_name, last_name, email, phone):
+    """The scoring loop search_profiles_by_info used before the index existed (no fuzzy or phonetic matching)."""
+    scored = []
+    for profile_id in sorted(index.records):
+        score, _ = score_profile(index.records[profile_id], first_name, last_name, email, phone)
+        if score > 0:
+            scored.append((profile_id, score))
+    return scored
+
+
+def timed(func, repeat=5):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"Building synthetic index with {count} profiles...")
+    index = build_index(count)
+
+    start = time.perf_counter()
+    index.columns()
+    print(f"Column snapshot built in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    print(f"{'query':<55}{'matches':>9}{'loop ms':>10}{'index ms':>10}{'numpy ms':>10}"
+          f"{'idx page':>10}{'np page':>10}")
+    for query in QUERIES:
+        criteria = {
+            'first_name': normalize_name(query.get('first_name')),
+            'last_name': normalize_name(query.get('last_name')),
+            'email': normalize_name(query.get('email')),
+            'phone': ''.join(filter(str.isdigit, query.get('phone', ''))),
+        }
+        loop_ms, expected = timed(lambda: original_loop(index, **criteria), repeat=2)
+        index_ms, by_index = timed(lambda: index.search(backend='index', **criteria))
+        numpy_ms, by_numpy = timed(lambda: index.search(backend='numpy', **criteria))
+
+        index_page_ms, index_page = timed(lambda: heapq.nsmallest(
+            PAGE_SIZE, index.search(backend='index', **criteria),
+            key=lambda m: (-m['matchScore'], m['documentId'])))
+        numpy_page_ms, (numpy_page, _) = timed(lambda: index.search_page_vectorized(limit=PAGE_SIZE, **criteria))
+
+        # Both index paths add fuzzy and phonetic name matches on top of the original rules
+        assert by_index == by_numpy
+        assert index_page == numpy_page
+        assert {(m['documentId'], m['matchScore']) for m in by_index
+                if not {'fuzzy', 'phonetic'} & set(m['matchReasons'])} == set(expected)
+
+        print(f"{str(query):<55}{len(by_index):>9}{loop_ms:>10.1f}{index_ms:>10.1f}{numpy_ms:>10.1f}"
+              f"{index_page_ms:>10.1f}{numpy_page_ms:>10.1f}")
+
+    print()
+    profile_ids = index.all_ids()
+    writes = [
+        ('1 profile updated', lambda i: index.upsert(profile_ids[i], {'phone': f"+91 8{i:09d}"})),
+        ('100 profiles updated', lambda i: [index.upsert(profile_ids[i * 100 + j], {'lastName': 'Reddi'})
+                                            for j in range(100)]),
+        ('1 profile added', lambda i: index.upsert(f"new.profile{i}@gmail.com", {'firstName': 'Laxmi'})),
+        ('1 profile removed', lambda i: index.remove(profile_ids[-1 - i])),
+    ]
+    for name, write in writes:
+        best = None
+        for i in range(5):
+            write(i)
+            start = time.perf_counter()
+            index.columns()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"Column snapshot refreshed after {name} in {best:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
-from typing import List, Dict, Optional, Union, Any
+from typing import List, Dict, Optional, Union, Any, Iterable
 from dataclasses import dataclass
-from copy import deepcopy
+from collections import defaultdict
+from family_tree_model import CompactFamilyTree
 
 @dataclass
 class FamilyMember:
@@ -14,6 +15,59 @@ class FamilyMember:
     generation: Optional[int] = None
     relation: Optional[str] = None
 
+class FamilyTreeIndex:
+    """
+    Adjacency index compiled once per labeling call.
+
+    Replaces the scans over family_data / family_map that every sibling,
+    child, cousin and in-law lookup used to do with dictionary lookups:
+    parent -> children, spouse -> persons married to them, and the
+    family_map position of every id so results keep their original order.
+    The lookups are read off the columns of a CompactFamilyTree, which
+    callers can pass in to share it.
+    """
+
+    def __init__(self, family_data: List[Dict[str, Any]], family_map: Dict[str, Dict[str, Any]],
+                 model: Optional[CompactFamilyTree] = None):
+        self.family_map = family_map
+        self.model = model if model is not None else CompactFamilyTree(family_data, keep_images=False)
+        self.position = {person_id: i for i, person_id in enumerate(self.model.position)}
+
+        # Over every entry of family_data, like the list comprehensions in compute_all_relations
+        self.children = self.model.children_by_parent_key()
+        self.married_to = self.model.married_to()
+
+        # Over the entries family_map keeps, like the scan in get_siblings
+        self.map_children = self.model.children_by_parent_key(self.model.last_nodes())
+
+    def children_of(self, parent_ids: Iterable[Any]) -> List[str]:
+        """Ids of family_data persons whose parentId is one of parent_ids."""
+        result = []
+        for parent_id in dict.fromkeys(parent_ids):
+            result.extend(self.children.get(parent_id, ()))
+        return result
+
+    def spouses_of(self, person_ids: Iterable[Any]) -> List[str]:
+        """Ids of family_data persons whose spouse is one of person_ids."""
+        result = []
+        for person_id in dict.fromkeys(person_ids):
+            result.extend(self.married_to.get(person_id, ()))
+        return result
+
+    def siblings_of(self, person: Dict[str, Any]) -> List[str]:
+        """get_siblings() in family_map order, without scanning the map."""
+        parents = get_parents(person, self.family_map)
+        siblings = []
+        for parent_id in dict.fromkeys(parents):
+            siblings.extend(
+                sibling_id for sibling_id in self.map_children.get(parent_id, ())
+                if sibling_id != person['id']
+            )
+        if len(parents) > 1:
+            siblings.sort(key=self.position.__getitem__)
+        return siblings
+
+
 def build_family_relationships(family_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Build family relationships for all members in the family data.
@@ -24,6 +78,27 @@ def build_family_relationships(family_data: List[Dict[str, Any]]) -> List[Dict[s
     Returns:
         List[Dict[str, Any]]: List of family members with their relationships set
     """
+    return label_family_members(family_data, compute_relationship_labels(family_data))
+
+def _spouse_as_self(family_data: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The spouse node when self has a spouse but no parents, else None."""
+    self_node = next((person for person in family_data if person.get('isSelf')), None)
+    if not self_node:
+        raise ValueError("Self node not found")
+    if self_node.get('spouse') and not self_node.get('parentId'):
+        return next((person for person in reversed(family_data) if person['id'] == self_node['spouse']), None)
+    return None
+
+def compute_relationship_labels(family_data: List[Dict[str, Any]]) -> List[str]:
+    """
+    Relation of every member to the self node, without copying any member.
+
+    Args:
+        family_data (List[Dict[str, Any]]): List of family member dictionaries
+        
+    Returns:
+        List[str]: The relation of each entry of family_data, in the same order
+    """
     # Find self node
     self_node = next((person for person in family_data if person.get('isSelf')), None)
     if not self_node:
@@ -32,67 +107,80 @@ def build_family_relationships(family_data: List[Dict[str, Any]]) -> List[Dict[s
     # Create family map
     family_map = {person['id']: person for person in family_data}
 
-    # Handle case where self has spouse but no parents
+    # Handle case where self has spouse but no parents: label from the spouse's side
     if self_node.get('spouse') and not self_node.get('parentId'):
         spouse_node = family_map.get(self_node['spouse'])
         if spouse_node:
-            # Temporarily make spouse the "self" node
-            temp_family_data = []
-            for p in family_data:
-                if p['id'] == self_node['id']:
-                    temp_person = deepcopy(p)
-                    temp_person['isSelf'] = False
-                    temp_family_data.append(temp_person)
-                elif p['id'] == spouse_node['id']:
-                    temp_person = deepcopy(p)
-                    temp_person['isSelf'] = True
-                    temp_family_data.append(temp_person)
-                else:
-                    temp_family_data.append(deepcopy(p))
-
-            # Build spouse's family tree with spouse as "self"
-            spouse_tree = build_family_relations_with_spouse(temp_family_data)
-            
-            # Convert relationships and restore original self status
-            result = []
-            for person in spouse_tree:
+            # The viewpoint is the first member that would be flagged isSelf
+            # with self unflagged and the spouse flagged instead
+            viewpoint = next((
+                person for person in family_data
+                if person['id'] != self_node['id'] and (person['id'] == spouse_node['id'] or person.get('isSelf'))
+            ), None)
+            if not viewpoint:
+                raise ValueError("Self node not found in spouse processing")
+            spouse_labels = relationship_labels_from(viewpoint, family_data, family_map)
+
+            # Post-pass: restore self and turn the spouse's family into in-laws
+            labels = []
+            for person, relation in zip(family_data, spouse_labels):
                 if person['id'] == self_node['id']:
-                    result.append({
-                        **person,
-                        'isSelf': True,
-                        'relation': 'MySelf'
-                    })
+                    labels.append('MySelf')
                 elif person['id'] == spouse_node['id']:
-                    result.append({
-                        **person,
-                        'isSelf': False,
-                        'relation': genderize('husband', 'wife', person)
-                    })
+                    labels.append(genderize('husband', 'wife', person))
                 # Only convert parents and their generation to in-laws
                 # This preserves spouse's children as direct relations without in-law suffix
                 elif (person.get('generation') is not None and 
                       spouse_node.get('generation') is not None and
                       (person['generation'] == spouse_node['generation'] or 
                        person['generation'] == spouse_node['generation'] + 1)):
-                    result.append({
-                        **person,
-                        'relation': convert_to_in_law_relation(person.get('relation', ''), person)
-                    })
+                    labels.append(convert_to_in_law_relation(relation, person))
                 else:
-                    result.append(person)
-            return result
+                    labels.append(relation)
+            return labels
 
     # Regular case: compute all relations
-    relations = compute_all_relations(self_node, family_data, family_map)
+    return relationship_labels_from(self_node, family_data, family_map)
 
-    # Build final result with relationships
-    result = []
-    for person in family_data:
-        result.append({
-            **person,
-            'relation': get_relationship(self_node, person, relations, family_map)
-        })
+def relationship_labels_from(
+    viewpoint: Dict[str, Any],
+    family_data: List[Dict[str, Any]],
+    family_map: Optional[Dict[str, Dict[str, Any]]] = None,
+    index: Optional[FamilyTreeIndex] = None
+) -> List[str]:
+    """
+    Relation of every member as seen from the viewpoint node.
 
+    The viewpoint does not have to be the member flagged isSelf, so the
+    tree can be labelled from any node without copying members to move
+    the flag.
+    """
+    if family_map is None:
+        family_map = {person['id']: person for person in family_data}
+    if index is None:
+        index = FamilyTreeIndex(family_data, family_map)
+    relations = compute_all_relations(viewpoint, family_data, family_map, index)
+    return [get_relationship(viewpoint, person, relations, family_map) for person in family_data]
+
+def label_family_members(family_data: List[Dict[str, Any]], labels: List[str]) -> List[Dict[str, Any]]:
+    """
+    Attach labels from compute_relationship_labels to copies of the members.
+    When the labels were computed from the spouse's side, self is flagged
+    isSelf and the spouse is not.
+    """
+    spouse_node = _spouse_as_self(family_data)
+    if spouse_node is None:
+        return [{**person, 'relation': label} for person, label in zip(family_data, labels)]
+
+    self_id = next(person for person in family_data if person.get('isSelf'))['id']
+    result = []
+    for person, label in zip(family_data, labels):
+        if person['id'] == self_id:
+            result.append({**person, 'isSelf': True, 'relation': label})
+        elif person['id'] == spouse_node['id']:
+            result.append({**person, 'isSelf': False, 'relation': label})
+        else:
+            result.append({**person, 'relation': label})
     return result
 
 def build_family_relations_with_spouse(family_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -101,13 +189,8 @@ def build_family_relations_with_spouse(family_data: List[Dict[str, Any]]) -> Lis
     if not self_node:
         raise ValueError("Self node not found in spouse processing")
 
-    family_map = {person['id']: person for person in family_data}
-    relations = compute_all_relations(self_node, family_data, family_map)
-
-    return [
-        {**person, 'relation': get_relationship(self_node, person, relations, family_map)}
-        for person in family_data
-    ]
+    labels = relationship_labels_from(self_node, family_data)
+    return [{**person, 'relation': label} for person, label in zip(family_data, labels)]
 
 def convert_to_in_law_relation(relation: str, person: Dict[str, Any]) -> str:
     """Convert a relation to its in-law equivalent."""
@@ -138,19 +221,29 @@ def convert_to_in_law_relation(relation: str, person: Dict[str, Any]) -> str:
 def compute_all_relations(
     self_node: Dict[str, Any],
     family_data: List[Dict[str, Any]],
-    family_map: Dict[str, Dict[str, Any]]
+    family_map: Dict[str, Dict[str, Any]],
+    index: Optional[FamilyTreeIndex] = None
 ) -> Dict[str, Any]:
-    """Compute all possible relationships for the family tree."""
+    """
+    Compute all possible relationships for the family tree.
+
+    Every lookup goes through a FamilyTreeIndex, so the whole call is linear
+    in the tree size. Relation groups are returned as sets for O(1)
+    membership checks in get_relationship.
+    """
+    if index is None:
+        index = FamilyTreeIndex(family_data, family_map)
+
     spouse = family_map.get(self_node.get('spouse'))
     father = family_map.get(self_node.get('parentId'))
     mother = father.get('spouse') and family_map.get(father.get('spouse')) if father else None
 
     # Get father's siblings with gender info
-    father_siblings = get_father_siblings_with_gender(father, family_map, family_data) if father else []
+    father_siblings = get_father_siblings_with_gender(father, family_map, family_data, index) if father else []
 
     # Get spouse's family
     spouse_parents = get_parents(spouse, family_map) if spouse else []
-    spouse_siblings = get_siblings(spouse, family_map) if spouse else []
+    spouse_siblings = get_siblings(spouse, family_map, index) if spouse else []
 
     # Get spouse's extended family
     spouse_father = family_map.get(spouse.get('parentId')) if spouse else None
@@ -158,31 +251,27 @@ def compute_all_relations(
 
     spouse_uncles_aunts = []
     if spouse_father:
-        spouse_uncles_aunts.extend(get_siblings(spouse_father, family_map))
+        spouse_uncles_aunts.extend(get_siblings(spouse_father, family_map, index))
     if spouse_mother:
-        spouse_uncles_aunts.extend(get_siblings(spouse_mother, family_map))
+        spouse_uncles_aunts.extend(get_siblings(spouse_mother, family_map, index))
 
-    # Get siblings
+    # Get siblings: same parentId as self (even when both have none) or the mother as parent
+    sibling_parent_ids = [self_node.get('parentId')] + ([mother['id']] if mother else [])
     siblings = [
-        person['id'] for person in family_data
-        if person['id'] != self_node['id'] and
-        (person.get('parentId') == self_node.get('parentId') or
-         (mother and person.get('parentId') == mother['id']))
+        person_id for person_id in index.children_of(sibling_parent_ids)
+        if person_id != self_node['id']
     ]
 
     # Get children
     possible_parent_ids = [p_id for p_id in [self_node['id'], spouse and spouse['id']] if p_id]
-    children = [
-        person['id'] for person in family_data
-        if person.get('parentId') in possible_parent_ids
-    ]
+    children = index.children_of(possible_parent_ids)
 
     # Get uncles and aunts
     uncles_aunts = []
     if father:
-        uncles_aunts.extend(get_siblings(father, family_map))
+        uncles_aunts.extend(get_siblings(father, family_map, index))
     if mother:
-        uncles_aunts.extend(get_siblings(mother, family_map))
+        uncles_aunts.extend(get_siblings(mother, family_map, index))
 
     # Get nieces and nephews
     nieces_nephews = []
@@ -190,10 +279,7 @@ def compute_all_relations(
         sib = family_map.get(sib_id)
         if sib:
             possible_sib_parent_ids = [p_id for p_id in [sib_id, sib.get('spouse')] if p_id]
-            nieces_nephews.extend([
-                person['id'] for person in family_data
-                if person.get('parentId') in possible_sib_parent_ids
-            ])
+            nieces_nephews.extend(index.children_of(possible_sib_parent_ids))
 
     # Get cousins
     cousins = []
@@ -201,50 +287,48 @@ def compute_all_relations(
         ua = family_map.get(ua_id)
         if ua:
             possible_ua_parent_ids = [p_id for p_id in [ua_id, ua.get('spouse')] if p_id]
-            cousins.extend([
-                person['id'] for person in family_data
-                if person.get('parentId') in possible_ua_parent_ids
-            ])
+            cousins.extend(index.children_of(possible_ua_parent_ids))
+
+    # First father's sibling per id / per spouse, as the linear searches used to find
+    father_sibling_by_id = {}
+    father_sibling_by_spouse = {}
+    for fs in father_siblings:
+        father_sibling_by_id.setdefault(fs['id'], fs)
+        father_sibling_by_spouse.setdefault(fs['spouse'], fs)
 
     return {
         'spouse': spouse['id'] if spouse else None,
-        'parents': [p for p in [father and father['id'], mother and mother['id']] if p],
-        'children': children,
-        'siblings': siblings,
-        'uncles_aunts': uncles_aunts,
-        'nieces_nephews': nieces_nephews,
-        'spouse_siblings': spouse_siblings,
-        'spouse_uncles_aunts': spouse_uncles_aunts,
-        'cousins': cousins,
+        'parents': {p for p in [father and father['id'], mother and mother['id']] if p},
+        'children': set(children),
+        'siblings': set(siblings),
+        'uncles_aunts': set(uncles_aunts),
+        'nieces_nephews': set(nieces_nephews),
+        'spouse_siblings': set(spouse_siblings),
+        'spouse_uncles_aunts': set(spouse_uncles_aunts),
+        'cousins': set(cousins),
         'father_siblings': father_siblings,
+        'father_sibling_by_id': father_sibling_by_id,
+        'father_sibling_by_spouse': father_sibling_by_spouse,
         'has_no_parents': not self_node.get('parentId'),
         'in_laws': {
-            'spouse_parents': spouse_parents,
-            'sibling_spouses': [
-                person['id'] for person in family_data
-                if person.get('spouse') and person['spouse'] in siblings
-            ],
-            'spouse_sibling_spouses': [
-                person['id'] for person in family_data
-                if person.get('spouse') and person['spouse'] in spouse_siblings
-            ],
-            'children_spouses': [
-                person['id'] for person in family_data
-                if person.get('spouse') and person['spouse'] in children
-            ]
+            'spouse_parents': set(spouse_parents),
+            'sibling_spouses': set(index.spouses_of(siblings)),
+            'spouse_sibling_spouses': set(index.spouses_of(spouse_siblings)),
+            'children_spouses': set(index.spouses_of(children))
         }
     }
 
 def get_father_siblings_with_gender(
     father: Optional[Dict[str, Any]],
     family_map: Dict[str, Dict[str, Any]],
-    family_data: List[Dict[str, Any]]
+    family_data: List[Dict[str, Any]],
+    index: Optional[FamilyTreeIndex] = None
 ) -> List[Dict[str, Any]]:
     """Get father's siblings with their gender information."""
     if not father:
         return []
 
-    father_siblings = get_siblings(father, family_map)
+    father_siblings = get_siblings(father, family_map, index)
     return [
         {
             'id': sib_id,
@@ -307,7 +391,7 @@ def get_relationship(
         return genderize('brother-in-law', 'sister-in-law', person)
 
     # Check if person is one of father's siblings
-    father_sibling = next((fs for fs in relations['father_siblings'] if fs['id'] == person['id']), None)
+    father_sibling = relations['father_sibling_by_id'].get(person['id'])
     if father_sibling:
         # If father's sibling is female, call her "mother"
         if father_sibling.get('gender') == 'female':
@@ -316,14 +400,8 @@ def get_relationship(
             return 'father'
 
     # Check if person is spouse of father's sibling
-    is_spouse_of_father_sibling = any(
-        fs['spouse'] == person['id'] for fs in relations['father_siblings']
-    )
-    if is_spouse_of_father_sibling:
-        # Get the related sibling
-        related_sibling = next(
-            fs for fs in relations['father_siblings'] if fs['spouse'] == person['id']
-        )
+    related_sibling = relations['father_sibling_by_spouse'].get(person['id'])
+    if related_sibling is not None:
         if related_sibling.get('gender') == 'female':
             return 'father'  # Husband of father's sister is "father"
         else:
@@ -391,11 +469,14 @@ def get_parents(
 
 def get_siblings(
     person: Optional[Dict[str, Any]],
-    family_map: Dict[str, Dict[str, Any]]
+    family_map: Dict[str, Dict[str, Any]],
+    index: Optional[FamilyTreeIndex] = None
 ) -> List[str]:
     """Get all siblings of a person."""
     if not person or not person.get('parentId'):
         return []
+    if index is not None:
+        return index.siblings_of(person)
     
     parents = get_parents(person, family_map)
     return [
@@ -2,6 +2,8 @@ import uuid
 from datetime import datetime
 import logging
 import requests
+from family_tree_email_index import index_family_tree_members
+from family_generations import propagate_generations
 
 logger = logging.getLogger(__name__)
 
@@ -64,6 +66,7 @@ def add_child_to_family_tree(
             'familyMembers': family_members,
             'updatedAt': datetime.now().isoformat()
         })
+        index_family_tree_members(family_tree_id, family_members)
         
         # # If the child has an email, update their profile with the family tree ID
         # child_email = child_data.get('email')
@@ -174,6 +177,7 @@ def create_family_tree_with_father_child(
             'createdAt': datetime.now().isoformat(),
             'updatedAt': datetime.now().isoformat()
         })
+        index_family_tree_members(new_family_tree_id, family_members)
         
         # Update father's profile with family tree ID
         user_profiles_ref.document(father_email).set({
@@ -351,6 +355,7 @@ def add_child_with_subtree(
                 'familyMembers': father_family_members,
                 'updatedAt': datetime.now().isoformat()
             })
+            index_family_tree_members(father_family_tree_id, father_family_members)
             logger.info("Updated father's family tree")
             
             # Update child's profile with father's family tree ID
@@ -530,18 +535,19 @@ def add_child_with_subtree(
                 child_family_members.append(child_node)
                 logger.info("Added new child node to child's family tree")
             
-            # Function to recursively collect child's descendants and adjust generations
-            def collect_descendants(member_id, members_dict, generation_adjustment):
+            # Function to recursively collect child's descendants
+            def collect_descendants(member_id, members_dict, children_by_parent):
                 """
                 Recursively collect all descendants of a member including spouse, children, and their descendants.
+                Generations are recomputed once the whole subtree is collected.
                 
                 Args:
                     member_id: ID of the member to collect descendants for
                     members_dict: Dictionary of all family members keyed by ID
-                    generation_adjustment: Value to adjust generations by
+                    children_by_parent: IDs of each member's children along parentId
                     
                 Returns:
-                    List of descendant members with adjusted generations
+                    List of descendant members
                 """
                 logger.info(f"Collecting descendants for member_id: {member_id}")
                 descendants = []
@@ -559,11 +565,6 @@ def add_child_with_subtree(
                     logger.info(f"Found spouse {spouse_id} through direct reference")
                     spouse = members_dict[spouse_id]
                     spouse = spouse.copy()  # Create copy to avoid modifying original
-                    
-                    # Set spouse generation same as member
-                    if 'generation' in member:
-                        spouse['generation'] = member['generation']
-                    
                     descendants.append(spouse)
                 else:
                     # Try to find spouse through alternative means - same generation and opposite gender
@@ -588,7 +589,7 @@ def add_child_with_subtree(
                             
                             logger.info(f"Found implicit spouse {potential_id} with opposite gender and same generation")
                             spouse = potential_spouse.copy()  # Create a copy
-                            spouse['generation'] = member['generation']  # Ensure same generation
+                            implicit_spouses.append((spouse, member_id))
                             descendants.append(spouse)
                             break
                 
@@ -596,8 +597,7 @@ def add_child_with_subtree(
                 children = []
                 
                 # Method 1: Using parentId field
-                direct_children = [m.copy() for m in members_dict.values() 
-                                 if m.get('parentId') == member_id]
+                direct_children = [members_dict[child_id].copy() for child_id in children_by_parent.get(member_id, [])]
                 
                 if direct_children:
                     logger.info(f"Found {len(direct_children)} children using parentId reference")
@@ -632,21 +632,11 @@ def add_child_with_subtree(
                 
                 logger.info(f"Found total of {len(children)} children for member {member_id}")
                 
-                # Adjust generations for children
                 for child in children:
-                    # Adjust generation
-                    if 'generation' in child:
-                        original_gen = child['generation']
-                        child['generation'] = child['generation'] + generation_adjustment
-                        logger.info(f"Adjusted child {child.get('id')} generation from {original_gen} to {child['generation']}")
-                    else:
-                        # If generation doesn't exist, set it based on parent - 1
-                        child['generation'] = member['generation'] - 1
-                    
                     descendants.append(child)
                     
                     # Recursively process this child's descendants
-                    child_descendants = collect_descendants(child.get('id'), members_dict, generation_adjustment)
+                    child_descendants = collect_descendants(child.get('id'), members_dict, children_by_parent)
                     if child_descendants:
                         logger.info(f"Adding {len(child_descendants)} descendants from child {child.get('id')}")
                         descendants.extend(child_descendants)
@@ -655,6 +645,11 @@ def add_child_with_subtree(
             
             # Create a dictionary of child's family members for easy lookup
             child_members_dict = {member.get('id'): member for member in child_family_members if member.get('id')}
+            children_by_parent = {}
+            for member_id, member in child_members_dict.items():
+                children_by_parent.setdefault(member.get('parentId'), []).append(member_id)
+            # Spouses found without a spouse link, aligned with their partner after the generation update
+            implicit_spouses = []
             
             # Log child members dict for debugging
             logger.info(f"Created members dictionary with {len(child_members_dict)} entries")
@@ -669,7 +664,7 @@ def add_child_with_subtree(
             subtree_to_merge = [child_node]
             if child_node_id and child_node_id in child_members_dict:
                 logger.info(f"Starting collection of descendants for child node: {child_node_id}")
-                descendants = collect_descendants(child_node_id, child_members_dict, generation_diff)
+                descendants = collect_descendants(child_node_id, child_members_dict, children_by_parent)
                 
                 #get all the emil from decendants where userprofile exitts true and add to a list
                 email_list = []
@@ -691,6 +686,16 @@ def add_child_with_subtree(
             else:
                 logger.warning(f"Child node ID ({child_node_id}) not found in members dictionary, cannot collect descendants")
             
+            # Recompute generations of the subtree below the father
+            generations_updated = propagate_generations(subtree_to_merge, child_node_id, child_generation)
+            members_by_id = {member.get('id'): member for member in subtree_to_merge}
+            for spouse, partner_id in implicit_spouses:
+                partner_generation = members_by_id.get(partner_id, {}).get('generation')
+                if partner_generation is not None and spouse.get('generation') != partner_generation:
+                    spouse['generation'] = partner_generation
+                    generations_updated += 1
+            logger.info(f"Updated generation of {generations_updated} subtree members")
+            
             # Add only the child's subtree to the father's family tree
             updated_family_members = father_family_members.copy()
             for member in subtree_to_merge:
@@ -737,6 +742,7 @@ def add_child_with_subtree(
                 'relatives': updated_relatives,
                 'updatedAt': datetime.now().isoformat()
             })
+            index_family_tree_members(father_family_tree_id, updated_family_members)
             logger.info("Updated father's family tree with merged data")
             
             # Update family tree ID for all members with profiles in the subtree
@@ -765,6 +771,7 @@ def add_child_with_subtree(
                 "childGeneration": child_generation,
                 "fatherGeneration": father_generation,
                 "generationOffset": generation_diff,
+                "generationsUpdated": generations_updated,
                 "membersUpdated": members_updated
             }
     
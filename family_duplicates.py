@@ -0,0 +1,240 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Any
+
+from family_tree_email_index import add_family_members_listener
+from phonetic_keys import member_blocking_key
+from profile_search_index import trigram_similarity, normalize_email, normalize_phone
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Name similarity a same-block pair of family tree members needs before it
+# is reported as a likely duplicate
+DUPLICATE_NAME_SIMILARITY = 0.5
+
+# Seconds before the cached blocking keys are reloaded from Firestore, which
+# picks up trees written by other app instances
+DUPLICATE_BLOCKS_MAX_AGE = float(os.environ.get('DUPLICATE_BLOCKS_MAX_AGE', '3600'))
+
+# Member fields the duplicate evidence reads, all the block index keeps
+DUPLICATE_MEMBER_FIELDS = ('id', 'name', 'gender', 'email', 'phone')
+
+BlockEntry = Tuple[str, Any, Dict[str, Any]]
+
+
+def _duplicate_evidence(first: Dict[str, Any], second: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Compare two members from the same block.
+
+    Returns:
+        dict: {"similarity", "reasons"} if the pair looks like the same person, else None
+    """
+    first_gender = (first.get('gender') or '').lower()
+    second_gender = (second.get('gender') or '').lower()
+    if first_gender and second_gender and first_gender != second_gender:
+        return None
+
+    reasons = ["phonetic_name"]
+    first_email, second_email = normalize_email(first.get('email')), normalize_email(second.get('email'))
+    if first_email and second_email:
+        if first_email != second_email:
+            return None
+        reasons.append("email")
+
+    first_phone, second_phone = normalize_phone(first.get('phone')), normalize_phone(second.get('phone'))
+    if first_phone and second_phone and first_phone[-10:] == second_phone[-10:]:
+        reasons.append("phone")
+
+    similarity = trigram_similarity(first.get('name'), second.get('name'))
+    if similarity < DUPLICATE_NAME_SIMILARITY and len(reasons) == 1:
+        return None
+    return {"similarity": round(similarity, 3), "reasons": reasons}
+
+
+def find_duplicate_members(trees: Dict[str, List[Dict[str, Any]]],
+                           family_tree_id: Optional[str] = None,
+                           max_block_size: int = 200) -> List[Dict[str, Any]]:
+    """
+    Find likely duplicate people across family trees.
+
+    Members are grouped by member_blocking_key, and only pairs inside a block
+    that belong to different family trees are compared, so the work is
+    proportional to the block sizes instead of all member pairs.
+
+    Args:
+        trees: {familyTreeId: familyMembers list} of the trees to compare
+        family_tree_id: If given, only report pairs involving this tree
+        max_block_size: Blocks larger than this (very common names) are skipped
+
+    Returns:
+        list: Candidate pairs, best evidence first
+    """
+    blocks = defaultdict(list)
+    for tree_id, members in trees.items():
+        for member in members or []:
+            if not isinstance(member, dict):
+                continue
+            node_id = member.get('id')
+            key = member_blocking_key(member)
+            if key:
+                blocks[key].append((tree_id, node_id, member))
+
+    duplicates = []
+    for key, entries in blocks.items():
+        duplicates.extend(_block_duplicates(key, entries, family_tree_id, max_block_size))
+    return _rank_duplicates(duplicates)
+
+
+def _block_duplicates(key: str, entries: List[BlockEntry], family_tree_id: Optional[str],
+                      max_block_size: int) -> List[Dict[str, Any]]:
+    """Compare the (familyTreeId, nodeId, member) entries of one block, pairs from different trees only."""
+    if len(entries) < 2:
+        return []
+    if len(entries) > max_block_size:
+        logger.info(f"Skipping duplicate block {key} with {len(entries)} members")
+        return []
+
+    duplicates = []
+    for i in range(len(entries)):
+        first_tree, first_id, first_member = entries[i]
+        for j in range(i + 1, len(entries)):
+            second_tree, second_id, second_member = entries[j]
+            if first_tree == second_tree:
+                continue
+            if family_tree_id and family_tree_id not in (first_tree, second_tree):
+                continue
+            evidence = _duplicate_evidence(first_member, second_member)
+            if not evidence:
+                continue
+            duplicates.append({
+                "blockingKey": key,
+                "first": {"familyTreeId": first_tree, "nodeId": first_id, "name": first_member.get('name')},
+                "second": {"familyTreeId": second_tree, "nodeId": second_id, "name": second_member.get('name')},
+                **evidence
+            })
+    return duplicates
+
+
+def _rank_duplicates(duplicates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    duplicates.sort(key=lambda pair: (-len(pair['reasons']), -pair['similarity'],
+                                      pair['first']['familyTreeId'], pair['first']['nodeId']))
+    return duplicates
+
+
+class DuplicateBlockIndex:
+    """
+    Blocking keys of every family tree member, kept in memory.
+
+    Loaded with one stream of family_tree on first use, then kept up to
+    date by the familyMembers write hook (add_family_members_listener) and
+    reloaded once older than max_age, so a duplicate search reads no
+    trees at all. Only DUPLICATE_MEMBER_FIELDS are kept, never profile
+    images. A block's entries are ordered by familyTreeId and then by
+    position in familyMembers, the order streaming the collection gives,
+    so results match find_duplicate_members over the whole collection.
+    """
+
+    def __init__(self, max_age: Optional[float] = None):
+        self.max_age = DUPLICATE_BLOCKS_MAX_AGE if max_age is None else max_age
+        # key -> {familyTreeId: [(nodeId, member fields), ...] in familyMembers order}
+        self._blocks = defaultdict(dict)
+        # familyTreeId -> keys of its members
+        self._tree_keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @staticmethod
+    def _tree_blocks(family_members: Optional[List[Dict[str, Any]]]) -> Dict[str, List[Tuple[Any, Dict[str, Any]]]]:
+        """{key: [(nodeId, member fields), ...]} of one tree's members."""
+        blocks = defaultdict(list)
+        for member in family_members or []:
+            if not isinstance(member, dict):
+                continue
+            key = member_blocking_key(member)
+            if key:
+                blocks[key].append((member.get('id'), {field: member.get(field) for field in DUPLICATE_MEMBER_FIELDS}))
+        return blocks
+
+    def _set_tree(self, family_tree_id: str, tree_blocks: Dict[str, List[Tuple[Any, Dict[str, Any]]]]):
+        for key in self._tree_keys.pop(family_tree_id, ()):
+            block = self._blocks.get(key)
+            if block is not None:
+                block.pop(family_tree_id, None)
+                if not block:
+                    del self._blocks[key]
+        if tree_blocks:
+            self._tree_keys[family_tree_id] = list(tree_blocks)
+            for key, entries in tree_blocks.items():
+                self._blocks[key][family_tree_id] = entries
+
+    def ensure_loaded(self, db):
+        """Stream the familyMembers of every tree on first use and once the keys are older than max_age."""
+        if self._loaded_at is not None and time.time() - self._loaded_at < self.max_age:
+            return
+        with self._load_lock:
+            if self._loaded_at is not None and time.time() - self._loaded_at < self.max_age:
+                return
+            trees = {}
+            for doc in db.collection('family_tree').select(['familyMembers']).stream():
+                trees[doc.id] = self._tree_blocks((doc.to_dict() or {}).get('familyMembers', []))
+            with self._lock:
+                self._blocks = defaultdict(dict)
+                self._tree_keys = {}
+                for family_tree_id, tree_blocks in trees.items():
+                    self._set_tree(family_tree_id, tree_blocks)
+                self._loaded_at = time.time()
+            logger.info(f"Duplicate block index loaded with {len(trees)} family trees")
+
+    def apply_family_members_write(self, family_tree_id: str, family_members: Optional[List[Dict[str, Any]]]):
+        """familyMembers write hook: re-key the members of the tree, None drops a deleted tree."""
+        if self._loaded_at is None:
+            return
+        tree_blocks = self._tree_blocks(family_members)
+        with self._lock:
+            self._set_tree(family_tree_id, tree_blocks)
+
+    def find_duplicates(self, family_tree_id: Optional[str] = None,
+                        max_block_size: int = 200) -> List[Dict[str, Any]]:
+        """
+        find_duplicate_members over the cached keys. With family_tree_id only
+        the blocks of that tree's members are compared.
+        """
+        with self._lock:
+            keys = self._tree_keys.get(family_tree_id, ()) if family_tree_id else list(self._blocks)
+            blocks = {}
+            for key in keys:
+                block = self._blocks[key]
+                blocks[key] = [(tree_id, node_id, member)
+                               for tree_id in sorted(block) for node_id, member in block[tree_id]]
+
+        duplicates = []
+        for key, entries in blocks.items():
+            duplicates.extend(_block_duplicates(key, entries, family_tree_id, max_block_size))
+        return _rank_duplicates(duplicates)
+
+
+# Process-wide block index shared by the find-duplicates endpoint
+duplicate_block_index = DuplicateBlockIndex()
+add_family_members_listener(duplicate_block_index.apply_family_members_write)
+
+
+def find_duplicate_people(db, family_tree_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Report likely duplicate people across all family trees (see
+    find_duplicate_members), from the shared DuplicateBlockIndex.
+
+    With family_tree_id, that tree is re-read first so its own latest
+    members are compared even when another app instance wrote them, and
+    only the blocks its members fall in are searched.
+    """
+    duplicate_block_index.ensure_loaded(db)
+    if family_tree_id:
+        doc = db.collection('family_tree').document(family_tree_id).get(field_paths=['familyMembers'])
+        duplicate_block_index.apply_family_members_write(
+            family_tree_id, (doc.to_dict() or {}).get('familyMembers', []) if doc.exists else None)
+    return duplicate_block_index.find_duplicates(family_tree_id)
@@ -0,0 +1,103 @@
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Any
+
+
+def _members_index(family_members: List[Dict[str, Any]]):
+    """
+    One pass over the members: every entry per id, the ids of each node's
+    children along parentId, and spouse links in both directions.
+    """
+    entries = defaultdict(list)
+    children = defaultdict(list)
+    spouses = defaultdict(list)
+    for member in family_members:
+        member_id = member.get('id')
+        entries[member_id].append(member)
+        if member.get('parentId'):
+            children[member['parentId']].append(member_id)
+        if member.get('spouse'):
+            spouses[member_id].append(member['spouse'])
+            spouses[member['spouse']].append(member_id)
+    return entries, children, spouses
+
+
+def propagate_generations(family_members: List[Dict[str, Any]], root_id: str,
+                          root_generation: Optional[int] = None, include_spouses: bool = True) -> int:
+    """
+    Recompute generations below a node after it was moved or inserted.
+
+    The root gets root_generation and every descendant along parentId one
+    less than its parent; with include_spouses the spouse of every reached
+    node gets that node's generation, and their children follow from it.
+    The walk is breadth-first over an index built once, so it is linear in
+    the number of members and safe for trees of any depth or with cycles.
+
+    Args:
+        family_members: List of family members, updated in place
+        root_id: ID of the node the subtree hangs from
+        root_generation: Generation of the root, its current one (or 0) if omitted
+        include_spouses: Whether spouses are aligned with their partner
+
+    Returns:
+        int: Number of members whose generation changed
+    """
+    entries, children, spouses = _members_index(family_members)
+    if root_id not in entries:
+        return 0
+    if root_generation is None:
+        root_generation = entries[root_id][0].get('generation', 0)
+
+    changed = 0
+    reached = {root_id}
+    queue = deque([(root_id, root_generation)])
+    while queue:
+        node_id, generation = queue.popleft()
+        for member in entries[node_id]:
+            if member.get('generation') != generation:
+                member['generation'] = generation
+                changed += 1
+
+        related = [(child_id, generation - 1) for child_id in children.get(node_id, ())]
+        if include_spouses:
+            related[:0] = [(spouse_id, generation) for spouse_id in spouses.get(node_id, ())]
+        for other_id, other_generation in related:
+            if other_id in entries and other_id not in reached:
+                reached.add(other_id)
+                queue.append((other_id, other_generation))
+    return changed
+
+
+def collect_subtree_members(family_members: List[Dict[str, Any]], root_id: str) -> List[Dict[str, Any]]:
+    """
+    A node, its spouse and all its descendants with their spouses.
+
+    Members come in depth-first order: each node, then its spouse, then the
+    subtrees of its children in list order. Every id is taken once.
+    """
+    first_entry = {}
+    children = defaultdict(list)
+    for member in family_members:
+        first_entry.setdefault(member.get('id'), member)
+        if member.get('parentId'):
+            children[member['parentId']].append(member.get('id'))
+
+    collected = []
+    processed = set()
+    stack = [root_id]
+    while stack:
+        node_id = stack.pop()
+        if node_id in processed:
+            continue
+        processed.add(node_id)
+        member = first_entry.get(node_id)
+        if not member:
+            continue
+        collected.append(member)
+
+        spouse_id = member.get('spouse')
+        if spouse_id and spouse_id in first_entry and spouse_id not in processed:
+            collected.append(first_entry[spouse_id])
+            processed.add(spouse_id)
+
+        stack.extend(reversed(children.get(node_id, [])))
+    return collected
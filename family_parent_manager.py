@@ -2,6 +2,8 @@ from datetime import datetime
 import logging
 import uuid
 import requests
+from family_tree_email_index import index_family_tree_members, remove_family_tree_from_index
+from family_generations import propagate_generations, collect_subtree_members
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -162,21 +164,15 @@ def add_parents_to_family_tree(
                 break
         
         # Update all generations in the subtree
-        # # For each child of the current child, update their generation and their descendants
-        # child_descendants = []
-        # for member in child_family_members:
-        #     if member.get('parentId') == child_node_id:
-        #         child_descendants.append(member.get('id'))
-        
-        # # If there are descendants, update their generations and their subtrees
-        # for descendant_id in child_descendants:
-        #     child_family_members = update_subtree_generations(child_family_members, descendant_id, child_generation - 1)
+        generations_updated = propagate_generations(child_family_members, child_node_id, child_generation)
+        logger.info(f"Updated generation of {generations_updated} members in the child's subtree")
         
         # Update the family tree document
         family_tree_ref.document(child_family_tree_id).update({
             'familyMembers': child_family_members,
             'updatedAt': datetime.now().isoformat()
         })
+        index_family_tree_members(child_family_tree_id, child_family_members)
         
         return {
             "success": True,
@@ -185,7 +181,8 @@ def add_parents_to_family_tree(
             "childNodeId": child_node_id,
             "childGeneration": child_generation,
             "parentGeneration": parent_generation,
-            "addedParents": added_parents
+            "addedParents": added_parents,
+            "generationsUpdated": generations_updated
         }
     
     except Exception as e:
@@ -386,6 +383,7 @@ def create_family_tree_with_parents(
         
         # Save family tree to database
         family_tree_ref.document(family_tree_id).set(family_tree_data)
+        index_family_tree_members(family_tree_id, family_members)
         
         # Update child's profile with family tree ID
         user_profiles_ref.document(child_email).update({
@@ -446,7 +444,7 @@ def create_family_tree_with_parents(
 
 def update_subtree_generations(family_members, node_id, current_generation):
     """
-    Helper function to recursively update generations for a node and all its descendants
+    Helper function to update generations for a node and all its descendants
     
     Args:
         family_members: List of family members in the tree
@@ -456,25 +454,8 @@ def update_subtree_generations(family_members, node_id, current_generation):
     Returns:
         Updated family_members list
     """
-    # Find and update the current node
-    for member in family_members:
-        if member.get('id') == node_id:
-            # Update generation for this node
-            old_generation = member.get('generation', None)
-            member['generation'] = current_generation
-            
-            # Find all children of this node
-            children = []
-            for potential_child in family_members:
-                if potential_child.get('parentId') == node_id:
-                    children.append(potential_child)
-            
-            # Recursively update children (one generation down)
-            for child in children:
-                update_subtree_generations(family_members, child.get('id'), current_generation - 1)
-            
-            break
-    
+    changed = propagate_generations(family_members, node_id, current_generation, include_spouses=False)
+    logger.info(f"Updated generation of {changed} members below {node_id}")
     return family_members
 
 def merge_family_trees(
@@ -684,6 +665,7 @@ def merge_family_trees(
                 'familyMembers': family_members,
                 'updatedAt': datetime.now().isoformat()
             })
+            index_family_tree_members(father_tree_id, family_members)
             logger.info("Updated father's family tree with new child")
             
             # Update child's profile
@@ -757,47 +739,6 @@ def merge_family_trees(
         
         logger.info(f"Found child node ID: {child_node_id} and father node ID: {father_node.get('id')}")
         
-        # Function to collect child's subtree members
-        def collect_subtree_members(members, root_id, collected_members=None, processed_ids=None):
-            if collected_members is None:
-                collected_members = []
-            if processed_ids is None:
-                processed_ids = set()
-            
-            # Skip if we've already processed this node
-            if root_id in processed_ids:
-                return collected_members
-            
-            processed_ids.add(root_id)
-            
-            # Find the root member
-            root_member = None
-            for member in members:
-                if member.get('id') == root_id:
-                    root_member = member
-                    break
-            
-            if not root_member:
-                return collected_members
-            
-            # Add the root member
-            collected_members.append(root_member)
-            
-            # Add spouse if exists
-            spouse_id = root_member.get('spouse')
-            if spouse_id:
-                for member in members:
-                    if member.get('id') == spouse_id and spouse_id not in processed_ids:
-                        collected_members.append(member)
-                        processed_ids.add(spouse_id)
-            
-            # Recursively add all children and their subtrees
-            for member in members:
-                if member.get('parentId') == root_id:
-                    collect_subtree_members(members, member.get('id'), collected_members, processed_ids)
-            
-            return collected_members
-        
         # Collect child's subtree (including spouse and all descendants)
         subtree_members = collect_subtree_members(child_members, child_node_id)
         
@@ -813,19 +754,21 @@ def merge_family_trees(
         gen_adjustment = child_new_gen - child_old_gen
         logger.info(f"Generation adjustment: {gen_adjustment} (old: {child_old_gen}, new: {child_new_gen})")
         
+        # Recompute generations of the subtree below its new parent
+        generations_updated = propagate_generations(subtree_members, child_node_id, child_new_gen)
+        logger.info(f"Updated generation of {generations_updated} subtree members")
+        
         # Create merged members list starting with father's tree
         merged_members = father_members.copy()
+        merged_emails = {m.get('email') for m in merged_members}
         
         # Update and add subtree members
         added_members = 0
         for member in subtree_members:
             # Skip if member already exists in father's tree
-            if any(m.get('email') == member.get('email') for m in merged_members):
+            if member.get('email') in merged_emails:
                 continue
             
-            # Adjust generation
-            member['generation'] = member.get('generation', 0) + gen_adjustment
-            
             # If this is the child node, update its parentId
             if member.get('id') == child_node_id:
                 member['parentId'] = father_node.get('id')
@@ -834,6 +777,7 @@ def merge_family_trees(
             
             
             merged_members.append(member)
+            merged_emails.add(member.get('email'))
             added_members += 1
         
         logger.info(f"Added {added_members} new members to father's tree")
@@ -893,6 +837,7 @@ def merge_family_trees(
             'relatives': merged_relatives,
             'updatedAt': datetime.now().isoformat()
         })
+        index_family_tree_members(father_tree_id, merged_members)
         logger.info("Updated father's tree with merged members and relatives")
         
         # Update profiles for all subtree members to point to father's tree
@@ -909,6 +854,7 @@ def merge_family_trees(
         
         # Delete the child's tree as the subtree has been merged
         family_tree_ref.document(child_tree_id).delete()
+        remove_family_tree_from_index(child_tree_id)
         logger.info(f"Deleted child's tree: {child_tree_id}")
         
         logger.info("Successfully completed tree merge operation")
@@ -921,6 +867,7 @@ def merge_family_trees(
             "childGeneration": child_new_gen,
             "fatherGeneration": father_node.get('generation'),
             "mergedMembers": len(subtree_members),
+            "generationsUpdated": generations_updated,
             "mergedRelatives": len(merged_relatives) - len(father_relatives)
         }
     
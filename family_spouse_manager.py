@@ -2,6 +2,8 @@ import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Tuple, Optional
 import logging
+from family_tree_email_index import index_family_tree_members
+from family_generations import propagate_generations
 
 logger = logging.getLogger(__name__)
 
@@ -120,6 +122,18 @@ def add_spouse_relationship(
             wife_image_data, husband_image_data
         )
 
+def _align_spouse_generation(members_list, spouse_node):
+    """
+    Give a spouse node added to a tree the generation of its partner and
+    recompute the generations below the couple.
+
+    Returns:
+        int: Number of members whose generation changed
+    """
+    generations_updated = propagate_generations(members_list, spouse_node.get('spouse'))
+    logger.info(f"Updated generation of {generations_updated} members after adding spouse {spouse_node.get('id')}")
+    return generations_updated
+
 def create_complete_mini_tree(member_list, member_id, spouse_details=None):
     """
     Helper function to create complete mini-tree with spouse
@@ -235,6 +249,7 @@ def handle_no_trees_scenario(
         "familyMembers": [husband_details, wife_details],
         "relatives": relatives
     })
+    index_family_tree_members(new_family_tree_id, [husband_details, wife_details])
 
     user_profiles_ref.document(wife_email).set({
         "familyTreeId": new_family_tree_id,
@@ -339,6 +354,7 @@ def handle_only_wife_has_tree_scenario(
         "familyMembers": [husband_details, new_wife_details],
         "relatives": husband_relatives
     })
+    index_family_tree_members(new_family_tree_id, [husband_details, new_wife_details])
 
     # Update wife's original tree with reference to husband
     wife_relatives = wife_family_tree.get('relatives', {})
@@ -359,6 +375,7 @@ def handle_only_wife_has_tree_scenario(
         "familyMembers": wife_members_list,
         "relatives": wife_relatives
     })
+    index_family_tree_members(wife_family_tree_id, wife_members_list)
 
     # Update user profiles
     user_profiles_ref.document(wife_email).set({
@@ -438,6 +455,7 @@ def handle_only_husband_has_tree_scenario(
             break
             
     husband_members_list.append(wife_details)
+    _align_spouse_generation(husband_members_list, wife_details)
     
     # Create simple reference mapping
     husband_relatives = husband_family_tree.get('relatives', {})
@@ -450,6 +468,7 @@ def handle_only_husband_has_tree_scenario(
         "familyMembers": husband_members_list,
         "relatives": husband_relatives
     })
+    index_family_tree_members(husband_family_tree_id, husband_members_list)
 
     # Update user profiles
     user_profiles_ref.document(wife_email).set({
@@ -550,6 +569,7 @@ def handle_both_have_trees_scenario(
             
     # Add wife to husband's family members
     husband_members_list.append(new_wife_details)
+    _align_spouse_generation(husband_members_list, new_wife_details)
     wife_last_name = wife_details.get('lastName')
     
     # Create spouse reference mapping instead of relatives tree
@@ -566,6 +586,7 @@ def handle_both_have_trees_scenario(
         "familyMembers": husband_members_list,
         "relatives": husband_relatives
     })
+    index_family_tree_members(husband_family_tree_id, husband_members_list)
     
     # Add husband to wife's family tree
     new_husband_node_id = str(len(wife_members_list) + 1)
@@ -597,6 +618,7 @@ def handle_both_have_trees_scenario(
             
     # Add husband to wife's family members
     wife_members_list.append(new_husband_details)
+    _align_spouse_generation(wife_members_list, new_husband_details)
     
     # Create spouse reference mapping instead of mini-tree
     wife_relatives = wife_family_tree.get('relatives', {})
@@ -612,6 +634,7 @@ def handle_both_have_trees_scenario(
         "familyMembers": wife_members_list,
         "relatives": wife_relatives
     })
+    index_family_tree_members(wife_family_tree_id, wife_members_list)
     
     # Update user profiles
     user_profiles_ref.document(wife_email).update({
@@ -780,6 +803,7 @@ def create_family_tree_with_husband(
         family_tree_ref.document(new_family_tree_id).set({
             "familyMembers": [husband_details, wife_details],
         })
+        index_family_tree_members(new_family_tree_id, [husband_details, wife_details])
 
         # Update wife's profile with new last name, marital status and family tree ID
         user_profiles_ref.document(wife_email).set({
@@ -918,6 +942,7 @@ def create_family_tree_with_wife(
         family_tree_ref.document(new_family_tree_id).set({
             "familyMembers": [husband_details, wife_details],
         })
+        index_family_tree_members(new_family_tree_id, [husband_details, wife_details])
 
         # Update husband's profile with family tree ID and marital status
         user_profiles_ref.document(husband_email).set({
@@ -1032,12 +1057,14 @@ def add_husband_to_family_tree(
                 
         # Add husband to wife's family members
         wife_members_list.append(husband_details)
+        _align_spouse_generation(wife_members_list, husband_details)
         
         # Update wife's family tree
         family_tree_ref.document(wife_family_tree_id).update({
             "familyMembers": wife_members_list,
             "updatedAt": datetime.now().isoformat()
         })
+        index_family_tree_members(wife_family_tree_id, wife_members_list)
         
         # Update wife profile if exists
         wife_email = wife_details.get('email')
@@ -1167,12 +1194,14 @@ def add_wife_to_family_tree(
                 
         # Add wife to husband's family members
         husband_members_list.append(wife_details)
+        _align_spouse_generation(husband_members_list, wife_details)
         
         # Update husband's family tree
         family_tree_ref.document(husband_family_tree_id).update({
             "familyMembers": husband_members_list,
             "updatedAt": datetime.now().isoformat()
         })
+        index_family_tree_members(husband_family_tree_id, husband_members_list)
         
         # # Update wife's profile
         # user_profiles_ref.document(wife_email).set({
@@ -1403,6 +1432,7 @@ def create_family_tree_with_husband_email(
             
             # Add husband to wife's family tree
             wife_members_list.append(husband_node_in_wife_tree)
+            _align_spouse_generation(wife_members_list, husband_node_in_wife_tree)
             logger.info("Added husband to wife's family tree")
             
             # Step 3: Create relatives reference for wife's tree in husband's tree
@@ -1423,6 +1453,7 @@ def create_family_tree_with_husband_email(
                 "createdAt": datetime.now().isoformat(),
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(new_family_tree_id, [husband_details, wife_details])
             logger.info("Saved husband's family tree")
             
             # Update wife's family tree with husband reference
@@ -1439,6 +1470,7 @@ def create_family_tree_with_husband_email(
                 "relatives": wife_relatives,
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(wife_family_tree_id, wife_members_list)
             logger.info("Updated wife's family tree")
             
         else:
@@ -1475,6 +1507,7 @@ def create_family_tree_with_husband_email(
                 "createdAt": datetime.now().isoformat(),
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(new_family_tree_id, [husband_details, wife_details])
             logger.info("Saved new family tree")
         
         # Update husband's profile with family tree ID and marital status
@@ -1668,6 +1701,7 @@ def create_family_tree_with_wife_email(
                 "createdAt": datetime.now().isoformat(),
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(new_family_tree_id, [husband_details, wife_details])
             logger.info("Saved new family tree")
             
             # Update husband's profile
@@ -1763,6 +1797,7 @@ def create_family_tree_with_wife_email(
             
             # Add wife to husband's family members
             husband_members_list.append(wife_details)
+            _align_spouse_generation(husband_members_list, wife_details)
             logger.info("Added wife to husband's family members")
             
             # Update or create relatives section
@@ -1779,6 +1814,7 @@ def create_family_tree_with_wife_email(
                 "relatives": relatives,
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(husband_family_tree_id, husband_members_list)
             logger.info("Updated husband's family tree")
             
             # Update wife's profile
@@ -1968,9 +2004,11 @@ def handle_both_spouses_have_trees(
                 
         # 5. Add wife to husband's tree
         husband_members_list.append(wife_in_husband_tree)
+        _align_spouse_generation(husband_members_list, wife_in_husband_tree)
         
         # 6. Add husband to wife's tree
         wife_members_list.append(husband_in_wife_tree)
+        _align_spouse_generation(wife_members_list, husband_in_wife_tree)
         
         # 7. Update relatives mappings
         husband_relatives = husband_family_tree.get('relatives', {})
@@ -1995,12 +2033,14 @@ def handle_both_spouses_have_trees(
             "relatives": husband_relatives,
             "updatedAt": datetime.now().isoformat()
         })
+        index_family_tree_members(husband_family_tree_id, husband_members_list)
         
         family_tree_ref.document(wife_family_tree_id).update({
             "familyMembers": wife_members_list,
             "relatives": wife_relatives,
             "updatedAt": datetime.now().isoformat()
         })
+        index_family_tree_members(wife_family_tree_id, wife_members_list)
         
         # 9. Update user profiles
         # Set husband's family tree as primary for wife
@@ -2216,6 +2256,7 @@ def adding_wife_to_family_tree(
         
         # Add wife to husband's tree
         husband_members_list.append(wife_in_husband_tree)
+        _align_spouse_generation(husband_members_list, wife_in_husband_tree)
         
         # Update relatives mappings in husband's tree
         husband_relatives = husband_family_tree.get('relatives', {})
@@ -2263,6 +2304,7 @@ def adding_wife_to_family_tree(
             
             # Add husband to wife's tree
             wife_members_list.append(husband_in_wife_tree)
+            _align_spouse_generation(wife_members_list, husband_in_wife_tree)
             
             # Update relatives mappings in wife's tree
             wife_relatives = wife_family_tree.get('relatives', {})
@@ -2279,6 +2321,7 @@ def adding_wife_to_family_tree(
                 "relatives": wife_relatives,
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(wife_family_tree_id, wife_members_list)
             husband_relatives[wife_in_husband_tree_id] = {
             "name": wife_updated_name,
             "email": wife_email,
@@ -2291,6 +2334,7 @@ def adding_wife_to_family_tree(
             "relatives": husband_relatives,
             "updatedAt": datetime.now().isoformat()
         })
+        index_family_tree_members(husband_family_tree_id, husband_members_list)
         # Update user profiles
         user_profiles_ref.document(wife_email).set({
             "familyTreeId": husband_family_tree_id,
@@ -2507,6 +2551,7 @@ def adding_husband_to_family_tree(
         
         # Add husband to wife's tree
         wife_members_list.append(husband_in_wife_tree)
+        _align_spouse_generation(wife_members_list, husband_in_wife_tree)
         
         # Update relatives mappings in wife's tree
         wife_relatives = wife_family_tree.get('relatives', {})
@@ -2588,6 +2633,7 @@ def adding_husband_to_family_tree(
             
             # Add wife to husband's tree
             husband_members_list.append(wife_in_husband_tree)
+            _align_spouse_generation(husband_members_list, wife_in_husband_tree)
             
             # Update relatives mappings in husband's tree
             husband_relatives = husband_family_tree.get('relatives', {})
@@ -2604,6 +2650,7 @@ def adding_husband_to_family_tree(
                 "relatives": husband_relatives,
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(husband_family_tree_id, husband_members_list)
             
             # Also update wife's name in her own tree to match husband's last name
             for i, member in enumerate(wife_members_list):
@@ -2626,6 +2673,7 @@ def adding_husband_to_family_tree(
                 "relatives": wife_relatives,
                 "updatedAt": datetime.now().isoformat()
             })
+            index_family_tree_members(wife_family_tree_id, wife_members_list)
              
             wife_profile_exists=wife_node.get('userProfileExists',False)
             if wife_profile_exists:
@@ -2769,6 +2817,7 @@ def adding_husband_to_family_tree(
                 "updatedAt": datetime.now().isoformat(),
                 "name": f"{husband_first_name} and {wife_first_name}'s Family Tree"
             })
+            index_family_tree_members(new_family_tree_id, combined_family_members)
             
             logger.info(f"Created new family tree with ID: {new_family_tree_id}")
             
@@ -2830,6 +2879,7 @@ def adding_husband_to_family_tree(
             
             # Add husband to wife's tree
             wife_members_list.append(husband_in_wife_tree)
+            _align_spouse_generation(wife_members_list, husband_in_wife_tree)
             
             # Update relatives mappings in wife's tree
             wife_relatives = wife_family_tree.get('relatives', {})
@@ -2847,6 +2897,7 @@ def adding_husband_to_family_tree(
                 "relatives": wife_relatives,
                 "updatedAt": datetime.now().isoformat()
             },merge=True)
+            index_family_tree_members(wife_family_tree_id, wife_members_list)
             
         # Update husband's profile
             user_profiles_ref.document(husband_email).set({
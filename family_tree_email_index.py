@@ -0,0 +1,193 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Any
+
+from firebase_admin import firestore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One document per email: {"email", "nodes": {familyTreeId: [nodeId, ...]}, "updatedAt"}
+EMAIL_INDEX_COLLECTION = 'family_tree_email_index'
+# One document per family tree: {"emails": {email: [nodeId, ...]}, "updatedAt"},
+# the emails the index currently holds for that tree
+EMAIL_MANIFEST_COLLECTION = 'family_tree_email_manifests'
+# {"complete": True} once every existing family tree has been indexed
+EMAIL_INDEX_STATE_DOC = ('family_tree_email_index_meta', 'state')
+
+_index_complete = False
+_index_complete_lock = threading.Lock()
+
+# Callbacks run after every familyMembers write, see add_family_members_listener
+_family_members_listeners = []
+
+
+def normalize_index_email(email: Optional[str]) -> str:
+    """Emails are indexed lowercased and stripped."""
+    return email.strip().lower() if isinstance(email, str) else ""
+
+
+def _email_nodes(family_members: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Return {email: [nodeId, ...]} for the members of one tree that carry an email."""
+    email_nodes = {}
+    for member in family_members or []:
+        if not isinstance(member, dict):
+            continue
+        email = normalize_index_email(member.get('email'))
+        node_id = member.get('id')
+        if email and node_id:
+            email_nodes.setdefault(email, []).append(node_id)
+    for node_ids in email_nodes.values():
+        node_ids.sort()
+    return email_nodes
+
+
+def add_family_members_listener(callback: Callable[[str, Optional[List[Dict[str, Any]]]], None]):
+    """
+    Register callback(family_tree_id, family_members), run by the same write
+    hook that maintains the email index. family_members is None when the
+    tree was deleted.
+    """
+    _family_members_listeners.append(callback)
+
+
+def _notify_family_members_listeners(family_tree_id: str, family_members: Optional[List[Dict[str, Any]]]):
+    for callback in _family_members_listeners:
+        try:
+            callback(family_tree_id, family_members)
+        except Exception as e:
+            logger.error(f"Error in family members listener for {family_tree_id}: {e}")
+
+
+def index_family_tree_members(family_tree_id: str, family_members: List[Dict[str, Any]], db=None):
+    """
+    Bring the email index in line with the familyMembers just written to a tree.
+
+    Called after every write of familyMembers. Reads the tree's manifest once
+    and only rewrites the index entries of emails whose nodes in this tree
+    changed, so a typical mutation costs one read and a couple of writes.
+    Index maintenance never fails the tree mutation itself. Listeners
+    registered with add_family_members_listener are notified first.
+
+    Args:
+        family_tree_id: ID of the family tree that was written
+        family_members: The familyMembers list as written
+        db: Firestore client (defaults to firestore.client())
+    """
+    if not family_tree_id:
+        return
+    _notify_family_members_listeners(family_tree_id, family_members)
+    try:
+        db = db or firestore.client()
+        new_entries = _email_nodes(family_members)
+        manifest_ref = db.collection(EMAIL_MANIFEST_COLLECTION).document(family_tree_id)
+        manifest_doc = manifest_ref.get()
+        old_entries = (manifest_doc.to_dict() or {}).get('emails', {}) if manifest_doc.exists else {}
+
+        if old_entries == new_entries:
+            return
+
+        now = datetime.now().isoformat()
+        batch = db.batch()
+        for email, node_ids in new_entries.items():
+            if old_entries.get(email) != node_ids:
+                batch.set(db.collection(EMAIL_INDEX_COLLECTION).document(email), {
+                    'email': email,
+                    'nodes': {family_tree_id: node_ids},
+                    'updatedAt': now
+                }, merge=True)
+        for email in old_entries:
+            if email not in new_entries:
+                batch.set(db.collection(EMAIL_INDEX_COLLECTION).document(email), {
+                    'nodes': {family_tree_id: firestore.DELETE_FIELD},
+                    'updatedAt': now
+                }, merge=True)
+        batch.set(manifest_ref, {'emails': new_entries, 'updatedAt': now})
+        batch.commit()
+    except Exception as e:
+        logger.error(f"Error updating family tree email index for {family_tree_id}: {e}")
+
+
+def remove_family_tree_from_index(family_tree_id: str, db=None):
+    """Drop every index entry of a deleted family tree."""
+    if not family_tree_id:
+        return
+    _notify_family_members_listeners(family_tree_id, None)
+    try:
+        db = db or firestore.client()
+        manifest_ref = db.collection(EMAIL_MANIFEST_COLLECTION).document(family_tree_id)
+        manifest_doc = manifest_ref.get()
+        if not manifest_doc.exists:
+            return
+
+        now = datetime.now().isoformat()
+        batch = db.batch()
+        for email in (manifest_doc.to_dict() or {}).get('emails', {}):
+            batch.set(db.collection(EMAIL_INDEX_COLLECTION).document(email), {
+                'nodes': {family_tree_id: firestore.DELETE_FIELD},
+                'updatedAt': now
+            }, merge=True)
+        batch.delete(manifest_ref)
+        batch.commit()
+    except Exception as e:
+        logger.error(f"Error removing family tree {family_tree_id} from email index: {e}")
+
+
+def is_email_index_complete(db) -> bool:
+    """True once rebuild_family_tree_email_index has indexed every existing tree."""
+    global _index_complete
+    if _index_complete or db is None:
+        return _index_complete
+    try:
+        collection, doc_id = EMAIL_INDEX_STATE_DOC
+        state_doc = db.collection(collection).document(doc_id).get()
+        if state_doc.exists and (state_doc.to_dict() or {}).get('complete'):
+            with _index_complete_lock:
+                _index_complete = True
+    except Exception as e:
+        logger.error(f"Error reading family tree email index state: {e}")
+    return _index_complete
+
+
+def find_family_tree_nodes(db, email: str) -> Optional[Dict[str, List[str]]]:
+    """
+    Look up the family tree nodes that carry an email.
+
+    Returns:
+        dict: {familyTreeId: [nodeId, ...]}, or None if the index has not been
+        fully built yet and callers have to scan the trees themselves
+    """
+    if not is_email_index_complete(db):
+        return None
+    index_doc = db.collection(EMAIL_INDEX_COLLECTION).document(normalize_index_email(email)).get()
+    if not index_doc.exists:
+        return {}
+    nodes = (index_doc.to_dict() or {}).get('nodes', {})
+    return {tree_id: node_ids for tree_id, node_ids in nodes.items() if node_ids}
+
+
+def rebuild_family_tree_email_index(db) -> int:
+    """
+    Index every family tree with a single stream of the collection and mark
+    the index complete.
+
+    Returns:
+        int: Number of indexed family trees
+    """
+    global _index_complete
+    count = 0
+    for tree_doc in db.collection('family_tree').select(['familyMembers']).stream():
+        index_family_tree_members(tree_doc.id, (tree_doc.to_dict() or {}).get('familyMembers', []), db)
+        count += 1
+
+    collection, doc_id = EMAIL_INDEX_STATE_DOC
+    db.collection(collection).document(doc_id).set({
+        'complete': True,
+        'familyTrees': count,
+        'updatedAt': datetime.now().isoformat()
+    })
+    with _index_complete_lock:
+        _index_complete = True
+    logger.info(f"Family tree email index rebuilt for {count} family trees")
+    return count
@@ -0,0 +1,304 @@
+import logging
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+
+from family_tree_relations import FamilyMembersIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Family tree documents kept in memory by one graph
+FAMILY_GRAPH_MAX_TREES = int(os.environ.get('FAMILY_GRAPH_MAX_TREES', '256'))
+# Upper bounds of a single query
+FAMILY_GRAPH_MAX_HOPS = 6
+FAMILY_GRAPH_MAX_NODES = 5000
+# Documents per get_all call when loading trees or profiles
+FAMILY_GRAPH_BATCH_SIZE = 100
+
+NodeKey = Tuple[str, str]
+
+
+class LinkedFamilyTree:
+    """One loaded family tree: its member index and its relatives links."""
+
+    __slots__ = ('family_tree_id', 'index', 'relatives')
+
+    def __init__(self, family_tree_id: str, data: Dict[str, Any]):
+        self.family_tree_id = family_tree_id
+        self.index = FamilyMembersIndex(data.get('familyMembers', []) or [])
+        relatives = data.get('relatives', {})
+        self.relatives = relatives if isinstance(relatives, dict) else {}
+
+    def neighbours(self, node_id: str) -> List[str]:
+        """Members one edge away inside the tree: parent, spouse and children."""
+        member = self.index.members.get(node_id)
+        if not member:
+            return []
+        result = []
+        for other_id in (member.get('parentId'), member.get('spouse')):
+            if other_id and other_id in self.index.members:
+                result.append(other_id)
+        result.extend(self.index.children_of(node_id))
+        result.extend(self.index.spouses_of(node_id))
+        return result
+
+    def link(self, node_id: str) -> Optional[NodeKey]:
+        """The (familyTreeId, nodeId) a member's relatives entry points to."""
+        entry = self.relatives.get(node_id)
+        if not isinstance(entry, dict) or not entry.get('familyTreeId') or not entry.get('originalNodeId'):
+            return None
+        return entry['familyTreeId'], entry['originalNodeId']
+
+
+class FamilyGraph:
+    """
+    Graph of every member of every family tree, joined by the relatives links.
+
+    Inside a tree, parent, spouse and child edges count one hop each. A
+    relatives entry joins a member to the node that represents them in
+    another tree, the way get_user_connections reads it, and costs no hop.
+    Trees are read lazily, many at a time with get_all, and kept in an LRU
+    of max_trees documents, so one graph can serve a whole batch of queries.
+    The bound is only enforced between queries: every tree a running query
+    has read stays loaded until it returns, so results never lose nodes.
+    """
+
+    def __init__(self, db, max_trees: Optional[int] = None):
+        self.db = db
+        self.max_trees = FAMILY_GRAPH_MAX_TREES if max_trees is None else max_trees
+        self._trees = OrderedDict()
+        self._querying = 0
+        self.stats = {'treesLoaded': 0, 'treeCacheHits': 0, 'loadCalls': 0}
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def load_trees(self, family_tree_ids: Iterable[str]):
+        """Read every tree that is not cached yet, FAMILY_GRAPH_BATCH_SIZE per call."""
+        missing = []
+        for family_tree_id in dict.fromkeys(family_tree_ids):
+            if not family_tree_id:
+                continue
+            if family_tree_id in self._trees:
+                self._trees.move_to_end(family_tree_id)
+                self.stats['treeCacheHits'] += 1
+            else:
+                missing.append(family_tree_id)
+
+        collection = self.db.collection('family_tree')
+        for start in range(0, len(missing), FAMILY_GRAPH_BATCH_SIZE):
+            refs = [collection.document(family_tree_id) for family_tree_id in missing[start:start + FAMILY_GRAPH_BATCH_SIZE]]
+            self.stats['loadCalls'] += 1
+            for doc in self.db.get_all(refs, field_paths=['familyMembers', 'relatives']):
+                tree = LinkedFamilyTree(doc.id, doc.to_dict() or {}) if doc.exists else None
+                self._remember(doc.id, tree)
+                self.stats['treesLoaded'] += 1
+
+    def _remember(self, family_tree_id: str, tree: Optional[LinkedFamilyTree]):
+        self._trees[family_tree_id] = tree
+        self._trees.move_to_end(family_tree_id)
+        if not self._querying:
+            self._evict()
+
+    def _evict(self):
+        while len(self._trees) > self.max_trees:
+            self._trees.popitem(last=False)
+
+    @contextmanager
+    def _query(self):
+        """Pin the trees read while a query runs, trimming back to max_trees when it is done."""
+        self._querying += 1
+        try:
+            yield
+        finally:
+            self._querying -= 1
+            if not self._querying:
+                self._evict()
+
+    def tree(self, family_tree_id: str) -> Optional[LinkedFamilyTree]:
+        """A loaded tree, reading it if needed. None if it does not exist."""
+        if family_tree_id not in self._trees:
+            self.load_trees([family_tree_id])
+        return self._trees.get(family_tree_id)
+
+    def member(self, key: NodeKey) -> Optional[Dict[str, Any]]:
+        tree = self._trees.get(key[0])
+        return tree.index.members.get(key[1]) if tree else None
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _follow_links(self, searches: List['_Search']):
+        """Add the link targets of every search's new nodes at the same hop count, loading trees in batches."""
+        pending = [search for search in searches if search.new_nodes]
+        while pending:
+            wanted = set()
+            for search in pending:
+                for key in search.new_nodes:
+                    tree = self._trees.get(key[0])
+                    target = tree.link(key[1]) if tree else None
+                    if target and target not in search.hops:
+                        search.targets.append(target)
+                        wanted.add(target[0])
+            self.load_trees(wanted)
+
+            next_pending = []
+            for search in pending:
+                added = []
+                for target in search.targets:
+                    if target not in search.hops and self.member(target) is not None and search.add(target):
+                        added.append(target)
+                search.targets = []
+                search.new_nodes = added
+                if added:
+                    next_pending.append(search)
+            pending = next_pending
+
+    def relatives_within_batch(self, starts: List[NodeKey], max_hops: int = 2,
+                               max_nodes: int = FAMILY_GRAPH_MAX_NODES) -> List[List[Dict[str, Any]]]:
+        """
+        Everyone within max_hops of each start node, all queries expanded together.
+
+        The searches advance one hop at a time in lockstep, so the trees that
+        all of them need for the next hop are read with one get_all.
+
+        Args:
+            starts: (familyTreeId, nodeId) of each query
+            max_hops: Hop bound, capped at FAMILY_GRAPH_MAX_HOPS
+            max_nodes: Maximum number of nodes one query may visit
+
+        Returns:
+            list: For each start, the reached members as dicts with
+            familyTreeId, nodeId, hops, name and email, nearest first
+        """
+        max_hops = max(0, min(max_hops, FAMILY_GRAPH_MAX_HOPS))
+        with self._query():
+            return self._relatives_within_batch(starts, max_hops, max_nodes)
+
+    def _relatives_within_batch(self, starts: List[NodeKey], max_hops: int,
+                                max_nodes: int) -> List[List[Dict[str, Any]]]:
+        self.load_trees(family_tree_id for family_tree_id, _ in starts)
+
+        searches = []
+        for start in starts:
+            search = _Search(start, max_nodes)
+            if self.member(start) is not None:
+                search.add(start)
+                search.new_nodes = [start]
+            searches.append(search)
+
+        for hop in range(max_hops + 1):
+            self._follow_links(searches)
+            if hop == max_hops:
+                break
+            for search in searches:
+                frontier = [key for key, hops in search.hops.items() if hops == hop]
+                search.depth = hop + 1
+                added = []
+                for family_tree_id, node_id in frontier:
+                    tree = self._trees.get(family_tree_id)
+                    if tree is None:
+                        continue
+                    for neighbour_id in tree.neighbours(node_id):
+                        key = (family_tree_id, neighbour_id)
+                        if key not in search.hops and search.add(key):
+                            added.append(key)
+                search.new_nodes = added
+
+        return [self._result(search) for search in searches]
+
+    def relatives_within(self, family_tree_id: str, node_id: str, max_hops: int = 2,
+                         max_nodes: int = FAMILY_GRAPH_MAX_NODES) -> List[Dict[str, Any]]:
+        """Everyone within max_hops of one node, across linked trees."""
+        return self.relatives_within_batch([(family_tree_id, node_id)], max_hops, max_nodes)[0]
+
+    def _result(self, search: '_Search') -> List[Dict[str, Any]]:
+        result = []
+        for key, hops in search.hops.items():
+            if key == search.start:
+                continue
+            member = self.member(key) or {}
+            result.append({
+                'familyTreeId': key[0],
+                'nodeId': key[1],
+                'hops': hops,
+                'name': member.get('name', ''),
+                'email': member.get('email', ''),
+            })
+        result.sort(key=lambda entry: entry['hops'])
+        return result
+
+    def resolve_users(self, emails: List[str]) -> Dict[str, Optional[NodeKey]]:
+        """
+        Map user emails to their (familyTreeId, nodeId), reading the profiles
+        and then the trees in batches. None if a user has no tree node.
+        """
+        emails = list(dict.fromkeys(email for email in emails if email))
+        tree_ids = {}
+        collection = self.db.collection('user_profiles')
+        for start in range(0, len(emails), FAMILY_GRAPH_BATCH_SIZE):
+            refs = [collection.document(email) for email in emails[start:start + FAMILY_GRAPH_BATCH_SIZE]]
+            for doc in self.db.get_all(refs, field_paths=['familyTreeId']):
+                if doc.exists:
+                    tree_ids[doc.id] = (doc.to_dict() or {}).get('familyTreeId')
+
+        resolved = {}
+        with self._query():
+            self.load_trees(tree_ids.values())
+            for email in emails:
+                tree = self._trees.get(tree_ids.get(email)) if tree_ids.get(email) else None
+                node_id = None
+                if tree:
+                    node_id = next((member_id for member_id, member in tree.index.members.items()
+                                    if member.get('email') == email), None)
+                resolved[email] = (tree.family_tree_id, node_id) if node_id else None
+        return resolved
+
+
+class _Search:
+    """State of one bounded breadth-first expansion."""
+
+    __slots__ = ('start', 'hops', 'new_nodes', 'targets', 'depth', 'max_nodes')
+
+    def __init__(self, start: NodeKey, max_nodes: int):
+        self.start = start
+        self.hops = {}
+        self.new_nodes = []
+        self.targets = []
+        self.depth = 0
+        self.max_nodes = max_nodes
+
+    def add(self, key: NodeKey) -> bool:
+        if len(self.hops) >= self.max_nodes:
+            return False
+        self.hops[key] = self.depth
+        return True
+
+
+def get_users_relatives_within(emails: List[str], max_hops: int = 2, db=None) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+    """
+    Relatives within max_hops of several users, across linked family trees,
+    answered with one shared graph.
+
+    Returns:
+        dict: {email: [relative, ...]}, None for users without a tree node
+    """
+    if db is None:
+        from firebase_admin import firestore
+        db = firestore.client()
+
+    graph = FamilyGraph(db)
+    resolved = graph.resolve_users(emails)
+    queries = [(email, start) for email, start in resolved.items() if start]
+    results = graph.relatives_within_batch([start for _, start in queries], max_hops)
+
+    relatives = {email: None for email in resolved}
+    for (email, _), result in zip(queries, results):
+        relatives[email] = result
+    logger.info(f"Family graph answered {len(queries)} queries with {graph.stats['treesLoaded']} trees "
+                f"in {graph.stats['loadCalls']} reads")
+    return relatives
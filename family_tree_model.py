@@ -0,0 +1,109 @@
+import hashlib
+import sys
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Any
+
+# Column value of a node without a parent or spouse member
+NO_NODE = -1
+# Column value of a node whose generation is missing or not an integer
+NO_GENERATION = -(2 ** 62)
+
+GENDER_CODES = {'male': 1, 'female': 2}
+GENDER_NAMES = {1: 'male', 2: 'female'}
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def profile_image_id(image: Optional[str]) -> Optional[str]:
+    """Content address of a base64 profile image, None without an image."""
+    if not image or not isinstance(image, str):
+        return None
+    return hashlib.blake2b(image.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class CompactFamilyTree:
+    """
+    Struct-of-arrays view of one tree's familyMembers.
+
+    Node i is the i-th entry of the members list. Ids are interned and
+    parent, spouse and generation are integer columns, gender is one byte
+    per node. Profile images are stored once in images, keyed by their
+    content address, and nodes only hold that id, so code that walks the
+    tree never carries the base64 payloads around.
+
+    parent_keys and spouse_keys keep the raw parentId / spouse values,
+    including ids of members that are not in the tree, because the
+    relationship rules group nodes by those values. position maps an id to
+    its last node, like a {id: member} dict does.
+    """
+
+    __slots__ = ('ids', 'position', 'parent', 'spouse', 'parent_keys', 'spouse_keys',
+                 'generation', 'gender', 'image_ids', 'images')
+
+    def __init__(self, family_members: Iterable[Dict[str, Any]], keep_images: bool = True):
+        members = list(family_members or [])
+        count = len(members)
+
+        self.ids = [_intern(member.get('id')) for member in members]
+        self.position = {member_id: i for i, member_id in enumerate(self.ids)}
+        self.parent_keys = [_intern(member.get('parentId')) for member in members]
+        self.spouse_keys = [_intern(member.get('spouse')) for member in members]
+
+        self.parent = array('l', [self.position.get(key, NO_NODE) if key else NO_NODE for key in self.parent_keys])
+        self.spouse = array('l', [self.position.get(key, NO_NODE) if key else NO_NODE for key in self.spouse_keys])
+        self.generation = array('q', [
+            member.get('generation') if type(member.get('generation')) is int else NO_GENERATION
+            for member in members
+        ])
+        self.gender = bytearray(GENDER_CODES.get(member.get('gender'), 0) for member in members)
+
+        self.image_ids = [None] * count
+        self.images = {}
+        if keep_images:
+            for i, member in enumerate(members):
+                image = member.get('profileImage')
+                image_id = profile_image_id(image)
+                if image_id:
+                    self.image_ids[i] = image_id
+                    self.images.setdefault(image_id, image)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def node(self, member_id: Any) -> int:
+        """Node of an id, NO_NODE if the id is not a member."""
+        return self.position.get(member_id, NO_NODE)
+
+    def gender_of(self, i: int) -> Optional[str]:
+        return GENDER_NAMES.get(self.gender[i])
+
+    def generation_of(self, i: int) -> Optional[int]:
+        generation = self.generation[i]
+        return None if generation == NO_GENERATION else generation
+
+    def image_of(self, i: int) -> Optional[str]:
+        """The base64 profile image of node i, looked up by its id."""
+        image_id = self.image_ids[i]
+        return self.images.get(image_id) if image_id else None
+
+    def children_by_parent_key(self, nodes: Optional[Iterable[int]] = None) -> Dict[Any, List[str]]:
+        """{parentId value: [child id, ...]} in node order, over all nodes or the given ones."""
+        children = defaultdict(list)
+        for i in (range(len(self.ids)) if nodes is None else nodes):
+            children[self.parent_keys[i]].append(self.ids[i])
+        return children
+
+    def married_to(self) -> Dict[Any, List[str]]:
+        """{spouse value: [id of every node naming it as spouse, ...]} in node order."""
+        married = defaultdict(list)
+        for i, spouse_key in enumerate(self.spouse_keys):
+            if spouse_key:
+                married[spouse_key].append(self.ids[i])
+        return married
+
+    def last_nodes(self) -> List[int]:
+        """Nodes that win for their id, in the order a {id: member} dict iterates them."""
+        return list(self.position.values())
@@ -1,6 +1,33 @@
-from typing import List, Dict, Any
+from collections import defaultdict
+from typing import List, Dict, Optional, Set, Tuple, Any
+from relationship_cache import relationship_cache, family_tree_version
+from family_tree_email_index import add_family_members_listener
 
-def determine_relationship(member: Dict[str, Any], target_node: Dict[str, Any], members_dict: Dict[str, Dict[str, Any]]) -> str:
+class FamilyMembersIndex:
+    """
+    Lookups shared by the relationship functions of this module, built once
+    per tree: members by id, children by parentId and the members that
+    name a node as their spouse. With it a node's related nodes cost the
+    size of the result instead of scans over every member.
+    """
+
+    def __init__(self, family_members: List[Dict[str, Any]]):
+        self.members = {member.get('id'): member for member in family_members}
+        self.children = defaultdict(list)
+        self.married_to = defaultdict(list)
+        for member_id, member in self.members.items():
+            self.children[member.get('parentId')].append(member_id)
+            if member.get('spouse'):
+                self.married_to[member['spouse']].append(member_id)
+
+    def children_of(self, parent_id: Optional[str]) -> List[str]:
+        return self.children.get(parent_id, [])
+
+    def spouses_of(self, member_id: Optional[str]) -> List[str]:
+        return self.married_to.get(member_id, [])
+
+def determine_relationship(member: Dict[str, Any], target_node: Dict[str, Any], members_dict: Dict[str, Dict[str, Any]],
+                           index: Optional[FamilyMembersIndex] = None) -> str:
     """
     Determine the relationship between a member and the target node.
     
@@ -8,10 +35,14 @@ def determine_relationship(member: Dict[str, Any], target_node: Dict[str, Any],
         member (Dict[str, Any]): The family member to determine relationship for
         target_node (Dict[str, Any]): The central node
         members_dict (Dict[str, Dict[str, Any]]): Dictionary of all family members
+        index (FamilyMembersIndex, optional): Index of the same members, built if omitted
         
     Returns:
         str: The relationship label
     """
+    if index is None:
+        index = FamilyMembersIndex(list(members_dict.values()))
+
     # First check if member is the target node itself
     if member.get('id') == target_node.get('id'):
         return "Myself"
@@ -51,28 +82,28 @@ def determine_relationship(member: Dict[str, Any], target_node: Dict[str, Any],
     
     # Check if member is sibling (shares same parent)
     target_parent_id = target_node.get('parentId')
-    print("target_parent_id",target_parent_id,"member_parent_id",member.get('parentId'))
     if target_parent_id and member.get('parentId') == target_parent_id and member.get('id') != target_node.get('id'):
         gender = member.get('gender', '').lower()
         return "Brother" if gender == 'male' else "Sister"
     
     # Check if member is sibling's spouse
     if target_parent_id:
-        for potential_sibling_id, potential_sibling in members_dict.items():
+        for potential_sibling_id in index.spouses_of(member.get('id')):
+            potential_sibling = members_dict[potential_sibling_id]
             if (potential_sibling.get('parentId') == target_parent_id and 
-                potential_sibling.get('id') != target_node.get('id') and 
-                potential_sibling.get('spouse') == member.get('id')):
+                potential_sibling.get('id') != target_node.get('id')):
                 gender = member.get('gender', '').lower()
                 return "Brother-in-law" if gender == 'male' else "Sister-in-law"
     
     # Check if member is sibling's child (niece/nephew)
     if target_parent_id:
-        for potential_sibling_id, potential_sibling in members_dict.items():
-            if (potential_sibling.get('parentId') == target_parent_id and 
-                potential_sibling.get('id') != target_node.get('id') and 
-                member.get('parentId') == potential_sibling.get('id')):
-                gender = member.get('gender', '').lower()
-                return "Nephew" if gender == 'male' else "Niece"
+        potential_sibling = members_dict.get(member.get('parentId'))
+        if (potential_sibling and
+            potential_sibling.get('parentId') == target_parent_id and 
+            potential_sibling.get('id') != target_node.get('id') and 
+            member.get('parentId') == potential_sibling.get('id')):
+            gender = member.get('gender', '').lower()
+            return "Nephew" if gender == 'male' else "Niece"
     
     # Check if parent's sibling (aunt/uncle)
     if target_parent_id and target_parent_id in members_dict:
@@ -87,16 +118,18 @@ def determine_relationship(member: Dict[str, Any], target_node: Dict[str, Any],
         parent = members_dict[target_parent_id]
         parent_parent_id = parent.get('parentId')
         if parent_parent_id:
-            for potential_uncle_id, potential_uncle in members_dict.items():
-                if (potential_uncle.get('parentId') == parent_parent_id and 
-                    potential_uncle.get('id') != parent.get('id') and 
-                    member.get('parentId') == potential_uncle.get('id')):
-                    return "Cousin"
+            potential_uncle = members_dict.get(member.get('parentId'))
+            if (potential_uncle and
+                potential_uncle.get('parentId') == parent_parent_id and 
+                potential_uncle.get('id') != parent.get('id') and 
+                member.get('parentId') == potential_uncle.get('id')):
+                return "Cousin"
     
     # Default
     return "Relative"
 
-def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str) -> List[Dict[str, Any]]:
+def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str,
+                      index: Optional[FamilyMembersIndex] = None) -> List[Dict[str, Any]]:
     """
     Get related nodes for a specific node in a family tree.
     Returns a unified family tree structure containing parents, siblings, siblings' spouses and children,
@@ -105,12 +138,15 @@ def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str) -> Lis
     Args:
         family_members (List[Dict[str, Any]]): List of family tree members
         node_id (str): ID of the node to find related members for
+        index (FamilyMembersIndex, optional): Index of family_members, built if omitted
         
     Returns:
         List[Dict[str, Any]]: List of related nodes in a unified family tree structure with relationship labels
     """
-    # Create a dictionary for quick lookup
-    members_dict = {member.get('id'): member for member in family_members}
+    # Lookups by id, parent and spouse
+    if index is None:
+        index = FamilyMembersIndex(family_members)
+    members_dict = index.members
     
     # Get the target node
     target_node = members_dict.get(node_id)
@@ -133,25 +169,22 @@ def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str) -> Lis
     
     # Get siblings (nodes with same parent)
     if parent_id:
-        for member_id, member in members_dict.items():
+        for member_id in index.children_of(parent_id):
             # Skip self
             if member_id == node_id:
                 continue
                 
-            # Check if this is a sibling (has same parent)
-            if member.get('parentId') == parent_id:
-                # Add sibling
-                related_node_ids.add(member_id)
-                
-                # Add sibling's spouse
-                sibling_spouse_id = member.get('spouse')
-                if sibling_spouse_id and sibling_spouse_id in members_dict:
-                    related_node_ids.add(sibling_spouse_id)
-                
-                # Add sibling's children (nieces/nephews)
-                for potential_child_id, potential_child in members_dict.items():
-                    if potential_child.get('parentId') == member_id:
-                        related_node_ids.add(potential_child_id)
+            # Add sibling
+            member = members_dict[member_id]
+            related_node_ids.add(member_id)
+            
+            # Add sibling's spouse
+            sibling_spouse_id = member.get('spouse')
+            if sibling_spouse_id and sibling_spouse_id in members_dict:
+                related_node_ids.add(sibling_spouse_id)
+            
+            # Add sibling's children (nieces/nephews)
+            related_node_ids.update(index.children_of(member_id))
     
     # Add spouse
     spouse_id = target_node.get('spouse')
@@ -171,14 +204,13 @@ def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str) -> Lis
                 related_node_ids.add(spouse_parent_spouse_id)
     
     # Add children
-    for member_id, member in members_dict.items():
-        if member.get('parentId') == node_id:
-            related_node_ids.add(member_id)
-            
-            # Add children's spouses
-            child_spouse_id = member.get('spouse')
-            if child_spouse_id and child_spouse_id in members_dict:
-                related_node_ids.add(child_spouse_id)
+    for member_id in index.children_of(node_id):
+        related_node_ids.add(member_id)
+        
+        # Add children's spouses
+        child_spouse_id = members_dict[member_id].get('spouse')
+        if child_spouse_id and child_spouse_id in members_dict:
+            related_node_ids.add(child_spouse_id)
     
     # Convert set of IDs to list of nodes with relationship labels
     related_nodes = []
@@ -188,7 +220,7 @@ def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str) -> Lis
             member = members_dict[node_id_rel].copy()
             
             # Determine relationship to the target node
-            relation = determine_relationship(member, target_node, members_dict)
+            relation = determine_relationship(member, target_node, members_dict, index)
             
             # Add relationship attributes
             member['relation'] = relation
@@ -225,6 +257,65 @@ def get_related_nodes(family_members: List[Dict[str, Any]], node_id: str) -> Lis
     
     return related_nodes
 
+def related_nodes_dependencies(family_members: List[Dict[str, Any]], node_id: str,
+                               related_nodes: List[Dict[str, Any]],
+                               index: Optional[FamilyMembersIndex] = None) -> Set[str]:
+    """
+    Ids of the members the related nodes view of node_id was computed from.
+
+    Besides the nodes in the view this is the node itself, its parent and
+    grandparent, whose lists of children decide who is a sibling, uncle or
+    cousin, and the spouse of every node in the view. A write that touches
+    none of these ids, nor their children, leaves the view unchanged.
+    """
+    members_dict = index.members if index is not None else {member.get('id'): member for member in family_members}
+    dependencies = {node_id}
+    target_node = members_dict.get(node_id)
+    if target_node:
+        parent_id = target_node.get('parentId')
+        if parent_id:
+            dependencies.add(parent_id)
+            grandparent_id = (members_dict.get(parent_id) or {}).get('parentId')
+            if grandparent_id:
+                dependencies.add(grandparent_id)
+    for node in related_nodes:
+        dependencies.add(node.get('id'))
+        if node.get('spouse'):
+            dependencies.add(node['spouse'])
+    dependencies.discard(None)
+    return dependencies
+
+# Keys get_related_nodes adds to the member copies, the only part of a view that is cached
+VIEW_KEYS = ('id', 'relation', 'isSelf', 'spouseName')
+
+def _extended_family_view(family_members: List[Dict[str, Any]], node_id: str,
+                          index: Optional[FamilyMembersIndex] = None) -> Tuple[List[Dict[str, Any]], Set[str]]:
+    """
+    Related nodes of node_id reduced to VIEW_KEYS, together with the member
+    ids they depend on. Member details such as profile images are not
+    cached, materialize_view reads them from the current familyMembers.
+    """
+    if index is None:
+        index = FamilyMembersIndex(family_members)
+    related_nodes = get_related_nodes(family_members, node_id, index)
+    view = [{key: node[key] for key in VIEW_KEYS if key in node} for node in related_nodes]
+    return view, related_nodes_dependencies(family_members, node_id, related_nodes, index)
+
+def materialize_view(family_members: List[Dict[str, Any]], view: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Related nodes of a cached view: copies of the current members with the view's labels."""
+    members_dict = {member.get('id'): member for member in family_members}
+    return [{**members_dict.get(node['id'], {}), **node} for node in view]
+
+def _extended_family_views(family_members: List[Dict[str, Any]],
+                           node_ids: List[str]) -> Dict[str, Tuple[List[Dict[str, Any]], Set[str]]]:
+    """Views of several nodes of one tree, sharing a single index."""
+    index = FamilyMembersIndex(family_members)
+    return {node_id: _extended_family_view(family_members, node_id, index) for node_id in node_ids}
+
+# Cached views are carried over or recomputed after every familyMembers write
+relationship_cache.register_recompute('extended_family', _extended_family_views)
+add_family_members_listener(relationship_cache.apply_family_members_write)
+
 def get_extended_family(family_tree_id: str, node_id: str, db=None) -> List[Dict[str, Any]]:
     """
     Get extended family for a specific node in a family tree from Firestore.
@@ -253,121 +344,16 @@ def get_extended_family(family_tree_id: str, node_id: str, db=None) -> List[Dict
         tree_data = tree_doc.to_dict()
         family_members = tree_data.get('familyMembers', [])
         
-        # Create a dictionary for quick lookup
-        members_dict = {member.get('id'): member for member in family_members}
-        
-        # Get the target node
-        target_node = members_dict.get(node_id)
-        if not target_node:
-            return []
-        
-        # Create a set to track related node IDs
-        related_node_ids = set()
-        
-        # Get parent ID
-        parent_id = target_node.get('parentId')
-        if parent_id and parent_id in members_dict:
-            related_node_ids.add(parent_id)
-            
-            # Add parent's spouse
-            parent = members_dict[parent_id]
-            parent_spouse_id = parent.get('spouse')
-            if parent_spouse_id and parent_spouse_id in members_dict:
-                related_node_ids.add(parent_spouse_id)
-        
-        # Get siblings (nodes with same parent)
-        if parent_id:
-            for member_id, member in members_dict.items():
-                # Skip self
-                if member_id == node_id:
-                    continue
-                    
-                # Check if this is a sibling (has same parent)
-                if member.get('parentId') == parent_id:
-                    # Add sibling
-                    related_node_ids.add(member_id)
-                    
-                    # Add sibling's spouse
-                    sibling_spouse_id = member.get('spouse')
-                    if sibling_spouse_id and sibling_spouse_id in members_dict:
-                        related_node_ids.add(sibling_spouse_id)
-                    
-                    # Add sibling's children (nieces/nephews)
-                    for potential_child_id, potential_child in members_dict.items():
-                        if potential_child.get('parentId') == member_id:
-                            related_node_ids.add(potential_child_id)
-        
-        # Add spouse
-        spouse_id = target_node.get('spouse')
-        if spouse_id and spouse_id in members_dict:
-            related_node_ids.add(spouse_id)
-            
-            # Add spouse's parents
-            spouse = members_dict[spouse_id]
-            spouse_parent_id = spouse.get('parentId')
-            if spouse_parent_id and spouse_parent_id in members_dict:
-                related_node_ids.add(spouse_parent_id)
-                
-                # Add spouse's parent's spouse
-                spouse_parent = members_dict[spouse_parent_id]
-                spouse_parent_spouse_id = spouse_parent.get('spouse')
-                if spouse_parent_spouse_id and spouse_parent_spouse_id in members_dict:
-                    related_node_ids.add(spouse_parent_spouse_id)
-        
-        # Add children
-        for member_id, member in members_dict.items():
-            if member.get('parentId') == node_id:
-                related_node_ids.add(member_id)
-                
-                # Add children's spouses
-                child_spouse_id = member.get('spouse')
-                if child_spouse_id and child_spouse_id in members_dict:
-                    related_node_ids.add(child_spouse_id)
-        
-        # Convert set of IDs to list of nodes with relationship labels
-        related_nodes = []
-        for node_id_rel in related_node_ids:
-            if node_id_rel in members_dict:
-                # Create a copy of the member to avoid modifying the original
-                member = members_dict[node_id_rel].copy()
-                
-                # Determine relationship to the target node
-                relation = determine_relationship(member, target_node, members_dict)
-                
-                # Add relationship attributes
-                member['relation'] = relation
-                member['isSelf'] = False
-                
-                # Ensure spouse reference is preserved
-                spouse_node_id = member.get('spouse')
-                if spouse_node_id:
-                    member['spouse'] = spouse_node_id
-                    
-                    # If spouse exists in our data, add spouse's name for convenience
-                    if spouse_node_id in members_dict:
-                        spouse_name = members_dict[spouse_node_id].get('name')
-                        if spouse_name:
-                            member['spouseName'] = spouse_name
-                
-                related_nodes.append(member)
-        
-        # Include the target node itself
-        if node_id in members_dict:
-            self_node = members_dict[node_id].copy()
-            self_node['relation'] = "Myself"
-            self_node['isSelf'] = True
-            
-            # Ensure spouse reference is preserved for self node too
-            spouse_node_id = self_node.get('spouse')
-            if spouse_node_id:
-                if spouse_node_id in members_dict:
-                    spouse_name = members_dict[spouse_node_id].get('name')
-                    if spouse_name:
-                        self_node['spouseName'] = spouse_name
-            
-            related_nodes.append(self_node)
+        # Labels only change with the relationship fields, which change the version
+        version = family_tree_version(family_members)
+        view = relationship_cache.get('extended_family', family_tree_id, version, node_id)
+        if view is None:
+            view, dependencies = _extended_family_view(family_members, node_id)
+            relationship_cache.put('extended_family', family_tree_id, version, node_id,
+                                   view, dependencies, family_members)
         
-        return related_nodes
+        # New copies, so callers never modify the cached view
+        return materialize_view(family_members, view)
         
     except Exception as e:
         return [] 
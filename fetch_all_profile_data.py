@@ -5,6 +5,7 @@ import uuid
 import os
 import logging
 from werkzeug.utils import secure_filename
+from profile_snapshot import profile_snapshot
 
 
 logging.basicConfig(level=logging.INFO)
@@ -23,13 +24,15 @@ def fetch_all_profile_data(email, user_profiles_ref):
         # Fetch profile from Firebase
         if not user_profiles_ref:
             logger.warning("Development mode - returning mock profile data")
+            # Fill the basic fields from the process-wide profile snapshot if it has them
+            cached_profile = profile_snapshot.peek(email) or {}
             return {
-                "firstName": "",
-                "lastName": "",
+                "firstName": cached_profile.get('firstName') or "",
+                "lastName": cached_profile.get('lastName') or "",
                 "email": email,
-                "phone": "",
+                "phone": cached_profile.get('phone') or "",
                 "dob": "",
-                "gender": "",
+                "gender": cached_profile.get('GENDER') or "",
                 "caste": "",
                 "maritalStatus": "",
                 "profileImage": None,  # Mock data has no image
@@ -59,6 +62,8 @@ def fetch_all_profile_data(email, user_profiles_ref):
         
         # Get user data
         user_data = user_doc.to_dict()
+        # Hand the fresh document to the profile snapshot so search sees it without a sync
+        profile_snapshot.observe(email, user_data)
         
         # Fetch profile image
         current_image_id = user_data.get('currentProfileImageId')
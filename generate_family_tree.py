@@ -12,11 +12,24 @@ from PIL import Image,  ImageDraw
 import requests
 from io import BytesIO
 import pathlib
+from collections import deque
+import hashlib
+import json
+from family_tree_model import profile_image_id
+from render_cache import render_cache
+from tree_render import render_workspace, render_png, save_dot_source
+from avatar_cache import avatar_cache, avatar_key, thumbnail_png, default_avatar_png, DEFAULT_AVATAR_KEY
+
+# Bump whenever the drawing changes so cached images are not served for it
+FAMILY_TREE_RENDER_VERSION = 1
 
 def build_family_graph(family_data):
     """Build a directed graph representing family relationships."""
     # Create a graph where nodes are family members and edges represent relationships
     graph = {}
+    members_by_id = {}
+    for member in family_data:
+        members_by_id.setdefault(member['id'], member)
     for member in family_data:
         member_id = member['id']
         if member_id not in graph:
@@ -26,7 +39,7 @@ def build_family_graph(family_data):
         if member.get('parentId'):
             parent_id = member['parentId']
             if parent_id not in graph:
-                graph[parent_id] = {"member": next((m for m in family_data if m['id'] == parent_id), None), "relations": {}}
+                graph[parent_id] = {"member": members_by_id.get(parent_id), "relations": {}}
             
             # Add bidirectional relationships
             graph[member_id]["relations"][parent_id] = "parent"
@@ -36,7 +49,7 @@ def build_family_graph(family_data):
         if member.get('spouse'):
             spouse_id = member['spouse']
             if spouse_id not in graph:
-                graph[spouse_id] = {"member": next((m for m in family_data if m['id'] == spouse_id), None), "relations": {}}
+                graph[spouse_id] = {"member": members_by_id.get(spouse_id), "relations": {}}
             
             # Add bidirectional relationships
             graph[member_id]["relations"][spouse_id] = "spouse"
@@ -44,28 +57,6 @@ def build_family_graph(family_data):
     
     return graph
 
-def find_shortest_path(graph, start, end, max_depth=10):
-    """Find shortest path between two members in the family graph."""
-    if start == end:
-        return []
-    
-    visited = {start}
-    queue = [(start, [])]
-    
-    while queue and max_depth > 0:
-        current, path = queue.pop(0)
-        max_depth -= 1
-        
-        for neighbor, relation_type in graph[current]["relations"].items():
-            if neighbor == end:
-                return path + [(current, neighbor, relation_type)]
-            
-            if neighbor not in visited:
-                visited.add(neighbor)
-                queue.append((neighbor, path + [(current, neighbor, relation_type)]))
-    
-    return None  # No path found
-
 def determine_relationship(path, graph, self_id):
     """Determine the relationship based on path between self and another member."""
     if not path:
@@ -158,62 +149,155 @@ def determine_relationship(path, graph, self_id):
     
     return "Relative"
 
-def calculate_relation(member, self_id, family_data):
-    """Calculate the relation of a member to the self person based on the tree structure."""
-    if member['id'] == self_id:
-        return "Myself"
-    
-    # Build family graph
+def find_all_paths(graph, start, max_depth=10):
+    """
+    Breadth-first search from start that reaches every member at once.
+
+    Each member keeps a pointer to the (node, relation) it was first
+    discovered from, so its path is one shortest path over the graph's
+    parent, child and spouse edges, rebuilt by walking the pointers back.
+    When several paths are equally short, the one through the neighbour
+    listed first in the graph wins.
+
+    Returns:
+        dict: {member_id: path} for every member within max_depth steps,
+        path being the list of (from, to, relation) tuples from start
+    """
+    if start not in graph:
+        return {}
+
+    parents = {start: None}
+    depth = {start: 0}
+    queue = deque([start])
+
+    while queue:
+        current = queue.popleft()
+        if depth[current] >= max_depth:
+            continue
+        for neighbor, relation_type in graph[current]["relations"].items():
+            if neighbor not in parents:
+                parents[neighbor] = (current, relation_type)
+                depth[neighbor] = depth[current] + 1
+                queue.append(neighbor)
+
+    paths = {start: []}
+    # BFS order guarantees a node's parent path is built before its own
+    for node_id, pointer in parents.items():
+        if pointer is not None:
+            parent_id, relation_type = pointer
+            paths[node_id] = paths[parent_id] + [(parent_id, node_id, relation_type)]
+    return paths
+
+def calculate_all_relations(self_id, family_data, max_depth=10):
+    """
+    Calculate the relation of every member to the self person in one pass.
+
+    Builds the family graph once and runs a single BFS from the self node.
+    Each member is labelled by determine_relationship from the path the
+    BFS first reached them by: a fewest-edges path over parent, child and
+    spouse links. Among equally short paths the one through the neighbour
+    listed first in the graph wins, which may run through a spouse.
+    max_depth bounds the length of that path in edges.
+
+    Returns:
+        dict: {member_id: relation}. Members not connected to self within
+        max_depth edges, or whose path cannot be named, are labelled
+        "Relative".
+    """
     graph = build_family_graph(family_data)
-    
-    # Find shortest path from self to member
-    path = find_shortest_path(graph, self_id, member['id'])
-    
-    # Determine relationship based on path
-    relationship = determine_relationship(path, graph, self_id)
-    
-    return relationship
+    paths = find_all_paths(graph, self_id, max_depth)
+
+    relations = {}
+    for member in family_data:
+        member_id = member['id']
+        path = paths.get(member_id)
+        if path is None:
+            relations[member_id] = "Relative"
+            continue
+        try:
+            relations[member_id] = determine_relationship(path, graph, self_id)
+        except (KeyError, TypeError):
+            # Member without a gender or a path through a dangling id
+            relations[member_id] = "Relative"
+    return relations
 
-def create_profile_image_node(profile_image, member_id):
-    """Create a temporary profile image file from base64 data or use default icon."""
-    temp_dir = tempfile.gettempdir()
-    image_path = os.path.abspath(os.path.join(temp_dir, f'profile_{member_id}.png'))
+def create_profile_image_node(profile_image, member_id, workspace):
+    """Place the cached profile thumbnail, or the default icon, in the render workspace."""
+    image_path = os.path.abspath(os.path.join(workspace, f'profile_{member_id}.png'))
     
     try:
         if profile_image and profile_image.startswith('data:image'):
-            # Extract the base64 data
+            # Decoded and resized once per distinct image, then reused
             base64_data = profile_image.split(',')[1]
-            image_data = base64.b64decode(base64_data)
-            
-            # Convert to PNG and save
-            img = Image.open(BytesIO(image_data))
-            img = img.convert('RGBA')
-            # Resize to a reasonable size (e.g., 100x100)
-            img = img.resize((100, 100), Image.Resampling.LANCZOS)
-            img.save(image_path, 'PNG')
+            avatar_cache.place(avatar_key(profile_image),
+                               lambda: thumbnail_png(base64.b64decode(base64_data)), image_path)
         else:
-            # Create a simple profile icon using PIL
-            img = Image.new('RGBA', (100, 100), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(img)
-            # Draw a circle for the head
-            draw.ellipse([25, 25, 75, 75], fill=(204, 204, 204, 255))
-            # Draw a path for the body
-            draw.polygon([(50, 70), (30, 100), (70, 100)], fill=(204, 204, 204, 255))
-            img.save(image_path, 'PNG')
+            avatar_cache.place(DEFAULT_AVATAR_KEY, default_avatar_png, image_path)
     except Exception as e:
         print(f"Error creating profile image: {e}")
         return None
     
     return image_path
 
-def generate_family_tree(family_data):
+def family_tree_render_key(family_data):
+    """
+    Content hash of everything the tree image depends on: the members in
+    order with their ids, names, relations, gender, self flag, parent and
+    spouse links and a digest of their profile image.
+    """
+    members = [
+        [
+            member.get('id'),
+            member.get('name'),
+            member.get('relation'),
+            member.get('gender'),
+            bool(member.get('isSelf')),
+            member.get('parentId'),
+            member.get('spouse'),
+            profile_image_id(member.get('profileImage')),
+        ]
+        for member in family_data
+    ]
+    payload = json.dumps([FAMILY_TREE_RENDER_VERSION, members], default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+def generate_family_tree(family_data, render_key=None):
+    """
+    Render the family tree as a base64 PNG.
+
+    Images are cached by family_tree_render_key, an identical tree is
+    served from the render cache without running Graphviz.
+
+    Args:
+        family_data: List of family members
+        render_key: family_tree_render_key of family_data, if already computed
+
+    Returns:
+        str: Base64 PNG, or a message starting with "Error:"
+    """
     # Find the self person
     self_person = next((m for m in family_data if m.get('isSelf')), None)
     if not self_person:
         return "Error: No self person found in the family data"
     
     self_id = self_person['id']
-    
+
+    if render_key is None:
+        render_key = family_tree_render_key(family_data)
+    cached_image = render_cache.get(render_key)
+    if cached_image is not None:
+        return base64.b64encode(cached_image).decode('utf-8')
+
+    # Members without a stored relation are labelled from the tree structure
+    computed_relations = {}
+    if any(not m.get('relation') for m in family_data):
+        computed_relations = calculate_all_relations(self_id, family_data)
+
+    with render_workspace('family_tree_') as workspace:
+        return _render_family_tree(family_data, self_id, computed_relations, render_key, workspace)
+
+def _render_family_tree(family_data, self_id, computed_relations, render_key, workspace):
+    """Draw the tree with Graphviz, avatar files go to the private workspace."""
     # Create a Digraph object with enhanced background
     dot = Digraph(
         comment='Family Tree',
@@ -260,7 +344,7 @@ def generate_family_tree(family_data):
             fontcolor = 'white'  # White text for readability
         
         # Create profile image node
-        profile_image_path = create_profile_image_node(member.get('profileImage'), member['id'])
+        profile_image_path = create_profile_image_node(member.get('profileImage'), member['id'], workspace)
         
         # Create a stylized label with name and relation only
         label = f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='10'>"  # Further increased padding
@@ -278,7 +362,8 @@ def generate_family_tree(family_data):
         if member.get('relation'):
             label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>{member['relation']}</FONT></TD></TR>"
         else:
-            label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>Relative</FONT></TD></TR>"
+            relation = computed_relations.get(member['id'], "Relative")
+            label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>{relation}</FONT></TD></TR>"
             
         label += "</TABLE>>"
          
@@ -341,34 +426,13 @@ def generate_family_tree(family_data):
                          style="solid", arrowhead="normal", arrowtail="none", 
                          arrowsize="1.5")
 
-    # Render the graph to PNG
-    temp_dir = tempfile.gettempdir()
-    output_path = os.path.abspath(os.path.join(temp_dir, 'family_tree'))
-    
+    # Render the graph to PNG in memory
     try:
-        # Create the output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Render the graph
-        dot.render(output_path, format='png', cleanup=True)
-        
-        # Read the image and encode it to base64
-        with open(f"{output_path}.png", 'rb') as f:
-            img_data = f.read()
+        img_data = render_png(dot)
         img_base64 = base64.b64encode(img_data).decode('utf-8')
-        
-        # Clean up temporary profile images
-        for member in family_data:
-            temp_image = os.path.join(temp_dir, f'profile_{member["id"]}.png')
-            if os.path.exists(temp_image):
-                try:
-                    os.remove(temp_image)
-                except:
-                    pass
-        
+        render_cache.put(render_key, img_data)
         return img_base64
     except Exception as e:
         # For debugging
-        with open(f"{output_path}.dot", 'w', encoding='utf-8') as f:
-            f.write(dot.source)
-        return f"Error: {str(e)}\nDOT file saved to {output_path}.dot for debugging"
+        dot_path = save_dot_source(dot, 'family_tree')
+        return f"Error: {str(e)}\nDOT file saved to {dot_path} for debugging"
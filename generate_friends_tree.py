@@ -0,0 +1,209 @@
+import os
+import base64
+from graphviz import Digraph
+from tree_render import render_workspace, render_png
+from avatar_cache import avatar_cache, avatar_key, thumbnail_png, default_avatar_png, DEFAULT_AVATAR_KEY
+
+def generate_friends_tree(user_email, user_name, user_profile_image, friends_list):
+    """
+    Generate a tree visualization for a user's friends using the same theme as family tree
+    
+    Args:
+        user_email (str): Email of the user
+        user_name (str): Name of the user
+        user_profile_image (str or bytes): Base64 encoded profile image data or bytes
+        friends_list (list): List of friend nodes
+        
+    Returns:
+        str: Base64 encoded image of the friends tree
+    """
+    # Private directory for the profile images of this render
+    with render_workspace('friends_tree_') as temp_dir:
+        return _render_friends_tree(user_name, user_profile_image, friends_list, temp_dir)
+
+def _render_friends_tree(user_name, user_profile_image, friends_list, temp_dir):
+    """Draw the friends tree with Graphviz, profile images go to the private temp_dir."""
+    # Create a Digraph object with enhanced background (same as family tree)
+    dot = Digraph(
+        comment='Friends Tree',
+        format='png',
+        engine='dot',
+        graph_attr={
+            'rankdir': 'TB',  # Top to bottom direction
+            'splines': 'polyline',  # Use polyline for natural connections
+            'bgcolor': '#FFFFFF',  # Pure white background
+            'nodesep': '1.4',  # Increased node separation
+            'ranksep': '2.0',  # Increased rank separation
+            'fontname': 'Arial',
+            'style': 'rounded',  # Rounded style
+            'color': '#000000',  # Black border color
+            'penwidth': '2.0',  # Border thickness
+        },
+        node_attr={
+            'shape': 'box',
+            'style': 'filled,rounded',
+            'fillcolor': 'white',
+            'fontcolor': 'black',
+            'penwidth': '1.5',
+            'fontsize': '22',
+            'fontname': 'Arial',
+            'height': '1.2',
+            'width': '2.8',
+            'margin': '0.5'
+        },
+        edge_attr={
+            'color': '#444444',
+            'penwidth': '4.0'
+        }
+    )
+
+    def create_profile_image_node(profile_image_data, node_id):
+        """Place the cached profile thumbnail, or the default icon, in the render directory."""
+        image_path = os.path.join(temp_dir, f'friend_profile_{node_id}.png')
+        
+        try:
+            if profile_image_data:
+                # Handle base64 string
+                if isinstance(profile_image_data, str):
+                    if profile_image_data.startswith('data:image'):
+                        # Decoded and resized once per distinct image, then reused
+                        base64_data = profile_image_data.split(',')[1]
+                        return avatar_cache.place(avatar_key(profile_image_data),
+                                                  lambda: thumbnail_png(base64.b64decode(base64_data)), image_path)
+                
+                # Handle bytes directly
+                elif isinstance(profile_image_data, bytes):
+                    return avatar_cache.place(avatar_key(profile_image_data),
+                                              lambda: thumbnail_png(profile_image_data), image_path)
+            
+            # Create default profile icon
+            return avatar_cache.place(DEFAULT_AVATAR_KEY, default_avatar_png, image_path)
+            
+        except Exception as e:
+            print(f"Error creating profile image: {e}")
+            return None
+
+    # Create center node for the user with special styling
+    user_node_id = "user"
+    user_image_path = create_profile_image_node(user_profile_image, user_node_id)
+    
+    # Create a stylized label for the user node
+    user_label = f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='10'>"
+    if user_image_path:
+        image_path = user_image_path.replace('\\', '/')
+        user_label += f"<TR><TD ROWSPAN='2'><IMG SRC='{image_path}' SCALE='TRUE' FIXEDSIZE='TRUE' WIDTH='90' HEIGHT='90'/></TD>"
+    else:
+        user_label += "<TR><TD ROWSPAN='2'><FONT POINT-SIZE='50'>👤</FONT></TD>"
+    
+    # Add name with larger font
+    user_label += f"<TD ALIGN='LEFT'><FONT POINT-SIZE='35'><B>{user_name}</B></FONT></TD></TR>"
+    user_label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>Myself</FONT></TD></TR>"
+    user_label += "</TABLE>>"
+    
+    # Add user node with special styling
+    dot.node(
+        user_node_id,
+        label=user_label,
+        fillcolor='#00a3ee',  # Special blue color for self node
+        fontcolor='white',
+        style='filled,rounded',
+        penwidth='1.5'
+    )
+
+    # Group friends by category
+    friend_categories = {}
+    for friend in friends_list:
+        category = friend.get('category', 'Other')
+        if category not in friend_categories:
+            friend_categories[category] = []
+        friend_categories[category].append(friend)
+
+    # Category colors (using a softer palette)
+    category_colors = {
+        'Family': '#E8F5E9',  # Soft green
+        'Close Friends': '#E3F2FD',  # Soft blue
+        'Colleagues': '#FFF3E0',  # Soft orange
+        'School': '#F3E5F5',  # Soft purple
+        'Neighbors': '#FFFDE7',  # Soft yellow
+        'Other': '#FAFAFA'  # Light gray
+    }
+
+    # Create a central point for better organization
+    center_point = "center_point"
+    dot.node(center_point, "", shape="point", style="invis")
+    dot.edge(user_node_id, center_point, style="invis")
+
+    # For each category, create a subgraph
+    for category_index, (category, friends) in enumerate(friend_categories.items()):
+        # Create a subgraph for this category
+        with dot.subgraph(name=f'cluster_{category}') as c:
+            c.attr(
+                label=category,
+                style='filled,rounded',
+                fillcolor=category_colors.get(category, '#FAFAFA'),
+                fontname='Arial',
+                fontsize='25',
+                penwidth='2.0'
+            )
+            
+            # Create a chain of nodes for vertical arrangement
+            prev_node_id = None
+            
+            # Add friend nodes in this category
+            for i, friend in enumerate(friends):
+                friend_id = f"friend_{category_index}_{i}"
+                
+                # Create friend profile image
+                friend_image_path = create_profile_image_node(friend.get('profileImage'), friend_id)
+                
+                # Create stylized label for friend node
+                friend_label = f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='10'>"
+                if friend_image_path:
+                    image_path = friend_image_path.replace('\\', '/')
+                    friend_label += f"<TR><TD ROWSPAN='2'><IMG SRC='{image_path}' SCALE='TRUE' FIXEDSIZE='TRUE' WIDTH='90' HEIGHT='90'/></TD>"
+                else:
+                    friend_label += "<TR><TD ROWSPAN='2'><FONT POINT-SIZE='50'>👤</FONT></TD>"
+                
+                # Add name and category
+                friend_label += f"<TD ALIGN='LEFT'><FONT POINT-SIZE='35'><B>{friend.get('name', 'Unknown')}</B></FONT></TD></TR>"
+                friend_label += f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='31'>{category}</FONT></TD></TR>"
+                friend_label += "</TABLE>>"
+                
+                # Add friend node
+                c.node(
+                    friend_id,
+                    label=friend_label,
+                    fillcolor='white',
+                    style='filled,rounded',
+                    penwidth='1.5'
+                )
+                
+                # Connect to previous node in the category for vertical arrangement
+                if prev_node_id:
+                    # Add invisible edge to force vertical arrangement
+                    c.edge(prev_node_id, friend_id, style="invis", constraint='true')
+                elif i == 0:
+                    # Connect first node of category to center point
+                    dot.edge(center_point, friend_id, 
+                        color='#444444',
+                        penwidth='4.0',
+                        arrowhead='none'
+                    )
+                
+                # Update previous node ID for next iteration
+                prev_node_id = friend_id
+                
+            # Force all nodes in this category to be arranged vertically
+            c.attr(rankdir='TB')  # Top to bottom arrangement within category
+            if len(friends) > 1:
+                c.attr(rank='same')  # Ensure nodes in same category stay together
+
+    # Render the graph to PNG in memory
+    try:
+        img_data = render_png(dot)
+        img_base64 = base64.b64encode(img_data).decode('utf-8')
+        return img_base64
+        
+    except Exception as e:
+        print(f"Error generating friends tree: {e}")
+        return None
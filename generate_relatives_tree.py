@@ -4,6 +4,8 @@ import base64
 import io
 from graphviz import Digraph
 from PIL import Image, ImageDraw
+from tree_render import render_workspace, render_png, save_dot_source
+from avatar_cache import avatar_cache, avatar_key, thumbnail_png, default_avatar_png, DEFAULT_AVATAR_KEY
 
 def generate_relatives_tree(relatives_data):
     """
@@ -31,7 +33,12 @@ def generate_relatives_tree(relatives_data):
         return "Error: No self person found in the relatives data"
     
     self_id = self_person['id']
-    
+
+    with render_workspace('relatives_tree_') as workspace:
+        return _render_relatives_tree(relatives_list, workspace)
+
+def _render_relatives_tree(relatives_list, workspace):
+    """Draw the relatives tree with Graphviz, avatar files go to the private workspace."""
     # Create a Digraph object with enhanced background
     dot = Digraph(
         comment='Relatives Tree',
@@ -67,36 +74,21 @@ def generate_relatives_tree(relatives_data):
     )
 
     def create_profile_image_node(profile_image, member_id):
-        """Create a temporary profile image file from URL, base64 data, or use default icon."""
-        temp_dir = tempfile.gettempdir()
-        image_path = os.path.abspath(os.path.join(temp_dir, f'profile_{member_id}.png'))
+        """Place the cached profile thumbnail, or the default icon, in the render workspace."""
+        image_path = os.path.abspath(os.path.join(workspace, f'profile_{member_id}.png'))
         
         try:
-            if profile_image and isinstance(profile_image, str):
-                if profile_image.startswith('data:image/'):
-                    try:
-                        header, encoded = profile_image.split(',', 1)
-                        img_data = base64.b64decode(encoded)
-                        img = Image.open(io.BytesIO(img_data))
-                        img = img.resize((100, 100))
-                        img.save(image_path, 'PNG')
-                        return image_path
-                    except Exception as e:
-                        print(f"Error processing base64 image: {e}")
-                elif profile_image.startswith('http'):
-                    img = Image.new('RGBA', (100, 100), (255, 255, 255, 0))
-                    draw = ImageDraw.Draw(img)
-                    draw.ellipse([25, 25, 75, 75], fill=(204, 204, 204, 255))
-                    draw.polygon([(50, 70), (30, 100), (70, 100)], fill=(204, 204, 204, 255))
-                    img.save(image_path, 'PNG')
-                    return image_path
+            if profile_image and isinstance(profile_image, str) and profile_image.startswith('data:image/'):
+                try:
+                    # Decoded and resized once per distinct image, then reused
+                    header, encoded = profile_image.split(',', 1)
+                    return avatar_cache.place(avatar_key(profile_image),
+                                              lambda: thumbnail_png(base64.b64decode(encoded)), image_path)
+                except Exception as e:
+                    print(f"Error processing base64 image: {e}")
             
-            # Default placeholder image
-            img = Image.new('RGBA', (100, 100), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(img)
-            draw.ellipse([25, 25, 75, 75], fill=(204, 204, 204, 255))
-            draw.polygon([(50, 70), (30, 100), (70, 100)], fill=(204, 204, 204, 255))
-            img.save(image_path, 'PNG')
+            # Default placeholder image, also used for image URLs
+            avatar_cache.place(DEFAULT_AVATAR_KEY, default_avatar_png, image_path)
             
         except Exception as e:
             print(f"Error creating profile image: {e}")
@@ -211,37 +203,14 @@ def generate_relatives_tree(relatives_data):
             for member_id in members:
                 c.node(member_id)
 
-    # Render the graph to PNG
-    temp_dir = tempfile.gettempdir()
-    output_path = os.path.abspath(os.path.join(temp_dir, 'relatives_tree'))
-    
+    # Render the graph to PNG in memory
     try:
-        # Create the output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Render the graph
-        dot.render(output_path, format='png', cleanup=True)
-        
-        # Read the image and encode it to base64
-        with open(f"{output_path}.png", 'rb') as f:
-            img_data = f.read()
+        img_data = render_png(dot)
         img_base64 = base64.b64encode(img_data).decode('utf-8')
-        
-        # Clean up temporary profile images
-        for member in relatives_list:
-            member_id = str(member['id'])
-            temp_image = os.path.join(temp_dir, f'profile_{member_id}.png')
-            if os.path.exists(temp_image):
-                try:
-                    os.remove(temp_image)
-                except:
-                    pass
-        
         return img_base64
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         # For debugging
-        with open(f"{output_path}.dot", 'w', encoding='utf-8') as f:
-            f.write(dot.source)
-        return f"Error: {str(e)}\nDetails: {error_details}\nDOT file saved to {output_path}.dot for debugging"
+        dot_path = save_dot_source(dot, 'relatives_tree')
+        return f"Error: {str(e)}\nDetails: {error_details}\nDOT file saved to {dot_path} for debugging"
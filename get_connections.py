@@ -1,7 +1,8 @@
 from typing import Dict, List, Any
 from firebase_admin import firestore
-from build_family_relationships import build_family_relationships
+from build_family_relationships import compute_relationship_labels, label_family_members
 from family_tree_relations import get_extended_family
+from relationship_cache import relationship_cache, family_tree_version
 import logging
 
 # Configure logging
@@ -64,8 +65,12 @@ def get_user_connections(email: str) -> Dict[str, List[Dict[str, Any]]]:
                     else:
                         member['isSelf'] = False
                 
-                # Build family relationships for all members first
-                family_members = build_family_relationships(family_members)
+                # Build family relationships for all members first. Only the labels are
+                # cached, per tree version and user, not the members and their images
+                labels = relationship_cache.get_or_compute(
+                    'connections', family_tree_id, family_tree_version(family_members), email,
+                    lambda: compute_relationship_labels(family_members))
+                family_members = label_family_members(family_members, labels)
                 logger.info("Built family relationships for all members")
                 
                 # Process family members first
@@ -0,0 +1,565 @@
+import logging
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional, Tuple, Any
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_ORDINALS = ["First", "Second", "Third", "Fourth", "Fifth", "Sixth", "Seventh", "Eighth", "Ninth", "Tenth"]
+_REMOVALS = {1: "Once Removed", 2: "Twice Removed"}
+
+# Members whose closest lines to every unit are kept, in trees where paths differ in length
+VIEWER_CACHE_SIZE = 8
+
+
+def _gendered(gender: str, male: str, female: str, neutral: str) -> str:
+    if gender == 'male':
+        return male
+    if gender == 'female':
+        return female
+    return neutral
+
+
+def _great(count: int) -> str:
+    """Repeat the "Great-" prefix count times."""
+    return "Great-" * count
+
+
+def kinship_label(generations_up: int, generations_down: int, gender: str) -> str:
+    """
+    Name a blood relation from its distance to the common ancestor.
+
+    Args:
+        generations_up: Steps from the viewer up to the common ancestor
+        generations_down: Steps from the common ancestor down to the relative
+        gender: Gender of the relative ('male', 'female' or anything else)
+
+    Returns:
+        str: Relationship label of the relative as seen by the viewer
+    """
+    up, down = generations_up, generations_down
+    if up == 0 and down == 0:
+        return "Myself"
+
+    # Direct ancestors
+    if down == 0:
+        if up == 1:
+            return _gendered(gender, "Father", "Mother", "Parent")
+        base = _gendered(gender, "Grandfather", "Grandmother", "Grandparent")
+        return _great(up - 2) + base
+
+    # Direct descendants
+    if up == 0:
+        if down == 1:
+            return _gendered(gender, "Son", "Daughter", "Child")
+        base = _gendered(gender, "Grandson", "Granddaughter", "Grandchild")
+        return _great(down - 2) + base
+
+    if up == 1 and down == 1:
+        return _gendered(gender, "Brother", "Sister", "Sibling")
+
+    # Siblings' descendants
+    if up == 1:
+        base = _gendered(gender, "Nephew", "Niece", "Nibling")
+        if down == 2:
+            return base
+        return _great(down - 3) + "Grand-" + base.lower()
+
+    # Ancestors' siblings
+    if down == 1:
+        base = _gendered(gender, "Uncle", "Aunt", "Parent's Sibling")
+        if up == 2:
+            return base
+        return _great(up - 2) + base.lower()
+
+    degree = min(up, down) - 1
+    removal = abs(up - down)
+    if degree == 1 and removal == 0:
+        return "Cousin"
+    ordinal = _ORDINALS[degree - 1] if degree <= len(_ORDINALS) else f"{degree}th"
+    label = f"{ordinal} Cousin"
+    if removal:
+        label += " " + _REMOVALS.get(removal, f"{removal} Times Removed")
+    return label
+
+
+class KinshipIndex:
+    """
+    Ancestor tables over the family units of one family tree.
+
+    A member and their spouse form one family unit, and the children of
+    either partner hang below it, so a member reaches both parents' sides
+    whichever partner their parentId names, at any height. Every unit gets
+    a depth and a binary lifting table (the 2^k-th ancestor for every k),
+    so the lowest common ancestor of two units is found in O(log n) and
+    the relation between two members follows from their distances to it.
+
+    The tree edge of a unit goes to the parent unit of its first partner
+    with a parent in the tree. When the other partner has parents in the
+    tree too, that side is kept as a secondary parent, and members below
+    the unit also look for common ancestors from there. Members with no
+    secondary parent above them are answered from the lifting tables
+    alone. Otherwise all parent sides form a DAG of units: when every path
+    between two units has the same length, per-unit ancestor bitsets give
+    the closest common ancestor in one AND; when they do not, the closest
+    lines from the viewer to every unit are computed once per viewer.
+    """
+
+    def __init__(self, family_members: List[Dict[str, Any]]):
+        self.ids = []
+        self.members = {}
+        for member in family_members or []:
+            member_id = member.get('id') if isinstance(member, dict) else None
+            if member_id and member_id not in self.members:
+                self.members[member_id] = member
+                self.ids.append(member_id)
+
+        spouse_of = {}
+        for member_id in self.ids:
+            spouse_id = self.members[member_id].get('spouse')
+            if spouse_id in self.members and spouse_id != member_id:
+                spouse_of.setdefault(member_id, spouse_id)
+                spouse_of.setdefault(spouse_id, member_id)
+
+        # Family units: a member and their spouse, in member order
+        self.unit_of = {}
+        self.units = []
+        for member_id in self.ids:
+            if member_id in self.unit_of:
+                continue
+            unit_members = [member_id]
+            partner_id = spouse_of.get(member_id)
+            if partner_id is not None and partner_id not in self.unit_of and spouse_of.get(partner_id) == member_id:
+                unit_members.append(partner_id)
+            for unit_member_id in unit_members:
+                self.unit_of[unit_member_id] = len(self.units)
+            self.units.append(unit_members)
+
+        # Parent units through each partner's parentId, the first one is the tree edge
+        unit_parents = [[] for _ in self.units]
+        for unit, unit_members in enumerate(self.units):
+            for member_id in unit_members:
+                parent_unit = self.unit_of.get(self.members[member_id].get('parentId'))
+                if parent_unit is not None and parent_unit != unit and parent_unit not in unit_parents[unit]:
+                    unit_parents[unit].append(parent_unit)
+        parent = [parents[0] if parents else -1 for parents in unit_parents]
+        self._cut_cycles(parent)
+        self.parent = parent
+        self.depth, order = self._compute_depths(parent)
+
+        # up[k][v] is the 2^k-th ancestor of v, roots point to themselves
+        self.up = [[p if p != -1 else v for v, p in enumerate(parent)]]
+        for _ in range(1, max(1, len(self.units).bit_length())):
+            previous = self.up[-1]
+            self.up.append([previous[previous[v]] for v in range(len(self.units))])
+
+        # Other parent sides, without links back into the unit's own subtree
+        self.secondary = {}
+        for unit, parents in enumerate(unit_parents):
+            others = [p for p in parents if p != parent[unit] and not self._is_ancestor(unit, p)]
+            if others:
+                self.secondary[unit] = others
+        self._dag_parents, self._dag_order = self._build_dag()
+        # Nearest ancestor-or-self of every unit that has a secondary parent
+        self._branch = [-1] * len(self.units)
+        for unit in order:
+            if unit in self.secondary:
+                self._branch[unit] = unit
+            elif parent[unit] != -1:
+                self._branch[unit] = self._branch[parent[unit]]
+        self.level, self._graded = self._compute_levels()
+        self._ancestor_bits = None
+        self._viewers = OrderedDict()
+
+    def _build_dag(self) -> Tuple[List[List[int]], List[int]]:
+        """
+        Parent units of every unit, the tree edge first and then the other
+        parent sides, and the units in an order with parents first. Other
+        parent sides that still close a cycle (corrupt data) are dropped.
+        """
+        count = len(self.units)
+        dag_parents = [([p] if p != -1 else []) + self.secondary.get(unit, []) for unit, p in enumerate(self.parent)]
+        children = [[] for _ in range(count)]
+        for unit, parents in enumerate(dag_parents):
+            for parent_unit in parents:
+                children[parent_unit].append(unit)
+        pending = [len(parents) for parents in dag_parents]
+        placed = [False] * count
+        order = [unit for unit in range(count) if not pending[unit]]
+        next_unit = 0
+        while True:
+            while next_unit < len(order):
+                unit = order[next_unit]
+                placed[unit] = True
+                for child in children[unit]:
+                    pending[child] -= 1
+                    if not pending[child]:
+                        order.append(child)
+                next_unit += 1
+            if len(order) == count:
+                return dag_parents, order
+            # Tree edges are acyclic, so an unplaced other parent side closes the cycle
+            unit, parent_unit = next((unit, p) for unit in range(count) if not placed[unit] and pending[unit]
+                                     for p in self.secondary.get(unit, ()) if not placed[p])
+            dag_parents[unit].remove(parent_unit)
+            self.secondary[unit].remove(parent_unit)
+            if not self.secondary[unit]:
+                del self.secondary[unit]
+            children[parent_unit].remove(unit)
+            pending[unit] -= 1
+            if not pending[unit]:
+                order.append(unit)
+
+    def _compute_levels(self) -> Tuple[List[int], bool]:
+        """
+        Generation of every unit relative to the others of its component,
+        each parent unit one above its child units, and whether that
+        numbering is consistent for every edge. It is unless two lines join
+        with different numbers of generations (e.g. a marriage between
+        generations of the same family).
+        """
+        neighbours = [[] for _ in self.units]
+        for unit, parents in enumerate(self._dag_parents):
+            for parent_unit in parents:
+                neighbours[unit].append((parent_unit, -1))
+                neighbours[parent_unit].append((unit, 1))
+        level = [None] * len(self.units)
+        graded = True
+        for start in range(len(self.units)):
+            if level[start] is not None:
+                continue
+            level[start] = 0
+            queue = deque([start])
+            while queue:
+                unit = queue.popleft()
+                for other, step in neighbours[unit]:
+                    if level[other] is None:
+                        level[other] = level[unit] + step
+                        queue.append(other)
+                    elif level[other] != level[unit] + step:
+                        graded = False
+        return level, graded
+
+    @staticmethod
+    def _cut_cycles(parent: List[int]):
+        """Corrupt data: cut the one parent link that closes each cycle, its child becomes a root."""
+        state = [0] * len(parent)  # 0 unseen, 1 on the current walk, 2 done
+        for start in range(len(parent)):
+            path = []
+            node = start
+            while node != -1 and state[node] == 0:
+                state[node] = 1
+                path.append(node)
+                node = parent[node]
+            if node != -1 and state[node] == 1:
+                parent[path[-1]] = -1
+            for node in path:
+                state[node] = 2
+
+    @staticmethod
+    def _compute_depths(parent: List[int]) -> Tuple[List[int], List[int]]:
+        """Depth of every node, assigned top-down from the roots, and the order they were reached in."""
+        children = [[] for _ in parent]
+        queue = deque()
+        for node, parent_node in enumerate(parent):
+            if parent_node == -1:
+                queue.append(node)
+            else:
+                children[parent_node].append(node)
+        depth = [0] * len(parent)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for child in children[node]:
+                depth[child] = depth[node] + 1
+                queue.append(child)
+        return depth, order
+
+    def _ancestor(self, v: int, steps: int) -> int:
+        k = 0
+        while steps:
+            if steps & 1:
+                v = self.up[k][v]
+            steps >>= 1
+            k += 1
+        return v
+
+    def _is_ancestor(self, u: int, v: int) -> bool:
+        """Whether unit u is v or one of its ancestors along tree edges."""
+        return self.depth[v] >= self.depth[u] and self._ancestor(v, self.depth[v] - self.depth[u]) == u
+
+    def _lca(self, a: int, b: int) -> Optional[int]:
+        if self.depth[a] < self.depth[b]:
+            a, b = b, a
+        a = self._ancestor(a, self.depth[a] - self.depth[b])
+        if a == b:
+            return a
+        for k in range(len(self.up) - 1, -1, -1):
+            if self.up[k][a] != self.up[k][b]:
+                a, b = self.up[k][a], self.up[k][b]
+        return self.up[0][a] if self.up[0][a] == self.up[0][b] else None
+
+    def _up_head(self, member_id: str) -> Optional[int]:
+        """
+        The unit a member's blood line goes up through: the parent unit
+        named by their parentId, when it is a parent of their own unit. The
+        own unit only leads down; above it are the ancestors of the partner.
+        """
+        unit = self.unit_of[member_id]
+        parent_unit = self.unit_of.get(self.members[member_id].get('parentId'))
+        return parent_unit if parent_unit in self._dag_parents[unit] else None
+
+    def _tree_lines(self, a_unit: int, a_head: Optional[int], b_unit: int,
+                    b_head: Optional[int]) -> List[Tuple[int, int, int]]:
+        """Candidate (up, down, ancestor unit) lines when both members' ancestors are all on tree edges."""
+        lines = []
+        if a_head is not None and b_head is not None:
+            ancestor = self._lca(a_head, b_head)
+            if ancestor is not None:
+                lines.append((1 + self.depth[a_head] - self.depth[ancestor],
+                              1 + self.depth[b_head] - self.depth[ancestor], ancestor))
+        if b_head is not None and self._is_ancestor(a_unit, b_head):
+            lines.append((0, 1 + self.depth[b_head] - self.depth[a_unit], a_unit))
+        if a_head is not None and self._is_ancestor(b_unit, a_head):
+            lines.append((1 + self.depth[a_head] - self.depth[b_unit], 0, b_unit))
+        return lines
+
+    def _ancestry(self) -> Tuple[List[int], List[int], List[int]]:
+        """
+        Ancestor bitsets over all parent sides, built on first use: the
+        units ranked by level, the bit of every unit, and for every unit
+        the bits of all its ancestor units. A higher bit is a lower unit.
+        """
+        if self._ancestor_bits is None:
+            rank = sorted(range(len(self.units)), key=lambda unit: (self.level[unit], unit))
+            bit_of = [0] * len(self.units)
+            for position, unit in enumerate(rank):
+                bit_of[unit] = 1 << position
+            bits = [0] * len(self.units)
+            for unit in self._dag_order:
+                ancestors = 0
+                for parent_unit in self._dag_parents[unit]:
+                    ancestors |= bits[parent_unit] | bit_of[parent_unit]
+                bits[unit] = ancestors
+            self._ancestor_bits = rank, bit_of, bits
+        return self._ancestor_bits
+
+    def _graded_lines(self, a_unit: int, a_head: Optional[int], b_unit: int,
+                      b_head: Optional[int]) -> List[Tuple[int, int, int]]:
+        """
+        Candidate lines when every path between two units has the same
+        length, their difference in level: the closest common ancestor is
+        the common ancestor on the lowest level, the highest shared bit.
+        """
+        rank, bit_of, bits = self._ancestry()
+        a_up = bits[a_head] | bit_of[a_head] if a_head is not None else 0
+        b_up = bits[b_head] | bit_of[b_head] if b_head is not None else 0
+        lines = []
+        common = a_up & b_up
+        if common:
+            ancestor = rank[common.bit_length() - 1]
+            lines.append((self.level[a_unit] - self.level[ancestor], self.level[b_unit] - self.level[ancestor], ancestor))
+        if b_up & bit_of[a_unit]:
+            lines.append((0, self.level[b_unit] - self.level[a_unit], a_unit))
+        if a_up & bit_of[b_unit]:
+            lines.append((self.level[a_unit] - self.level[b_unit], 0, b_unit))
+        return lines
+
+    def _viewer_lines(self, a_id: str) -> Tuple[Dict[int, int], List[Optional[Tuple[int, int, int]]]]:
+        """
+        Closest lines from one member to every unit, for trees whose paths
+        differ in length: the generations up to every ancestor unit, and
+        for every unit the best (up + down, up, ancestor unit) reaching it.
+        The last few viewers are cached, labelling a whole tree reuses one.
+        """
+        lines = self._viewers.get(a_id)
+        if lines is not None:
+            self._viewers.move_to_end(a_id)
+            return lines
+        a_unit = self.unit_of[a_id]
+        a_head = self._up_head(a_id)
+        up = {}
+        if a_head is not None:
+            up[a_head] = 1
+            queue = deque([a_head])
+            while queue:
+                unit = queue.popleft()
+                for parent_unit in self._dag_parents[unit]:
+                    if parent_unit not in up:
+                        up[parent_unit] = up[unit] + 1
+                        queue.append(parent_unit)
+        best = [None] * len(self.units)
+        for unit in self._dag_order:
+            line = (0, 0, unit) if unit == a_unit else (up[unit], up[unit], unit) if unit in up else None
+            for parent_unit in self._dag_parents[unit]:
+                above = best[parent_unit]
+                if above is not None and (line is None or (above[0] + 1, above[1]) < line[:2]):
+                    line = (above[0] + 1, above[1], above[2])
+            best[unit] = line
+        lines = up, best
+        self._viewers[a_id] = lines
+        if len(self._viewers) > VIEWER_CACHE_SIZE:
+            self._viewers.popitem(last=False)
+        return lines
+
+    def _consanguinity(self, a_id: str, b_id: str) -> Optional[Tuple[int, int, str]]:
+        """(generations up from a, generations down to b, common ancestor id) of the closest blood line, or None."""
+        if a_id not in self.unit_of or b_id not in self.unit_of or a_id == b_id:
+            return None
+        a_unit, b_unit = self.unit_of[a_id], self.unit_of[b_id]
+        a_head, b_head = self._up_head(a_id), self._up_head(b_id)
+        if all(head is None or self._branch[head] == -1 for head in (a_head, b_head)):
+            lines = self._tree_lines(a_unit, a_head, b_unit, b_head)
+        elif self._graded:
+            lines = self._graded_lines(a_unit, a_head, b_unit, b_head)
+        else:
+            up, best = self._viewer_lines(a_id)
+            lines = []
+            if b_unit in up:
+                lines.append((up[b_unit], 0, b_unit))
+            if b_head is not None and best[b_head] is not None:
+                total, generations_up, ancestor = best[b_head]
+                lines.append((generations_up, total + 1 - generations_up, ancestor))
+        # Partners share a unit, neither is the other's ancestor
+        lines = [line for line in lines if line[0] or line[1]]
+        if not lines:
+            return None
+        up, down, ancestor = min(lines, key=lambda line: (line[0] + line[1], line[0]))
+        if up == 0:
+            ancestor_id = a_id
+        elif down == 0:
+            ancestor_id = b_id
+        else:
+            ancestor_id = self.units[ancestor][0]
+        return up, down, ancestor_id
+
+    def lca(self, a_id: str, b_id: str) -> Optional[str]:
+        """Closest common ancestor of two members, one partner of the couple if it is a couple, None if unrelated."""
+        if a_id == b_id:
+            return a_id if a_id in self.members else None
+        found = self._consanguinity(a_id, b_id)
+        return found[2] if found else None
+
+    def _spouse(self, member_id: Optional[str]) -> Optional[str]:
+        spouse_id = (self.members.get(member_id) or {}).get('spouse')
+        return spouse_id if spouse_id in self.members else None
+
+    def _gender(self, member_id: str) -> str:
+        return (self.members[member_id].get('gender') or '').lower()
+
+    def kinship(self, a_id: str, b_id: str) -> Dict[str, Any]:
+        """
+        Describe how member b is related to member a.
+
+        Returns:
+            dict: relation label, the common ancestor, the generations up from
+            a and down to b, cousin degree and removal, and through whose
+            marriage the relation runs ('viaSpouseOf': a, b or None)
+        """
+        result = {
+            'nodeId': b_id,
+            'relation': "Relative",
+            'commonAncestorId': None,
+            'generationsUp': None,
+            'generationsDown': None,
+            'cousinDegree': None,
+            'removal': None,
+            'viaSpouseOf': None,
+        }
+        if a_id not in self.members or b_id not in self.members:
+            result['relation'] = None
+            return result
+        if a_id == b_id:
+            result.update({'relation': "Myself", 'commonAncestorId': a_id, 'generationsUp': 0, 'generationsDown': 0})
+            return result
+
+        gender = self._gender(b_id)
+        if self._spouse(a_id) == b_id or self._spouse(b_id) == a_id:
+            result['relation'] = _gendered(gender, "Husband", "Wife", "Spouse")
+            return result
+
+        found = self._consanguinity(a_id, b_id)
+        if found:
+            up, down, ancestor_id = found
+            result.update({
+                'relation': kinship_label(up, down, gender),
+                'commonAncestorId': ancestor_id,
+                'generationsUp': up,
+                'generationsDown': down,
+            })
+            if up >= 2 and down >= 2:
+                result['cousinDegree'] = min(up, down) - 1
+                result['removal'] = abs(up - down)
+            return result
+
+        # b married into a's blood family
+        b_spouse = self._spouse(b_id)
+        found = self._consanguinity(a_id, b_spouse) if b_spouse else None
+        if found:
+            up, down, ancestor_id = found
+            result.update({'commonAncestorId': ancestor_id, 'generationsUp': up, 'generationsDown': down,
+                           'viaSpouseOf': b_id})
+            if down == 0 or (up >= 2 and down == 1):
+                # Spouse of an ancestor or of an ancestor's sibling
+                result['relation'] = kinship_label(up, down, gender)
+            elif up == 0:
+                result['relation'] = kinship_label(up, down, gender) + "-in-law"
+            elif (up, down) == (1, 1):
+                result['relation'] = _gendered(gender, "Brother-in-law", "Sister-in-law", "Sibling-in-law")
+            else:
+                spouse_label = kinship_label(up, down, self._gender(b_spouse))
+                result['relation'] = f"{spouse_label}'s {_gendered(gender, 'Husband', 'Wife', 'Spouse')}"
+            return result
+
+        # b is a blood relative of a's spouse
+        a_spouse = self._spouse(a_id)
+        found = self._consanguinity(a_spouse, b_id) if a_spouse else None
+        if found:
+            up, down, ancestor_id = found
+            result.update({'commonAncestorId': ancestor_id, 'generationsUp': up, 'generationsDown': down,
+                           'viaSpouseOf': a_id})
+            if down == 0 or (up, down) == (1, 1):
+                result['relation'] = kinship_label(up, down, gender) + "-in-law"
+            elif up == 0:
+                result['relation'] = "Step" + kinship_label(up, down, gender).lower()
+            else:
+                own_role = _gendered(self._gender(a_spouse), "Husband", "Wife", "Spouse")
+                result['relation'] = f"{own_role}'s {kinship_label(up, down, gender)}"
+        return result
+
+    def relation(self, a_id: str, b_id: str) -> Optional[str]:
+        """Relationship label of b as seen by a."""
+        return self.kinship(a_id, b_id)['relation']
+
+
+def get_member_kinship(family_tree_id: str, node_id: str, target_node_ids: Optional[List[str]] = None,
+                       db=None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Label how members of a family tree are related to one node.
+
+    Args:
+        family_tree_id: ID of the family tree
+        node_id: ID of the node the relations are seen from
+        target_node_ids: Nodes to label, every member of the tree if omitted
+        db: Firestore client (defaults to firestore.client())
+
+    Returns:
+        list: One kinship dict per target node, None if the tree or node
+        does not exist
+    """
+    if db is None:
+        from firebase_admin import firestore
+        db = firestore.client()
+
+    tree_doc = db.collection('family_tree').document(family_tree_id).get()
+    if not tree_doc.exists:
+        return None
+
+    index = KinshipIndex((tree_doc.to_dict() or {}).get('familyMembers', []))
+    if node_id not in index.members:
+        return None
+
+    if target_node_ids is None:
+        target_node_ids = index.ids
+    return [index.kinship(node_id, target_id) for target_id in target_node_ids]
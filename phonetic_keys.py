@@ -0,0 +1,88 @@
+import re
+from typing import Dict, Optional, Tuple, Any
+
+# Ordered rewrite rules for romanized Indian names. Longer patterns come first
+# so "ksh" is handled before "sh" and "chh" before "ch". Aspirated consonants
+# collapse onto their plain form (bh/b, dh/d, th/t ...), retroflex and dental
+# spellings end up identical, and w/v, z/j, f/ph, q/k are merged. "ch" becomes
+# the placeholder "C" so the later c/k rule leaves it alone.
+_PHONETIC_RULES = [
+    ('ksh', 'x'), ('ks', 'x'), ('sch', 's'),
+    ('chh', 'C'), ('ch', 'C'), ('ck', 'k'), ('c', 'k'),
+    ('sh', 's'), ('zh', 'l'),
+    ('bh', 'b'), ('dh', 'd'), ('gh', 'g'), ('jh', 'j'), ('kh', 'k'),
+    ('ph', 'p'), ('th', 't'), ('rh', 'r'),
+    ('w', 'v'), ('f', 'p'), ('z', 'j'), ('q', 'k'),
+]
+
+_PHONETIC_VOWELS = set('aeiouy')
+_NON_LETTERS = re.compile(r'[^a-z]+')
+
+# Points a phonetic match adds to a profile search score. A phonetic hit only
+# counts when the name field had no exact, partial or fuzzy match.
+PHONETIC_FIRST_NAME_POINTS = 2
+PHONETIC_LAST_NAME_POINTS = 3
+
+
+def phonetic_key(name: Optional[str]) -> str:
+    """
+    Encode a romanized name into a sound-alike blocking key.
+
+    The key keeps the first letter, applies the transliteration rules above,
+    drops the remaining vowels and 'h' and squeezes repeated letters, so
+    "Venkateswara Rao", "Venkateshwararao" and "Wenkateswar Rao" share a key,
+    as do "Lakshmi"/"Laxmi" and "Seeta"/"Sita".
+
+    Returns:
+        str: Phonetic key, or "" if the name has no latin letters
+    """
+    if not name:
+        return ""
+    value = _NON_LETTERS.sub('', name.lower())
+    if not value:
+        return ""
+
+    for pattern, replacement in _PHONETIC_RULES:
+        value = value.replace(pattern, replacement)
+
+    key = [value[0]]
+    for char in value[1:]:
+        if char in _PHONETIC_VOWELS or char == 'h':
+            continue
+        if char != key[-1]:
+            key.append(char)
+    return ''.join(key)
+
+
+def phonetic_name_keys(first_name: Optional[str], last_name: Optional[str]) -> Dict[str, str]:
+    """
+    Return the phonetic blocking keys stored on a user_profiles document.
+    """
+    return {
+        'firstNamePhoneticKey': phonetic_key(first_name),
+        'lastNamePhoneticKey': phonetic_key(last_name),
+    }
+
+
+def split_member_name(member: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Split a family tree member's name into (first, last).
+    Members only carry a single "name" field, the last word is the surname.
+    """
+    parts = (member.get('name') or '').split()
+    if not parts:
+        return "", ""
+    if len(parts) == 1:
+        return parts[0], ""
+    return ' '.join(parts[:-1]), parts[-1]
+
+
+def member_blocking_key(member: Dict[str, Any]) -> str:
+    """
+    Blocking key of a family tree member: phonetic first name plus phonetic surname.
+    """
+    first_name, last_name = split_member_name(member)
+    first_key = phonetic_key(first_name)
+    if not first_key:
+        return ""
+    return f"{first_key}|{phonetic_key(last_name)}"
@@ -0,0 +1,951 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple, Any
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from phonetic_keys import phonetic_key, PHONETIC_FIRST_NAME_POINTS, PHONETIC_LAST_NAME_POINTS
+from profile_snapshot import profile_snapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields copied from a user_profiles document into the search index
+INDEXED_PROFILE_FIELDS = ['firstName', 'lastName', 'phone', 'GENDER', 'currentProfileImageId']
+
+# Substring n-gram sizes kept for partial matching. Queries of at least
+# NGRAM_MAX characters are resolved through trigram intersection, shorter
+# queries through their own 1- or 2-gram posting list.
+NGRAM_MIN = 1
+NGRAM_MAX = 3
+
+# Scoring backend: 'auto' uses the NumPy column snapshot once the index holds
+# at least VECTORIZE_MIN_PROFILES profiles, 'numpy' always uses it when NumPy
+# is installed and 'index' always scores the n-gram candidates in Python.
+SEARCH_BACKEND = os.environ.get('PROFILE_SEARCH_BACKEND', 'auto')
+VECTORIZE_MIN_PROFILES = 5000
+
+# Fuzzy name matching: names are compared on padded trigrams of their
+# letters only, so "Venkateswararo" still finds "Venkateswara Rao". A fuzzy
+# hit only counts when the name field had no exact or partial match and adds
+# at most FUZZY_*_WEIGHT points, which keeps it below a partial match.
+FUZZY_SIMILARITY_THRESHOLD = 0.45
+FUZZY_FIRST_NAME_WEIGHT = 4
+FUZZY_LAST_NAME_WEIGHT = 6
+
+_NON_NAME_CHARS = re.compile(r'[^0-9a-z\u0080-\uffff]+')
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """Normalize a first or last name the same way the search scoring does."""
+    return value.lower().strip() if value else ""
+
+
+def normalize_email(value: Optional[str]) -> str:
+    """Normalize an email address for comparison."""
+    return value.lower().strip() if value else ""
+
+
+def normalize_phone(value: Optional[str]) -> str:
+    """Keep only the digits of a phone number."""
+    return ''.join(filter(str.isdigit, value)) if value else ""
+
+
+def substring_ngrams(value: str) -> Set[str]:
+    """Return every substring of value with a length between NGRAM_MIN and NGRAM_MAX."""
+    grams = set()
+    for size in range(NGRAM_MIN, NGRAM_MAX + 1):
+        for start in range(len(value) - size + 1):
+            grams.add(value[start:start + size])
+    return grams
+
+
+def compact_name(value: Optional[str]) -> str:
+    """Lowercase a name and drop spaces, dots and other separators."""
+    return _NON_NAME_CHARS.sub('', value.lower()) if value else ""
+
+
+def name_trigrams(value: str) -> Set[str]:
+    """
+    Return the padded trigrams of a compacted name.
+    Padding lets short names and word starts/ends contribute trigrams.
+    """
+    if not value:
+        return set()
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(str1: Optional[str], str2: Optional[str]) -> float:
+    """Jaccard similarity of the name trigrams of two strings (0.0 - 1.0)."""
+    first, second = compact_name(str1), compact_name(str2)
+    if not first and not second:
+        return 1.0
+    if not first or not second:
+        return 0.0
+    if first == second:
+        return 1.0
+
+    first_grams, second_grams = name_trigrams(first), name_trigrams(second)
+    shared = len(first_grams & second_grams)
+    return shared / (len(first_grams) + len(second_grams) - shared)
+
+
+def fuzzy_points(similarity: float, weight: int) -> int:
+    """Points added for a fuzzy name match of the given similarity."""
+    return max(1, int(round(similarity * weight)))
+
+
+def score_profile(
+    record: Dict[str, Any],
+    first_name: str = "",
+    last_name: str = "",
+    email: str = "",
+    phone: str = "",
+    first_name_similarity: float = 0.0,
+    last_name_similarity: float = 0.0,
+    first_name_phonetic: str = "",
+    last_name_phonetic: str = ""
+) -> Tuple[int, List[str]]:
+    """
+    Score an indexed profile record against normalized search criteria.
+
+    Uses the same exact/partial rules as the original full scan:
+    email 50/10, phone 40, last name 30/8, first name 20/5.
+    Trigram similarities at or above FUZZY_SIMILARITY_THRESHOLD add a
+    "fuzzy" reason for name fields that did not match exactly or partially.
+    Name fields with none of those matches whose phonetic key equals the
+    query's (first_name_phonetic / last_name_phonetic) add a "phonetic" reason.
+
+    Returns:
+        tuple: (score, match_reasons)
+    """
+    score = 0
+    match_reasons = []
+
+    if email and email == record['emailKey']:
+        score += 50
+        match_reasons.append("email_exact")
+
+    if last_name and last_name == record['lastNameKey']:
+        score += 30
+        match_reasons.append("last_name_exact")
+
+    if first_name and first_name == record['firstNameKey']:
+        score += 20
+        match_reasons.append("first_name_exact")
+
+    if phone and phone == record['phoneKey']:
+        score += 40
+        match_reasons.append("phone_exact")
+
+    if email and "email_exact" not in match_reasons and email in record['emailKey']:
+        score += 10
+        match_reasons.append("email_partial")
+
+    if last_name and "last_name_exact" not in match_reasons and last_name in record['lastNameKey']:
+        score += 8
+        match_reasons.append("last_name_partial")
+
+    if first_name and "first_name_exact" not in match_reasons and first_name in record['firstNameKey']:
+        score += 5
+        match_reasons.append("first_name_partial")
+
+    fuzzy = False
+    phonetic = False
+    if last_name and "last_name_exact" not in match_reasons and "last_name_partial" not in match_reasons:
+        if last_name_similarity >= FUZZY_SIMILARITY_THRESHOLD:
+            score += fuzzy_points(last_name_similarity, FUZZY_LAST_NAME_WEIGHT)
+            fuzzy = True
+        elif last_name_phonetic and last_name_phonetic == record['lastNamePhonetic']:
+            score += PHONETIC_LAST_NAME_POINTS
+            phonetic = True
+
+    if first_name and "first_name_exact" not in match_reasons and "first_name_partial" not in match_reasons:
+        if first_name_similarity >= FUZZY_SIMILARITY_THRESHOLD:
+            score += fuzzy_points(first_name_similarity, FUZZY_FIRST_NAME_WEIGHT)
+            fuzzy = True
+        elif first_name_phonetic and first_name_phonetic == record['firstNamePhonetic']:
+            score += PHONETIC_FIRST_NAME_POINTS
+            phonetic = True
+
+    if fuzzy:
+        match_reasons.append("fuzzy")
+    if phonetic:
+        match_reasons.append("phonetic")
+
+    return score, match_reasons
+
+
+class ProfileSearchIndex:
+    """
+    In-process search index over the user_profiles collection.
+
+    Keeps normalized exact keys (first name, last name, email, digit-only phone),
+    substring n-gram posting lists, name trigram posting lists for fuzzy
+    matching and phonetic blocking keys for sound-alike names, so a search only has to score the profiles that can possibly
+    match instead of streaming the whole collection.
+    The index is built from the shared profile snapshot and then kept up to
+    date through upsert() calls from the profile create/update paths and the
+    documents each incremental snapshot sync pulls in.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self.loaded = False
+        self.version = 0
+        self._building = False
+        self._pending_upserts = {}
+        self._columns = None
+        # Profiles changed since the column snapshot was last brought up to date
+        self._changed_ids = set()
+        self._reset()
+
+    # Posting-list attributes swapped in together when the index is rebuilt
+    POSTING_ATTRS = (
+        'first_name_keys', 'last_name_keys', 'email_keys', 'phone_keys',
+        'first_name_grams', 'last_name_grams', 'email_grams',
+        'first_name_compacts', 'last_name_compacts',
+        'first_name_trigrams', 'last_name_trigrams',
+        'first_name_phonetic', 'last_name_phonetic',
+    )
+
+    def _reset(self):
+        self.records = {}
+        for attr in self.POSTING_ATTRS:
+            setattr(self, attr, defaultdict(set))
+
+    # ------------------------------------------------------------------
+    # Building and maintenance
+    # ------------------------------------------------------------------
+
+    def build(self, db) -> int:
+        """
+        Build the index from a single projected stream of user_profiles.
+
+        Returns:
+            int: Number of indexed profiles
+        """
+        docs = db.collection('user_profiles').select(INDEXED_PROFILE_FIELDS).stream()
+        return self.build_from((doc.id, doc.to_dict() or {}) for doc in docs)
+
+    def build_from(self, profiles) -> int:
+        """
+        Rebuild the index from an iterable of (profile_id, profile_data) pairs.
+
+        Upserts that arrive while profiles is being consumed are buffered and
+        re-applied once the new index has been swapped in.
+
+        Returns:
+            int: Number of indexed profiles
+        """
+        with self._build_lock:
+            with self._lock:
+                self._building = True
+                self._pending_upserts = {}
+
+            try:
+                fresh = ProfileSearchIndex()
+                for profile_id, profile in profiles:
+                    fresh._add(profile_id, profile)
+                # Built before the swap so the first search does not pay for it
+                columns = ProfileColumns(fresh.records, 0) if np is not None else None
+            except Exception:
+                with self._lock:
+                    self._building = False
+                raise
+
+            with self._lock:
+                self.records = fresh.records
+                for attr in self.POSTING_ATTRS:
+                    setattr(self, attr, getattr(fresh, attr))
+                self._building = False
+                self.loaded = True
+                self.version += 1
+                self._columns = columns
+                self._changed_ids = set()
+                if columns is not None:
+                    columns.version = self.version
+
+                pending = self._pending_upserts
+                self._pending_upserts = {}
+                for email, fields in pending.items():
+                    self._upsert_locked(email, fields)
+
+                logger.info(f"Profile search index built with {len(self.records)} profiles")
+                return len(self.records)
+
+    def ensure_loaded(self, db):
+        """Build the index on first use."""
+        if not self.loaded:
+            self.build(db)
+
+    def apply_snapshot(self, profiles: Dict[str, Dict[str, Any]], full_load: bool):
+        """Profile snapshot listener: rebuild on a full load, upsert on incremental syncs."""
+        if full_load:
+            self.build_from(profiles.items())
+            return
+        for email, profile in profiles.items():
+            self.upsert(email, profile)
+
+    def upsert(self, email: str, fields: Dict[str, Any]):
+        """
+        Insert or update the indexed fields of a profile.
+
+        Only the keys present in fields are changed, so partial profile
+        updates can be passed straight through.
+        """
+        if not email:
+            return
+        with self._lock:
+            if self._building:
+                self._pending_upserts.setdefault(email, {}).update(fields)
+            self._upsert_locked(email, fields)
+
+    def remove(self, email: str):
+        """Remove a profile from the index."""
+        with self._lock:
+            self._pending_upserts.pop(email, None)
+            if self._discard(email):
+                self._changed_ids.add(email)
+                self.version += 1
+
+    def _upsert_locked(self, email: str, fields: Dict[str, Any]):
+        existing = self.records.get(email)
+        merged = {field: existing['raw'].get(field) for field in INDEXED_PROFILE_FIELDS} if existing else {}
+        for field in INDEXED_PROFILE_FIELDS:
+            if field in fields:
+                merged[field] = fields[field]
+
+        self._discard(email)
+        self._add(email, merged)
+        self._changed_ids.add(email)
+        self.version += 1
+
+    def _add(self, email: str, profile: Dict[str, Any]):
+        record = {
+            'email': email,
+            'raw': {field: profile.get(field) for field in INDEXED_PROFILE_FIELDS},
+            'firstNameKey': normalize_name(profile.get('firstName')),
+            'lastNameKey': normalize_name(profile.get('lastName')),
+            'emailKey': normalize_email(email),
+            'phoneKey': normalize_phone(profile.get('phone')),
+            'firstNameCompact': compact_name(profile.get('firstName')),
+            'lastNameCompact': compact_name(profile.get('lastName')),
+            'firstNamePhonetic': phonetic_key(profile.get('firstName')),
+            'lastNamePhonetic': phonetic_key(profile.get('lastName')),
+        }
+        self.records[email] = record
+
+        # Trigrams are posted once per distinct compact name, which maps on to its profiles
+        for compact, compacts, trigrams in (
+                (record['firstNameCompact'], self.first_name_compacts, self.first_name_trigrams),
+                (record['lastNameCompact'], self.last_name_compacts, self.last_name_trigrams)):
+            if not compact:
+                continue
+            if compact not in compacts:
+                for gram in name_trigrams(compact):
+                    trigrams[gram].add(compact)
+            compacts[compact].add(email)
+        if record['firstNamePhonetic']:
+            self.first_name_phonetic[record['firstNamePhonetic']].add(email)
+        if record['lastNamePhonetic']:
+            self.last_name_phonetic[record['lastNamePhonetic']].add(email)
+
+        if record['firstNameKey']:
+            self.first_name_keys[record['firstNameKey']].add(email)
+            for gram in substring_ngrams(record['firstNameKey']):
+                self.first_name_grams[gram].add(email)
+        if record['lastNameKey']:
+            self.last_name_keys[record['lastNameKey']].add(email)
+            for gram in substring_ngrams(record['lastNameKey']):
+                self.last_name_grams[gram].add(email)
+        if record['emailKey']:
+            self.email_keys[record['emailKey']].add(email)
+            for gram in substring_ngrams(record['emailKey']):
+                self.email_grams[gram].add(email)
+        if record['phoneKey']:
+            self.phone_keys[record['phoneKey']].add(email)
+
+    def _discard(self, email: str) -> bool:
+        record = self.records.pop(email, None)
+        if not record:
+            return False
+
+        def drop(postings, key, value=email):
+            bucket = postings.get(key)
+            if bucket is not None:
+                bucket.discard(value)
+                if not bucket:
+                    del postings[key]
+
+        if record['firstNameKey']:
+            drop(self.first_name_keys, record['firstNameKey'])
+            for gram in substring_ngrams(record['firstNameKey']):
+                drop(self.first_name_grams, gram)
+        if record['lastNameKey']:
+            drop(self.last_name_keys, record['lastNameKey'])
+            for gram in substring_ngrams(record['lastNameKey']):
+                drop(self.last_name_grams, gram)
+        if record['emailKey']:
+            drop(self.email_keys, record['emailKey'])
+            for gram in substring_ngrams(record['emailKey']):
+                drop(self.email_grams, gram)
+        if record['phoneKey']:
+            drop(self.phone_keys, record['phoneKey'])
+        for compact, compacts, trigrams in (
+                (record['firstNameCompact'], self.first_name_compacts, self.first_name_trigrams),
+                (record['lastNameCompact'], self.last_name_compacts, self.last_name_trigrams)):
+            if not compact:
+                continue
+            drop(compacts, compact)
+            if compact not in compacts:
+                for gram in name_trigrams(compact):
+                    drop(trigrams, gram, compact)
+        if record['firstNamePhonetic']:
+            drop(self.first_name_phonetic, record['firstNamePhonetic'])
+        if record['lastNamePhonetic']:
+            drop(self.last_name_phonetic, record['lastNamePhonetic'])
+        return True
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _substring_candidates(grams_index, query: str) -> Set[str]:
+        """Return ids whose indexed value may contain query (superset, verified by scoring)."""
+        if len(query) <= NGRAM_MAX:
+            return set(grams_index.get(query, ()))
+
+        query_grams = {query[i:i + NGRAM_MAX] for i in range(len(query) - NGRAM_MAX + 1)}
+        postings = []
+        for gram in query_grams:
+            bucket = grams_index.get(gram)
+            if not bucket:
+                return set()
+            postings.append(bucket)
+
+        # Intersect starting from the rarest gram
+        postings.sort(key=len)
+        result = set(postings[0])
+        for bucket in postings[1:]:
+            result &= bucket
+            if not result:
+                break
+        return result
+
+    @staticmethod
+    def _fuzzy_lookup(trigram_index, query: str, threshold: float = FUZZY_SIMILARITY_THRESHOLD) -> Dict[str, float]:
+        """
+        Find compact names whose trigram Jaccard similarity to query is at least threshold.
+
+        Uses prefix filtering: a name reaching the threshold has to share at
+        least ceil(threshold * |Q|) trigrams with the query, so it must contain
+        one of the |Q| - ceil(threshold * |Q|) + 1 rarest query trigrams. Only
+        the posting lists of those rare trigrams are visited, which keeps the
+        lookup independent of very common trigrams such as a leading "  r".
+        Postings hold distinct names, so the cost does not grow with the
+        number of profiles sharing a name.
+        """
+        query_grams = name_trigrams(compact_name(query))
+        if not query_grams:
+            return {}
+
+        min_shared = math.ceil(threshold * len(query_grams))
+        postings = sorted((trigram_index.get(gram, set()) for gram in query_grams), key=len)
+        prefix = postings[:len(query_grams) - min_shared + 1]
+
+        candidates = set()
+        for bucket in prefix:
+            candidates |= bucket
+
+        # Jaccard >= t also bounds the candidate's trigram count
+        min_count = threshold * len(query_grams)
+        max_count = len(query_grams) / threshold
+
+        matches = {}
+        for name in candidates:
+            count = len(name_trigrams(name))
+            if not (min_count <= count <= max_count):
+                continue
+            shared = sum(1 for bucket in postings if name in bucket)
+            if shared < min_shared:
+                continue
+            similarity = shared / (len(query_grams) + count - shared)
+            if similarity >= threshold:
+                matches[name] = similarity
+        return matches
+
+    def fuzzy_matches(self, first_name: str = "", last_name: str = "",
+                      threshold: float = FUZZY_SIMILARITY_THRESHOLD) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """
+        Return {compact name: similarity} maps of fuzzy first-name and last-name
+        matches, the profiles of a name are in first/last_name_compacts.
+        """
+        with self._lock:
+            first_matches = self._fuzzy_lookup(self.first_name_trigrams, first_name, threshold) if first_name else {}
+            last_matches = self._fuzzy_lookup(self.last_name_trigrams, last_name, threshold) if last_name else {}
+            return first_matches, last_matches
+
+    def candidates(self, first_name: str = "", last_name: str = "", email: str = "", phone: str = "") -> Set[str]:
+        """
+        Collect the ids of profiles that can score above zero for the given
+        normalized criteria. Exact matches are always a subset of the
+        substring candidates, so only the n-gram lists and the phonetic
+        blocking keys (one dict lookup per name) need to be consulted.
+        """
+        with self._lock:
+            result = set()
+            if first_name:
+                result |= self._substring_candidates(self.first_name_grams, first_name)
+                result |= self.first_name_phonetic.get(phonetic_key(first_name), set())
+            if last_name:
+                result |= self._substring_candidates(self.last_name_grams, last_name)
+                result |= self.last_name_phonetic.get(phonetic_key(last_name), set())
+            if email:
+                result |= self._substring_candidates(self.email_grams, email)
+            if phone:
+                result |= self.phone_keys.get(phone, set())
+            return result
+
+    def get(self, email: str) -> Optional[Dict[str, Any]]:
+        """Return the indexed record for a profile id."""
+        with self._lock:
+            return self.records.get(email)
+
+    def all_ids(self) -> List[str]:
+        """Return every indexed profile id."""
+        with self._lock:
+            return list(self.records.keys())
+
+    def columns(self) -> Optional['ProfileColumns']:
+        """
+        Return a columnar snapshot of the index for vectorized scoring.
+
+        Profiles upserted or removed since the last call are patched into
+        the previous snapshot (see ProfileColumns.updated), so a write costs
+        work per changed profile, plus a copy of the columns when profiles
+        were added or removed, instead of a full rebuild.
+        """
+        if np is None:
+            return None
+        with self._lock:
+            if self._columns is None:
+                self._columns = ProfileColumns(self.records, self.version)
+            elif self._changed_ids:
+                self._columns = self._columns.updated(self.records, self._changed_ids, self.version)
+            self._changed_ids = set()
+            return self._columns
+
+    def use_vectorized(self, backend: Optional[str] = None) -> bool:
+        """Decide whether a search should run on the NumPy column snapshot."""
+        backend = backend or SEARCH_BACKEND
+        if backend == 'numpy':
+            return np is not None
+        if backend == 'auto':
+            return np is not None and len(self.records) >= VECTORIZE_MIN_PROFILES
+        return False
+
+    @staticmethod
+    def _match_entry(record: Dict[str, Any], score: int, match_reasons: List[str]) -> Dict[str, Any]:
+        raw = record['raw']
+        return {
+            "email": record['emailKey'],
+            "firstName": raw.get('firstName') or '',
+            "lastName": raw.get('lastName') or '',
+            "phone": raw.get('phone') or '',
+            "gender": raw.get('GENDER') or '',
+            "currentProfileImageId": raw.get('currentProfileImageId'),
+            "documentId": record['email'],
+            "matchScore": score,
+            "matchReasons": match_reasons
+        }
+
+    def search(self, first_name: str = "", last_name: str = "", email: str = "", phone: str = "",
+               backend: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Score candidate profiles for already-normalized criteria.
+
+        Results are produced in document-id order, which is the order the
+        user_profiles stream used to return them in, so the stable sort on
+        matchScore produces the same ranking as the original full scan.
+
+        Args:
+            backend: 'numpy' to score the column snapshot with array operations,
+                'index' to score only the n-gram candidates in Python, or 'auto'
+                (the SEARCH_BACKEND default) to pick based on index size
+
+        Returns:
+            list: Scored matches (unsorted by score) with the raw profile fields
+        """
+        if self.use_vectorized(backend):
+            return self._search_vectorized(first_name, last_name, email, phone)
+        return self._search_candidates(first_name, last_name, email, phone)
+
+    def _search_candidates(self, first_name: str, last_name: str, email: str, phone: str) -> List[Dict[str, Any]]:
+        """Score the n-gram and fuzzy candidates one profile at a time."""
+        has_criteria = bool(first_name or last_name or email or phone)
+
+        first_phonetic, last_phonetic = phonetic_key(first_name), phonetic_key(last_name)
+
+        with self._lock:
+            fuzzy_first, fuzzy_last = self.fuzzy_matches(first_name, last_name)
+            if has_criteria:
+                ids = self.candidates(first_name, last_name, email, phone)
+                for name in fuzzy_first:
+                    ids |= self.first_name_compacts.get(name, set())
+                for name in fuzzy_last:
+                    ids |= self.last_name_compacts.get(name, set())
+            else:
+                ids = self.records.keys()
+            records = [self.records[profile_id] for profile_id in sorted(ids) if profile_id in self.records]
+
+        scored = []
+        for record in records:
+            if has_criteria:
+                score, match_reasons = score_profile(
+                    record, first_name, last_name, email, phone,
+                    first_name_similarity=fuzzy_first.get(record['firstNameCompact'], 0.0),
+                    last_name_similarity=fuzzy_last.get(record['lastNameCompact'], 0.0),
+                    first_name_phonetic=first_phonetic,
+                    last_name_phonetic=last_phonetic
+                )
+                if score <= 0:
+                    continue
+            else:
+                score, match_reasons = 1, []
+            scored.append(self._match_entry(record, score, match_reasons))
+        return scored
+
+    def _search_vectorized(self, first_name: str, last_name: str, email: str, phone: str) -> List[Dict[str, Any]]:
+        """Score every profile at once with array operations on the column snapshot."""
+        columns = self.columns()
+        fuzzy_first, fuzzy_last = self.fuzzy_matches(first_name, last_name)
+        scores, flags = columns.score(first_name, last_name, email, phone, fuzzy_first, fuzzy_last)
+
+        if first_name or last_name or email or phone:
+            rows = np.flatnonzero(scores > 0)
+        else:
+            rows = np.arange(len(columns))
+            scores = np.ones(len(columns), dtype=np.int32)
+
+        # Convert only the matching rows back to Python objects
+        row_scores = scores[rows].tolist()
+        row_flags = [(reason, flag[rows].tolist()) for reason, flag in flags]
+        records = columns.records
+
+        scored = []
+        for position, row in enumerate(rows.tolist()):
+            match_reasons = [reason for reason, flag in row_flags if flag[position]]
+            scored.append(self._match_entry(records[row], row_scores[position], match_reasons))
+        return scored
+
+
+    def search_page_vectorized(self, first_name: str = "", last_name: str = "", email: str = "", phone: str = "",
+                               limit: Optional[int] = None,
+                               after_key: Optional[Tuple[int, str]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Score, filter and rank on the column snapshot, materializing only one page.
+
+        Args:
+            limit: Maximum number of matches to return (None for all)
+            after_key: (-score, documentId) of the last match of the previous page
+
+        Returns:
+            tuple: (ranked matches, has_more)
+        """
+        columns = self.columns()
+        fuzzy_first, fuzzy_last = self.fuzzy_matches(first_name, last_name)
+        scores, flags = columns.score(first_name, last_name, email, phone, fuzzy_first, fuzzy_last)
+
+        if first_name or last_name or email or phone:
+            mask = scores > 0
+        else:
+            scores = np.ones(len(columns), dtype=np.int32)
+            mask = np.ones(len(columns), dtype=bool)
+
+        if after_key is not None:
+            after_score, after_id = -after_key[0], after_key[1]
+            mask &= (scores < after_score) | ((scores == after_score) & (columns.id_array > after_id))
+
+        rows = np.flatnonzero(mask)
+        # Rows are in document-id order, so a stable sort on -score gives the original ranking
+        order = rows[np.argsort(-scores[rows], kind='stable')]
+        if limit is not None:
+            has_more = len(order) > limit
+            order = order[:limit]
+        else:
+            has_more = False
+
+        page = []
+        for row in order.tolist():
+            match_reasons = [reason for reason, flag in flags if flag[row]]
+            page.append(self._match_entry(columns.records[row], int(scores[row]), match_reasons))
+        return page, has_more
+
+
+def _name_entry(record: Dict[str, Any], field: str) -> Tuple[str, str, str]:
+    """The (key, compact, phonetic) forms of a record's firstName or lastName."""
+    return record[f'{field}Key'], record[f'{field}Compact'], record[f'{field}Phonetic']
+
+
+def _patch(column, rows: List[int], values: List[Any]):
+    """Overwrite rows of column in place, or in a widened copy if the values do not fit its dtype."""
+    values = np.array(values, dtype=column.dtype.type)
+    dtype = np.promote_types(column.dtype, values.dtype)
+    if dtype != column.dtype:
+        column = column.astype(dtype)
+    column[rows] = values
+    return column
+
+
+def _splice(column, stale_rows: List[int], positions: List[int], values: List[Any]):
+    """
+    Copy of column without stale_rows and with values inserted before
+    positions (indexes into the column once stale_rows are gone), widened
+    to fit the new values.
+    """
+    kept = np.delete(column, stale_rows) if stale_rows else column
+    if not positions:
+        return kept
+    values = np.array(values, dtype=column.dtype.type)
+    return np.insert(kept.astype(np.promote_types(kept.dtype, values.dtype), copy=False), positions, values)
+
+
+class NameVocabulary:
+    """
+    Distinct forms of one name field across all profiles.
+
+    ProfileColumns stores a code into the vocabulary per row, so a query
+    is matched once per distinct name and spread to the rows with a single
+    gather. Vocabularies are never modified once built: encode() returns an
+    extended copy when it meets new names. Names no longer used by any row
+    stay until the next full rebuild.
+    """
+
+    __slots__ = ('keys', 'phonetics', 'code_of', 'codes_of_compact')
+
+    def __init__(self):
+        self.keys = np.array([], dtype=np.str_)
+        self.phonetics = np.array([], dtype=np.str_)
+        # (key, compact, phonetic) -> code
+        self.code_of = {}
+        # compact name -> codes of the entries sharing it, for fuzzy matches
+        self.codes_of_compact = {}
+
+    def encode(self, entries: List[Tuple[str, str, str]]) -> Tuple['NameVocabulary', Any]:
+        """
+        Codes of (key, compact, phonetic) entries.
+
+        Returns:
+            tuple: (vocabulary holding every entry, int32 array of codes)
+        """
+        vocabulary = self
+        new_entries = [entry for entry in dict.fromkeys(entries) if entry not in self.code_of]
+        if new_entries:
+            vocabulary = NameVocabulary()
+            vocabulary.code_of = dict(self.code_of)
+            vocabulary.codes_of_compact = dict(self.codes_of_compact)
+            for entry in new_entries:
+                code = len(vocabulary.code_of)
+                vocabulary.code_of[entry] = code
+                vocabulary.codes_of_compact[entry[1]] = vocabulary.codes_of_compact.get(entry[1], ()) + (code,)
+            vocabulary.keys = np.concatenate([self.keys, np.array([entry[0] for entry in new_entries], dtype=np.str_)])
+            vocabulary.phonetics = np.concatenate(
+                [self.phonetics, np.array([entry[2] for entry in new_entries], dtype=np.str_)])
+        codes = np.fromiter((vocabulary.code_of[entry] for entry in entries), dtype=np.int32, count=len(entries))
+        return vocabulary, codes
+
+    def match(self, query: str, fuzzy: Dict[str, float], exact_points: int, partial_points: int,
+              fuzzy_weight: int, phonetic_points: int):
+        """
+        Score every distinct name against a normalized query, with the rules
+        of score_profile for one name field.
+
+        Args:
+            fuzzy: {compact name: similarity} from ProfileSearchIndex.fuzzy_matches
+
+        Returns:
+            tuple: (points, exact, partial, fuzzy, phonetic) arrays indexed by code
+        """
+        exact = self.keys == query
+        partial = ~exact & (np.char.find(self.keys, query) >= 0)
+        matched = exact | partial
+        fuzzy_points_by_code = np.zeros(len(self.keys), dtype=np.int32)
+        for compact, similarity in fuzzy.items():
+            for code in self.codes_of_compact.get(compact, ()):
+                fuzzy_points_by_code[code] = fuzzy_points(similarity, fuzzy_weight)
+        fuzzy_points_by_code[matched] = 0
+        is_fuzzy = fuzzy_points_by_code > 0
+        query_phonetic = phonetic_key(query)
+        if query_phonetic:
+            sounds_alike = ~(matched | is_fuzzy) & (self.phonetics == query_phonetic)
+        else:
+            sounds_alike = np.zeros(len(self.keys), dtype=bool)
+        points = exact * exact_points + partial * partial_points + fuzzy_points_by_code + sounds_alike * phonetic_points
+        return points, exact, partial, is_fuzzy, sounds_alike
+
+
+class ProfileColumns:
+    """
+    Columnar (struct-of-arrays) snapshot of the indexed profile keys.
+
+    Rows are ordered by document id. Emails and phones are kept per row,
+    first and last names as codes into a NameVocabulary. Exact matches are
+    computed with vectorized string comparisons and partial matches with
+    np.char.find, so a query over the whole user base runs in C instead of
+    a Python loop. Writes are applied with updated() instead of a rebuild.
+    """
+
+    def __init__(self, records: Dict[str, Dict[str, Any]], version: int):
+        ordered_ids = sorted(records)
+        ordered = [records[profile_id] for profile_id in ordered_ids]
+        self.version = version
+        self.id_array = np.array(ordered_ids, dtype=np.str_)
+        self.records = np.empty(len(ordered), dtype=object)
+        self.records[:] = ordered
+        self.emails = np.array([record['emailKey'] for record in ordered], dtype=np.str_)
+        self.phones = np.array([record['phoneKey'] for record in ordered], dtype=np.str_)
+        self.first_names, self.first_name_codes = NameVocabulary().encode(
+            [_name_entry(record, 'firstName') for record in ordered])
+        self.last_names, self.last_name_codes = NameVocabulary().encode(
+            [_name_entry(record, 'lastName') for record in ordered])
+
+    def __len__(self) -> int:
+        return len(self.id_array)
+
+    def updated(self, records: Dict[str, Dict[str, Any]], changed_ids: Set[str], version: int) -> 'ProfileColumns':
+        """
+        Snapshot with the rows of changed_ids brought up to date.
+
+        When only existing profiles changed, their rows are overwritten in
+        place and the new snapshot shares the columns with this one; a
+        search running on this snapshot meanwhile may see either version
+        of those rows. Otherwise rows of removed profiles are dropped and
+        new ones inserted at their id position, in copies of the columns.
+        Either way only the changed profiles are converted, where a rebuild
+        would convert every record again.
+
+        Args:
+            records: The index records, by profile id
+            changed_ids: Profiles upserted or removed since this snapshot
+            version: Index version the snapshot reflects
+        """
+        changed = sorted(changed_ids)
+        positions = np.searchsorted(self.id_array, changed).tolist()
+        stale_rows = [row for row, profile_id in zip(positions, changed)
+                      if row < len(self.id_array) and self.id_array[row] == profile_id]
+        fresh_ids = [profile_id for profile_id in changed if profile_id in records]
+        fresh = [records[profile_id] for profile_id in fresh_ids]
+
+        columns = ProfileColumns.__new__(ProfileColumns)
+        columns.version = version
+        columns.first_names, first_name_codes = self.first_names.encode(
+            [_name_entry(record, 'firstName') for record in fresh])
+        columns.last_names, last_name_codes = self.last_names.encode(
+            [_name_entry(record, 'lastName') for record in fresh])
+
+        if fresh_ids == [str(self.id_array[row]) for row in stale_rows]:
+            columns.id_array = self.id_array
+            columns.records = _patch(self.records, stale_rows, fresh)
+            columns.emails = _patch(self.emails, stale_rows, [record['emailKey'] for record in fresh])
+            columns.phones = _patch(self.phones, stale_rows, [record['phoneKey'] for record in fresh])
+            # Codes are copied (a few hundred KB): a search still holding the
+            # older vocabulary must never meet a code it does not have
+            columns.first_name_codes = _patch(self.first_name_codes.copy(), stale_rows, first_name_codes)
+            columns.last_name_codes = _patch(self.last_name_codes.copy(), stale_rows, last_name_codes)
+            return columns
+
+        kept_ids = np.delete(self.id_array, stale_rows)
+        insert_at = np.searchsorted(kept_ids, fresh_ids).tolist()
+        columns.id_array = _splice(kept_ids, [], insert_at, fresh_ids)
+        columns.records = _splice(self.records, stale_rows, insert_at, fresh)
+        columns.emails = _splice(self.emails, stale_rows, insert_at, [record['emailKey'] for record in fresh])
+        columns.phones = _splice(self.phones, stale_rows, insert_at, [record['phoneKey'] for record in fresh])
+        columns.first_name_codes = _splice(self.first_name_codes, stale_rows, insert_at, first_name_codes)
+        columns.last_name_codes = _splice(self.last_name_codes, stale_rows, insert_at, last_name_codes)
+        return columns
+
+    @staticmethod
+    def _exact_and_partial(column, query: str):
+        exact = column == query
+        partial = ~exact & (np.char.find(column, query) >= 0)
+        return exact, partial
+
+    def score(self, first_name: str = "", last_name: str = "", email: str = "", phone: str = "",
+              fuzzy_first: Optional[Dict[str, float]] = None, fuzzy_last: Optional[Dict[str, float]] = None):
+        """
+        Score all rows with the 50/40/30/20/10/8/5 rules plus fuzzy and phonetic name points.
+
+        Args:
+            fuzzy_first, fuzzy_last: {compact name: similarity} from ProfileSearchIndex.fuzzy_matches
+
+        Returns:
+            tuple: (scores array, [(match_reason, boolean array), ...]) with
+            the reasons listed in the same order score_profile appends them
+        """
+        scores = np.zeros(len(self), dtype=np.int32)
+        exact_flags = []
+        partial_flags = []
+        fuzzy = np.zeros(len(self), dtype=bool)
+        phonetic = np.zeros(len(self), dtype=bool)
+
+        if email:
+            exact, partial = self._exact_and_partial(self.emails, email)
+            scores += exact * 50 + partial * 10
+            exact_flags.append(("email_exact", exact))
+            partial_flags.append(("email_partial", partial))
+        for query, names, codes, similarities, reason, rules in (
+                (last_name, self.last_names, self.last_name_codes, fuzzy_last, "last_name",
+                 (30, 8, FUZZY_LAST_NAME_WEIGHT, PHONETIC_LAST_NAME_POINTS)),
+                (first_name, self.first_names, self.first_name_codes, fuzzy_first, "first_name",
+                 (20, 5, FUZZY_FIRST_NAME_WEIGHT, PHONETIC_FIRST_NAME_POINTS))):
+            if not query:
+                continue
+            points, exact, partial, is_fuzzy, sounds_alike = names.match(query, similarities or {}, *rules)
+            scores += points[codes]
+            exact_flags.append((f"{reason}_exact", exact[codes]))
+            partial_flags.append((f"{reason}_partial", partial[codes]))
+            if is_fuzzy.any():
+                fuzzy |= is_fuzzy[codes]
+            if sounds_alike.any():
+                phonetic |= sounds_alike[codes]
+        if phone:
+            exact = self.phones == phone
+            scores += exact * 40
+            exact_flags.append(("phone_exact", exact))
+
+        return scores, exact_flags + partial_flags + [("fuzzy", fuzzy), ("phonetic", phonetic)]
+
+
+# Process-wide index shared by the search endpoint and the profile write paths
+profile_search_index = ProfileSearchIndex()
+profile_snapshot.add_listener(profile_search_index.apply_snapshot)
+
+
+def get_profile_search_index(db) -> ProfileSearchIndex:
+    """
+    Return the shared profile search index. The profile snapshot is loaded on
+    first use and synced incrementally once it is older than its staleness bound.
+    """
+    profile_snapshot.ensure_fresh(db)
+    profile_search_index.ensure_loaded(db)
+    return profile_search_index
+
+
+def index_profile(email: str, fields: Dict[str, Any]):
+    """Push profile field changes into the shared search index."""
+    try:
+        profile_search_index.upsert(email, fields)
+    except Exception as e:
+        # Index maintenance must never fail a profile write
+        logger.error(f"Error updating profile search index for {email}: {e}")
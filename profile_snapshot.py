@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Any
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields of a user_profiles document kept in the snapshot
+PROFILE_SNAPSHOT_FIELDS = ['firstName', 'lastName', 'email', 'phone', 'GENDER',
+                           'currentProfileImageId', 'familyTreeId', 'updatedAt']
+
+# Maximum age in seconds of the snapshot before a read triggers an incremental
+# sync. 0 syncs on every read.
+PROFILE_SNAPSHOT_MAX_STALENESS = float(os.environ.get('PROFILE_SNAPSHOT_MAX_STALENESS', '30'))
+
+# Incremental syncs re-read documents updated up to this many seconds before
+# the watermark, so writes from app instances with a slightly slow clock are
+# not missed.
+PROFILE_SNAPSHOT_CLOCK_SKEW = float(os.environ.get('PROFILE_SNAPSHOT_CLOCK_SKEW', '5'))
+
+
+def _watermark_with_skew(watermark: str, skew: float) -> str:
+    """Move an ISO updatedAt watermark back by skew seconds."""
+    try:
+        return (datetime.fromisoformat(watermark) - timedelta(seconds=skew)).isoformat()
+    except (TypeError, ValueError):
+        return watermark
+
+
+class ProfileSnapshot:
+    """
+    Process-wide snapshot of the user_profiles collection.
+
+    The whole collection is streamed once. After that only documents whose
+    updatedAt is at or after the last sync watermark are pulled, and only
+    when the snapshot is older than the staleness bound. Listeners (the
+    profile search index) receive the initial load and every changed document.
+
+    Deletions are not visible through updatedAt, so delete paths have to
+    call remove().
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None, max_staleness: Optional[float] = None):
+        self.fields = fields or PROFILE_SNAPSHOT_FIELDS
+        self.max_staleness = PROFILE_SNAPSHOT_MAX_STALENESS if max_staleness is None else max_staleness
+        self.profiles = {}
+        self.watermark = ""
+        self.loaded = False
+        self.last_sync = None
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._listeners = []
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'fullLoads': 0,
+            'incrementalSyncs': 0,
+            'documentsPulled': 0,
+            'documentsChanged': 0,
+            'lastSyncMs': 0.0,
+        }
+
+    def add_listener(self, callback: Callable[[Dict[str, Dict[str, Any]], bool], None]):
+        """
+        Register callback(changed_profiles, full_load).
+        full_load is True when changed_profiles is the whole collection.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, changed: Dict[str, Dict[str, Any]], full_load: bool):
+        for callback in self._listeners:
+            try:
+                callback(changed, full_load)
+            except Exception as e:
+                logger.error(f"Error in profile snapshot listener: {e}")
+
+    def _project(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {field: data.get(field) for field in self.fields}
+
+    def _advance_watermark(self, data: Dict[str, Any]):
+        updated_at = data.get('updatedAt')
+        if isinstance(updated_at, str) and updated_at > self.watermark:
+            self.watermark = updated_at
+
+    # ------------------------------------------------------------------
+    # Syncing
+    # ------------------------------------------------------------------
+
+    def load(self, db) -> int:
+        """
+        Stream the whole collection and replace the snapshot.
+
+        Returns:
+            int: Number of profiles in the snapshot
+        """
+        with self._sync_lock:
+            return self._load_locked(db)
+
+    def _load_locked(self, db) -> int:
+        start = time.monotonic()
+        profiles = {}
+        watermark = ""
+        for doc in db.collection('user_profiles').select(self.fields).stream():
+            data = self._project(doc.to_dict() or {})
+            profiles[doc.id] = data
+            updated_at = data.get('updatedAt')
+            if isinstance(updated_at, str) and updated_at > watermark:
+                watermark = updated_at
+
+        with self._lock:
+            self.profiles = profiles
+            self.watermark = watermark
+            self.loaded = True
+            self.last_sync = time.monotonic()
+            self._metrics['fullLoads'] += 1
+            self._metrics['documentsPulled'] += len(profiles)
+            self._metrics['lastSyncMs'] = round((self.last_sync - start) * 1000, 2)
+
+        self._notify(profiles, True)
+        logger.info(f"Profile snapshot loaded {len(profiles)} profiles, watermark {watermark or '-'}")
+        return len(profiles)
+
+    def sync(self, db) -> int:
+        """
+        Pull the documents updated since the watermark.
+
+        Returns:
+            int: Number of profiles that changed
+        """
+        with self._sync_lock:
+            return self._sync_locked(db)
+
+    def _sync_locked(self, db) -> int:
+        start = time.monotonic()
+        # With an empty watermark this still only matches documents that have a string updatedAt
+        since = _watermark_with_skew(self.watermark, PROFILE_SNAPSHOT_CLOCK_SKEW) if self.watermark else ""
+        query = db.collection('user_profiles').where('updatedAt', '>=', since)
+        docs = list(query.select(self.fields).stream())
+
+        changed = {}
+        with self._lock:
+            for doc in docs:
+                data = self._project(doc.to_dict() or {})
+                if self.profiles.get(doc.id) != data:
+                    self.profiles[doc.id] = data
+                    changed[doc.id] = data
+                self._advance_watermark(data)
+            self.last_sync = time.monotonic()
+            self._metrics['incrementalSyncs'] += 1
+            self._metrics['documentsPulled'] += len(docs)
+            self._metrics['documentsChanged'] += len(changed)
+            self._metrics['lastSyncMs'] = round((self.last_sync - start) * 1000, 2)
+
+        if changed:
+            self._notify(changed, False)
+        return len(changed)
+
+    def lag(self) -> Optional[float]:
+        """Seconds since the last successful sync, None before the first load."""
+        last_sync = self.last_sync
+        return None if last_sync is None else time.monotonic() - last_sync
+
+    def ensure_fresh(self, db, max_staleness: Optional[float] = None) -> bool:
+        """
+        Make sure the snapshot is loaded and no older than the staleness bound.
+
+        A read that can be served without querying Firestore counts as a hit.
+        While another thread is already syncing, readers are served the
+        current snapshot instead of waiting.
+
+        Returns:
+            bool: True if the snapshot was served without a sync (hit)
+        """
+        bound = self.max_staleness if max_staleness is None else max_staleness
+
+        if not self.loaded:
+            with self._lock:
+                self._metrics['misses'] += 1
+            with self._sync_lock:
+                # Another thread may have finished the load while we waited
+                if not self.loaded:
+                    self._load_locked(db)
+            return False
+
+        lag = self.lag()
+        if lag is not None and lag <= bound:
+            with self._lock:
+                self._metrics['hits'] += 1
+            return True
+
+        if self._sync_lock.locked():
+            with self._lock:
+                self._metrics['hits'] += 1
+            return True
+
+        with self._lock:
+            self._metrics['misses'] += 1
+        try:
+            self.sync(db)
+        except Exception as e:
+            # A failed sync leaves the previous snapshot in place
+            logger.error(f"Error syncing profile snapshot: {e}")
+        return False
+
+    # ------------------------------------------------------------------
+    # Reads and local writes
+    # ------------------------------------------------------------------
+
+    def peek(self, email: str) -> Optional[Dict[str, Any]]:
+        """Return the snapshot copy of a profile without syncing."""
+        with self._lock:
+            profile = self.profiles.get(email)
+            return dict(profile) if profile is not None else None
+
+    def observe(self, email: str, data: Dict[str, Any]):
+        """
+        Record a profile document that was read or written elsewhere, so the
+        snapshot and its listeners pick it up without another read.
+        """
+        if not email or not self.loaded:
+            return
+        projected = self._project(data)
+        with self._lock:
+            previous = self.profiles.get(email)
+            if previous == projected:
+                return
+            if previous and (previous.get('updatedAt') or '') > (projected.get('updatedAt') or ''):
+                # Never replace a newer synced copy with an older read
+                return
+            self.profiles[email] = projected
+        self._notify({email: projected}, False)
+
+    def remove(self, email: str):
+        """Drop a deleted profile from the snapshot."""
+        with self._lock:
+            self.profiles.pop(email, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters, sync statistics and current lag."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics['hits'] + metrics['misses']
+            metrics.update({
+                'loaded': self.loaded,
+                'profiles': len(self.profiles),
+                'watermark': self.watermark,
+                'hitRate': round(metrics['hits'] / lookups, 4) if lookups else None,
+                'lagSeconds': round(self.lag(), 3) if self.last_sync is not None else None,
+                'maxStalenessSeconds': self.max_staleness,
+            })
+            return metrics
+
+
+# Process-wide snapshot shared by search and the profile read paths
+profile_snapshot = ProfileSnapshot()
+
+
+def get_profile_snapshot(db, max_staleness: Optional[float] = None) -> ProfileSnapshot:
+    """Return the shared profile snapshot, loading or syncing it as needed."""
+    profile_snapshot.ensure_fresh(db, max_staleness)
+    return profile_snapshot
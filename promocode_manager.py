@@ -1,5 +1,6 @@
 from datetime import datetime
 import logging
+from family_tree_email_index import index_family_tree_members
 
 logger = logging.getLogger(__name__)
 
@@ -89,6 +90,7 @@ def add_promocode(db, promocode, family_tree_id, node_id, name, sender_name):
             'familyMembers': updated_members,
             'updatedAt': timestamp
         })
+        index_family_tree_members(family_tree_id, updated_members, db)
         
         logger.info(f"Updated node {node_id} in family tree {family_tree_id} with promo code flag")
         
@@ -357,6 +359,7 @@ def update_tree_node_with_promocode(db, family_tree_id, node_id, name, promocode
             'familyMembers': updated_members,
             'updatedAt': timestamp
         })
+        index_family_tree_members(family_tree_id, updated_members, db)
         
         logger.info(f"Family tree document updated successfully")
         
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Any
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Approximate upper bound in bytes for all cached relationship results
+RELATIONSHIP_CACHE_MAX_BYTES = int(os.environ.get('RELATIONSHIP_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+# Member fields relationship labels are computed from. Cached results hold
+# only labels, every other field is read from the current familyMembers.
+RELATIONSHIP_FIELDS = ('id', 'parentId', 'spouse', 'gender', 'generation', 'name', 'email', 'isSelf')
+
+
+def relationship_fields(member: Dict[str, Any]) -> Tuple[Any, ...]:
+    """The RELATIONSHIP_FIELDS values of one member."""
+    return tuple(member.get(field) for field in RELATIONSHIP_FIELDS)
+
+
+def family_tree_version(family_members: List[Dict[str, Any]]) -> str:
+    """
+    Version of a tree's relationship structure, a digest of the
+    RELATIONSHIP_FIELDS of its members in order.
+
+    Every write that can change a label, from this or any other app
+    instance, yields a new version, so cache entries of the previous one
+    can never be served again. Profile images and other details are not
+    hashed, which keeps this cheap on every read of a tree with photos.
+    """
+    fields = [relationship_fields(member) for member in family_members or [] if isinstance(member, dict)]
+    payload = json.dumps(fields, default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+_PARENT_FIELD = RELATIONSHIP_FIELDS.index('parentId')
+
+
+def changed_member_ids(old_members: Dict[str, Tuple[Any, ...]],
+                       new_members: Dict[str, Tuple[Any, ...]]) -> Set[str]:
+    """
+    Ids touched by a familyMembers write: members added, removed or with
+    changed relationship fields, plus their old and new parents, whose
+    lists of children changed with them. Both arguments map member ids to
+    their relationship_fields.
+    """
+    changed = set()
+    for member_id in old_members.keys() | new_members.keys():
+        old_fields = old_members.get(member_id)
+        new_fields = new_members.get(member_id)
+        if old_fields != new_fields:
+            changed.add(member_id)
+            for fields in (old_fields, new_fields):
+                if fields and fields[_PARENT_FIELD]:
+                    changed.add(fields[_PARENT_FIELD])
+    return changed
+
+
+def _members_by_id(family_members: List[Dict[str, Any]]) -> Dict[str, Tuple[Any, ...]]:
+    """
+    Snapshot of the relationship_fields of a tree's members by id, all the
+    incremental recompute compares. Tuples, so managers mutating the lists
+    they wrote cannot change it, and no profile images are kept.
+    """
+    return {member.get('id'): relationship_fields(member) for member in family_members if isinstance(member, dict)}
+
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class RelationshipCache:
+    """
+    LRU cache of relationship results per (kind, familyTreeId, tree version, self node).
+
+    Only the latest version seen for a tree is kept: the first lookup or
+    store with a new version evicts all entries of the older one. Entries
+    are also evicted least recently used first once their estimated size,
+    plus the member snapshots kept for dependency tracking, exceeds
+    max_bytes.
+
+    Entries stored with the set of member ids they were computed from
+    survive writes that do not touch those ids: apply_family_members_write
+    carries them over to the new version and recomputes only the affected
+    ones with the function registered for their kind.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = RELATIONSHIP_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._tree_keys = {}
+        self._tree_versions = {}
+        # familyTreeId -> (version, {memberId: relationship fields}, size) for trees
+        # with dependency-tracked entries, the size counts toward max_bytes
+        self._tree_members = {}
+        self._recompute = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0,
+                         'carriedForward': 0, 'recomputed': 0}
+
+    def register_recompute(self, kind: str,
+                           compute: Callable[[List[Dict[str, Any]], List[str]], Dict[str, Tuple[Any, Set[str]]]]):
+        """
+        Register compute(family_members, self_keys) -> {self_key: (value, dependencies)}
+        used to refresh the affected entries of kind after a write.
+        """
+        self._recompute[kind] = compute
+
+    def _drop(self, key: Tuple[str, str, str, str]):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        tree_keys = self._tree_keys.get(key[1])
+        if tree_keys is not None:
+            tree_keys.discard(key)
+            if not tree_keys:
+                del self._tree_keys[key[1]]
+                self._tree_versions.pop(key[1], None)
+                self._untrack_members(key[1])
+
+    def _track_members(self, family_tree_id: str, version: str, members: Dict[str, Tuple[Any, ...]]):
+        self._untrack_members(family_tree_id)
+        size = _estimate_size(list(members.items()))
+        self._tree_members[family_tree_id] = (version, members, size)
+        self._bytes += size
+
+    def _untrack_members(self, family_tree_id: str):
+        tracked = self._tree_members.pop(family_tree_id, None)
+        if tracked is not None:
+            self._bytes -= tracked[2]
+
+    def _evict_over_limit(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self._metrics['evictions'] += 1
+
+    def _observe_version(self, family_tree_id: str, version: str):
+        """Evict a tree's entries of any version other than the one just seen."""
+        if self._tree_versions.get(family_tree_id) == version:
+            return
+        stale = [key for key in self._tree_keys.get(family_tree_id, ()) if key[2] != version]
+        for key in stale:
+            self._drop(key)
+        self._tree_versions[family_tree_id] = version
+        if stale:
+            self._metrics['invalidations'] += len(stale)
+
+    def get(self, kind: str, family_tree_id: str, version: str, self_key: str) -> Optional[Any]:
+        key = (kind, family_tree_id, version, self_key)
+        with self._lock:
+            self._observe_version(family_tree_id, version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics['hits'] += 1
+            return entry[0]
+
+    def put(self, kind: str, family_tree_id: str, version: str, self_key: str, value: Any,
+            dependencies: Optional[Iterable[str]] = None, family_members: Optional[List[Dict[str, Any]]] = None):
+        """
+        Store a result. With dependencies (the ids of the members the result
+        was computed from) and the family_members it was computed on, the
+        entry can outlive writes to other parts of the tree.
+        """
+        key = (kind, family_tree_id, version, self_key)
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._observe_version(family_tree_id, version)
+            if key in self._entries:
+                self._drop(key)
+            if dependencies is not None and family_members is not None:
+                tracked = self._tree_members.get(family_tree_id)
+                if tracked is None or tracked[0] != version:
+                    self._track_members(family_tree_id, version, _members_by_id(family_members))
+            else:
+                dependencies = None
+            self._entries[key] = (value, size, frozenset(dependencies) if dependencies is not None else None)
+            self._tree_keys.setdefault(family_tree_id, set()).add(key)
+            self._bytes += size
+            self._evict_over_limit()
+
+    def invalidate(self, family_tree_id: str):
+        """Drop every entry of a tree, e.g. after it was deleted."""
+        with self._lock:
+            self._tree_versions.pop(family_tree_id, None)
+            self._untrack_members(family_tree_id)
+            keys = list(self._tree_keys.get(family_tree_id, ()))
+            for key in keys:
+                self._drop(key)
+            self._metrics['invalidations'] += len(keys)
+
+    def apply_family_members_write(self, family_tree_id: str, family_members: Optional[List[Dict[str, Any]]]):
+        """
+        Move a tree's cached entries to the version just written.
+
+        Entries whose dependencies do not include a changed member, or the
+        parent of one, are carried over unchanged. Affected entries are
+        recomputed right away, so the cost of a write follows the size of
+        the neighbourhood it touched. Entries stored without dependencies
+        are dropped and recomputed on their next read.
+
+        Returns:
+            dict: Number of entries carried over, recomputed and dropped
+        """
+        counts = {'carriedForward': 0, 'recomputed': 0, 'dropped': 0}
+        if family_members is None:
+            self.invalidate(family_tree_id)
+            return counts
+
+        new_version = family_tree_version(family_members)
+        affected = {}
+        with self._lock:
+            old_version = self._tree_versions.get(family_tree_id)
+            if old_version == new_version or family_tree_id not in self._tree_keys:
+                return counts
+            tracked = self._tree_members.get(family_tree_id)
+            new_members = _members_by_id(family_members)
+            changed = changed_member_ids(tracked[1], new_members) if tracked and tracked[0] == old_version else None
+
+            for key in list(self._tree_keys.get(family_tree_id, ())):
+                value, size, dependencies = self._entries[key]
+                if changed is None or dependencies is None or key[2] != old_version:
+                    self._drop(key)
+                    counts['dropped'] += 1
+                    continue
+                if dependencies & changed:
+                    self._drop(key)
+                    if key[0] in self._recompute:
+                        affected.setdefault(key[0], []).append(key[3])
+                    else:
+                        counts['dropped'] += 1
+                    continue
+                # Untouched neighbourhood: re-key the entry to the new version in place
+                del self._entries[key]
+                self._tree_keys[family_tree_id].discard(key)
+                new_key = (key[0], family_tree_id, new_version, key[3])
+                self._entries[new_key] = (value, size, dependencies)
+                self._tree_keys[family_tree_id].add(new_key)
+                counts['carriedForward'] += 1
+
+            self._tree_versions[family_tree_id] = new_version
+            if family_tree_id in self._tree_keys:
+                self._track_members(family_tree_id, new_version, new_members)
+                self._evict_over_limit()
+            self._metrics['invalidations'] += counts['dropped']
+            self._metrics['carriedForward'] += counts['carriedForward']
+
+        for kind, self_keys in affected.items():
+            for self_key, (value, dependencies) in self._recompute[kind](family_members, self_keys).items():
+                self.put(kind, family_tree_id, new_version, self_key, value, dependencies, family_members)
+                counts['recomputed'] += 1
+        with self._lock:
+            self._metrics['recomputed'] += counts['recomputed']
+
+        if any(counts.values()):
+            logger.info(f"Relationship cache for family tree {family_tree_id}: {counts['carriedForward']} carried over, "
+                        f"{counts['recomputed']} recomputed, {counts['dropped']} dropped")
+        return counts
+
+    def get_or_compute(self, kind: str, family_tree_id: str, version: str, self_key: str,
+                       compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result or compute and store it.
+        Results without a familyTreeId are computed but never cached.
+        """
+        if not family_tree_id:
+            return compute()
+        value = self.get(kind, family_tree_id, version, self_key)
+        if value is None:
+            value = compute()
+            self.put(kind, family_tree_id, version, self_key, value)
+        return value
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters, evictions and memory use."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics['hits'] + metrics['misses']
+            metrics.update({
+                'entries': len(self._entries),
+                'familyTrees': len(self._tree_keys),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hitRate': round(metrics['hits'] / lookups, 4) if lookups else None,
+            })
+            return metrics
+
+
+# Process-wide cache shared by the connections and relatives tree endpoints
+relationship_cache = RelationshipCache()
@@ -0,0 +1,169 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bound in bytes of the rendered images kept in memory
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Upper bound in bytes of the rendered images kept on disk
+RENDER_CACHE_DISK_MAX_BYTES = int(os.environ.get('RENDER_CACHE_DISK_MAX_BYTES', str(256 * 1024 * 1024)))
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'family_tree_renders'))
+
+
+class RenderCache:
+    """
+    Two-level LRU cache of rendered images keyed by a content hash.
+
+    The memory level holds the most recently used images up to max_bytes.
+    Every image is also written to directory as <key>.png, so renders
+    survive restarts and are shared by the worker processes of one host.
+    disk_max_bytes bounds the directory as a whole: hits refresh a file's
+    mtime, and a process re-reads the directory before it evicts, so the
+    least recently used files of all processes go first. Keys are content
+    hashes, so an entry never goes stale and there is nothing to
+    invalidate.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 disk_max_bytes: Optional[int] = None):
+        self.directory = RENDER_CACHE_DIR if directory is None else directory
+        self.max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.disk_max_bytes = RENDER_CACHE_DISK_MAX_BYTES if disk_max_bytes is None else disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._metrics = {'memoryHits': 0, 'diskHits': 0, 'misses': 0, 'stores': 0,
+                         'memoryEvictions': 0, 'diskEvictions': 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load_disk_index(self):
+        """Sizes of the images already on disk, read on first use."""
+        if self._disk is None:
+            self._scan_disk()
+
+    def _scan_disk(self):
+        """Sizes of the images on disk, least recently used first, including other processes' writes."""
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.png'):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        # Evicted by another process in between
+                        continue
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self._disk_bytes += size
+        except OSError as e:
+            logger.warning(f"Render cache directory {self.directory} unavailable: {e}")
+
+    def _remember(self, key: str, data: bytes):
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        if len(data) > self.max_bytes:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._metrics['memoryEvictions'] += 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The image stored under key, None if it was never rendered or was evicted."""
+        if not key:
+            return None
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._metrics['memoryHits'] += 1
+                return data
+
+            self._load_disk_index()
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                self._disk.pop(key, None)
+                self._metrics['misses'] += 1
+                return None
+            if key not in self._disk:
+                # Written by another process
+                self._disk_bytes += len(data)
+            self._disk[key] = len(data)
+            self._disk.move_to_end(key)
+            self._remember(key, data)
+            self._metrics['diskHits'] += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        """Store an image in memory and on disk, evicting the least recently used ones."""
+        if not key or not data:
+            return
+        with self._lock:
+            self._remember(key, data)
+            self._metrics['stores'] += 1
+
+            self._load_disk_index()
+            if len(data) > self.disk_max_bytes:
+                return
+            path = self._path(key)
+            try:
+                # Write under a temporary name so readers never see a partial file
+                fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write rendered image {key} to disk: {e}")
+                return
+            # The other worker processes write to the same directory, a store
+            # follows a full render so listing it each time costs little
+            self._scan_disk()
+            if key in self._disk:
+                self._disk.move_to_end(key)
+
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                evicted_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._metrics['diskEvictions'] += 1
+                try:
+                    os.remove(self._path(evicted_key))
+                except OSError:
+                    pass
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters, evictions and memory and disk use."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics['memoryHits'] + metrics['diskHits'] + metrics['misses']
+            metrics.update({
+                'memoryEntries': len(self._memory),
+                'memoryBytes': self._memory_bytes,
+                'maxBytes': self.max_bytes,
+                'diskEntries': len(self._disk) if self._disk is not None else None,
+                'diskBytes': self._disk_bytes if self._disk is not None else None,
+                'diskMaxBytes': self.disk_max_bytes,
+                'hitRate': round((lookups - metrics['misses']) / lookups, 4) if lookups else None,
+            })
+            return metrics
+
+
+# Process-wide cache of rendered family tree images
+render_cache = RenderCache()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from socket_manager import notify_render_job
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Worker processes rendering trees
+RENDER_JOB_WORKERS = int(os.environ.get('RENDER_JOB_WORKERS', '2'))
+# Jobs queued or running at once, further submissions are rejected
+RENDER_JOB_MAX_PENDING = int(os.environ.get('RENDER_JOB_MAX_PENDING', '32'))
+# Seconds a finished job's result stays available for polling
+RENDER_JOB_RESULT_TTL = int(os.environ.get('RENDER_JOB_RESULT_TTL', '600'))
+# Finished jobs kept at most, oldest are dropped first
+RENDER_JOB_MAX_FINISHED = 256
+# Start method of the worker processes. Forking the multi-threaded server
+# can copy locks held by other threads (gRPC, Socket.IO) into a worker,
+# spawned workers start from a fresh interpreter instead.
+RENDER_JOB_START_METHOD = os.environ.get('RENDER_JOB_START_METHOD', 'spawn')
+
+
+def render_content_key(*parts: Any) -> str:
+    """Stable hash of the inputs of a render, used to spot identical jobs."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class RenderJobQueue:
+    """
+    Tree renders run in a pool of worker processes instead of the request thread.
+
+    submit() returns at once with a job id that clients poll with get(),
+    or they wait for the 'render_job' Socket.IO event sent to their email.
+    An identical job (same owner, kind and content key) that is still
+    queued or running is returned instead of starting a second one, and
+    submissions beyond max_pending are rejected.
+
+    Render functions and their arguments must be picklable, i.e. module
+    level functions, since workers are spawned processes that import the
+    function's module themselves. on_done runs in this process on the worker's result,
+    for follow-up work such as storing the image, and its return value is
+    the job result.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 result_ttl: Optional[int] = None):
+        self.workers = RENDER_JOB_WORKERS if workers is None else workers
+        self.max_pending = RENDER_JOB_MAX_PENDING if max_pending is None else max_pending
+        self.result_ttl = RENDER_JOB_RESULT_TTL if result_ttl is None else result_ttl
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._metrics = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(RENDER_JOB_START_METHOD))
+        return self._executor
+
+    def _prune(self):
+        """Forget finished jobs past their TTL or beyond RENDER_JOB_MAX_FINISHED."""
+        now = time.time()
+        finished = [job_id for job_id, job in self._jobs.items() if job['finishedAt'] is not None]
+        excess = len(finished) - RENDER_JOB_MAX_FINISHED
+        for i, job_id in enumerate(finished):
+            if i < excess or now - self._jobs[job_id]['finishedAt'] > self.result_ttl:
+                del self._jobs[job_id]
+
+    def _view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        status = job['status']
+        if status == 'queued' and job['future'].running():
+            status = 'running'
+        view = {
+            'jobId': job['id'],
+            'kind': job['kind'],
+            'status': status,
+            'createdAt': datetime.fromtimestamp(job['createdAt']).isoformat(),
+            'finishedAt': datetime.fromtimestamp(job['finishedAt']).isoformat() if job['finishedAt'] else None,
+        }
+        if status == 'done':
+            view['result'] = job['result']
+        elif status == 'failed':
+            view['error'] = job['error']
+        return view
+
+    def submit(self, kind: str, owner: Optional[str], content_key: str, render: Callable, *args,
+               on_done: Optional[Callable[[Any], Any]] = None, notify_email: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Queue render(*args) on the worker pool.
+
+        Args:
+            kind: Kind of render, e.g. 'family_tree'
+            owner: User or tree the job belongs to, scope of the dedupe
+            content_key: render_content_key of the inputs
+            render: Module level render function
+            on_done: Turns the render result into the job result, may raise to fail the job
+            notify_email: User to notify over Socket.IO when the job finishes
+
+        Returns:
+            dict: The job (the existing one for a duplicate), None if the queue is full
+        """
+        dedupe_key = (owner, kind, content_key)
+        with self._lock:
+            self._prune()
+            job_id = self._in_flight.get(dedupe_key)
+            if job_id is not None:
+                self._metrics['deduplicated'] += 1
+                return self._view(self._jobs[job_id])
+            if len(self._in_flight) >= self.max_pending:
+                self._metrics['rejected'] += 1
+                logger.warning(f"Render queue full ({len(self._in_flight)} jobs), rejected {kind} job of {owner}")
+                return None
+
+            try:
+                future = self._pool().submit(render, *args)
+            except BrokenProcessPool:
+                # A worker died, start a fresh pool
+                logger.error("Render worker pool broken, restarting it")
+                self._executor = None
+                future = self._pool().submit(render, *args)
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'kind': kind,
+                'owner': owner,
+                'status': 'queued',
+                'createdAt': time.time(),
+                'finishedAt': None,
+                'result': None,
+                'error': None,
+                'future': future,
+            }
+            self._jobs[job['id']] = job
+            self._in_flight[dedupe_key] = job['id']
+            self._metrics['submitted'] += 1
+            view = self._view(job)
+
+        future.add_done_callback(lambda done: self._finish(job, dedupe_key, done, on_done, notify_email))
+        return view
+
+    def _finish(self, job: Dict[str, Any], dedupe_key, future, on_done, notify_email):
+        result, error = None, None
+        try:
+            result = future.result()
+            if on_done:
+                result = on_done(result)
+        except Exception as e:
+            logger.error(f"Render job {job['id']} ({job['kind']}) failed: {e}")
+            error = str(e)
+
+        with self._lock:
+            job.update({
+                'status': 'failed' if error else 'done',
+                'result': result,
+                'error': error,
+                'finishedAt': time.time(),
+            })
+            self._in_flight.pop(dedupe_key, None)
+            self._metrics['failed' if error else 'completed'] += 1
+            view = self._view(job)
+
+        if notify_email:
+            # Clients fetch the result by polling, the event only carries the status
+            notify_render_job(notify_email, {key: value for key, value in view.items() if key != 'result'})
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's status and, once done, its result. None if unknown or expired."""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def metrics(self) -> Dict[str, Any]:
+        """Job counters and queue depth."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics.update({
+                'pending': len(self._in_flight),
+                'maxPending': self.max_pending,
+                'workers': self.workers,
+                'jobs': len(self._jobs),
+            })
+            return metrics
+
+
+# Process-wide render queue, its worker pool starts with the first job
+render_jobs = RenderJobQueue()
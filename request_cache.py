@@ -0,0 +1,136 @@
+import logging
+from typing import Any, Dict, Optional
+
+from flask import g, has_request_context
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Response header carrying the number of document reads the cache saved
+READS_SAVED_HEADER = 'X-Firestore-Reads-Saved'
+
+
+class RequestDocumentCache:
+    """
+    Identity map of document snapshots read during one request.
+
+    Snapshots are keyed by document path. A write through a cached
+    reference drops that path, so a later get() sees the new data.
+    """
+
+    def __init__(self):
+        self.snapshots = {}
+        self.reads = 0
+        self.hits = 0
+
+    def get(self, reference, **kwargs):
+        # Transactional and projected reads always go to Firestore
+        if kwargs:
+            self.reads += 1
+            return reference.get(**kwargs)
+
+        path = reference.path
+        if path in self.snapshots:
+            self.hits += 1
+            return self.snapshots[path]
+
+        self.reads += 1
+        snapshot = reference.get()
+        self.snapshots[path] = snapshot
+        return snapshot
+
+    def invalidate(self, path: str):
+        self.snapshots.pop(path, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'reads': self.reads, 'readsSaved': self.hits, 'documents': len(self.snapshots)}
+
+
+class CachedDocumentReference:
+    """DocumentReference whose get() goes through the request cache."""
+
+    def __init__(self, reference, cache: RequestDocumentCache):
+        self._reference = reference
+        self._cache = cache
+
+    def get(self, **kwargs):
+        return self._cache.get(self._reference, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self._cache.invalidate(self._reference.path)
+        return self._reference.set(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self._cache.invalidate(self._reference.path)
+        return self._reference.update(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._cache.invalidate(self._reference.path)
+        return self._reference.delete(*args, **kwargs)
+
+    def collection(self, collection_id: str) -> 'CachedCollectionReference':
+        return CachedCollectionReference(self._reference.collection(collection_id), self._cache)
+
+    def __getattr__(self, name):
+        return getattr(self._reference, name)
+
+
+class CachedCollectionReference:
+    """CollectionReference handing out cached document references."""
+
+    def __init__(self, reference, cache: RequestDocumentCache):
+        self._reference = reference
+        self._cache = cache
+
+    def document(self, document_id: Optional[str] = None) -> CachedDocumentReference:
+        return CachedDocumentReference(self._reference.document(document_id), self._cache)
+
+    def __getattr__(self, name):
+        return getattr(self._reference, name)
+
+
+class CachedFirestore:
+    """
+    Firestore client wrapper for one request.
+
+    collection().document().get() calls are served from the request cache
+    after the first read. Queries, batches and transactions are passed
+    through to the wrapped client unchanged.
+    """
+
+    def __init__(self, client, cache: Optional[RequestDocumentCache] = None):
+        self._client = client
+        self.cache = cache or RequestDocumentCache()
+
+    def collection(self, collection_id: str) -> CachedCollectionReference:
+        return CachedCollectionReference(self._client.collection(collection_id), self.cache)
+
+    def document(self, document_path: str) -> CachedDocumentReference:
+        return CachedDocumentReference(self._client.document(document_path), self.cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def request_scoped_db(client) -> Any:
+    """
+    Return the cached client of the current request, wrapping client on first use.
+    Outside a request context a fresh, unshared wrapper is returned.
+    """
+    if client is None:
+        return None
+    if not has_request_context():
+        return CachedFirestore(client)
+    cached = getattr(g, '_request_firestore', None)
+    if cached is None or cached._client is not client:
+        cached = CachedFirestore(client)
+        g._request_firestore = cached
+    return cached
+
+
+def request_cache_stats() -> Optional[Dict[str, int]]:
+    """Read statistics of the current request's cache, None if it was not used."""
+    if not has_request_context():
+        return None
+    cached = getattr(g, '_request_firestore', None)
+    return cached.cache.stats() if cached is not None else None
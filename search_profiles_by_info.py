@@ -4,8 +4,16 @@ from datetime import datetime
 import uuid
 import os
 import logging
+import base64
+import hashlib
+import heapq
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
 from werkzeug.utils import secure_filename
 from google.cloud.firestore_v1.base_query import FieldFilter
+from profile_search_index import get_profile_search_index, trigram_similarity
 
 
 
@@ -13,11 +21,186 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def search_profiles_by_info(first_name=None, last_name=None, email=None, phone=None, db=None):
+# Supported values for the image_mode argument of search_profiles_by_info
+IMAGE_MODE_FULL = 'full'            # full base64 imageData (original behaviour)
+IMAGE_MODE_THUMBNAIL = 'thumbnail'  # small JPEG thumbnail of the profile image
+IMAGE_MODE_REFERENCE = 'reference'  # only the profileImages document id, no image read
+IMAGE_MODES = (IMAGE_MODE_FULL, IMAGE_MODE_THUMBNAIL, IMAGE_MODE_REFERENCE)
+
+# Thumbnail edge length in pixels and maximum number of documents per get_all call
+THUMBNAIL_SIZE = 96
+IMAGE_BATCH_SIZE = 100
+
+# Page size limits for paginated search
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
+# Scored candidate lists kept per (query, index version) so following pages
+# of the same query don't rescore every candidate
+SCORED_CACHE_SIZE = 32
+_scored_cache = OrderedDict()
+_scored_cache_lock = threading.Lock()
+
+
+def make_thumbnail(image_data, size=THUMBNAIL_SIZE):
     """
-    Function to search for profiles matching any combination of:
-    first name, last name, email, and phone number, or fetch all profiles if no parameters are provided.
-    Returns profiles sorted by relevance score, with highest matches first.
+    Downscale a base64 profile image to a small JPEG thumbnail.
+    Keeps the data URL prefix convention of the input.
+    
+    Args:
+        image_data (str): Base64 image data, with or without a data: prefix
+        size (int): Maximum width/height of the thumbnail
+        
+    Returns:
+        str: Base64 encoded thumbnail, or the original data if it can't be decoded
+    """
+    if not image_data or not isinstance(image_data, str):
+        return image_data
+    
+    from PIL import Image
+    
+    try:
+        has_prefix = image_data.startswith('data:')
+        encoded = image_data.split(',', 1)[1] if has_prefix else image_data
+        img = Image.open(BytesIO(base64.b64decode(encoded)))
+        img = img.convert('RGB')
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        
+        output = BytesIO()
+        img.save(output, 'JPEG', quality=80)
+        thumbnail = base64.b64encode(output.getvalue()).decode('utf-8')
+        return 'data:image/jpeg;base64,' + thumbnail if has_prefix else thumbnail
+    except Exception as e:
+        logger.warning(f"Could not create profile image thumbnail: {e}")
+        return image_data
+
+
+def hydrate_profile_images(matches, db, image_mode=IMAGE_MODE_FULL):
+    """
+    Attach profile images to already ranked search results.
+    
+    All image documents for the given matches are fetched with batched
+    multi-document reads instead of one round trip per profile.
+    Each match must carry "documentId" and "currentProfileImageId";
+    both are removed from the match once it has been hydrated.
+    
+    Args:
+        matches (list): Ranked matches to hydrate (modified in place)
+        db: Firestore database instance
+        image_mode (str): One of IMAGE_MODES
+        
+    Returns:
+        list: The same matches with "profileImage" (or "profileImageId") set
+    """
+    image_refs = {}
+    for match in matches:
+        image_id = match.get("currentProfileImageId")
+        if image_id and image_mode != IMAGE_MODE_REFERENCE:
+            ref = db.collection('user_profiles').document(match["documentId"]).collection('profileImages').document(image_id)
+            image_refs[ref.path] = ref
+    
+    images = {}
+    ref_list = list(image_refs.values())
+    for start in range(0, len(ref_list), IMAGE_BATCH_SIZE):
+        for image_doc in db.get_all(ref_list[start:start + IMAGE_BATCH_SIZE]):
+            if image_doc.exists:
+                images[image_doc.reference.path] = image_doc.to_dict().get('imageData')
+    
+    if ref_list:
+        print(f"Fetched {len(images)} profile images in {(len(ref_list) + IMAGE_BATCH_SIZE - 1) // IMAGE_BATCH_SIZE} batch read(s)")
+    
+    for match in matches:
+        document_id = match.pop("documentId", None)
+        image_id = match.pop("currentProfileImageId", None)
+        
+        if image_mode == IMAGE_MODE_REFERENCE:
+            match["profileImage"] = None
+            match["profileImageId"] = image_id
+            continue
+        
+        image_data = None
+        if image_id:
+            path = db.collection('user_profiles').document(document_id).collection('profileImages').document(image_id).path
+            image_data = images.get(path)
+        
+        if image_mode == IMAGE_MODE_THUMBNAIL:
+            image_data = make_thumbnail(image_data)
+        match["profileImage"] = image_data
+    
+    return matches
+
+
+def encode_search_cursor(match, query_key):
+    """
+    Build an opaque cursor pointing just after the given ranked match.
+    The cursor stores the (score, documentId) sort key, so pages stay stable
+    even if profiles are added or updated between requests.
+    """
+    payload = json.dumps({"s": match["matchScore"], "id": match["documentId"], "q": query_key})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('utf-8')
+
+
+def decode_search_cursor(cursor, query_key):
+    """
+    Decode a cursor produced by encode_search_cursor.
+    
+    Returns:
+        tuple: (score, documentId) of the last match on the previous page
+        
+    Raises:
+        ValueError: If the cursor is malformed or belongs to a different query
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8'))
+        score, document_id, cursor_query = payload["s"], payload["id"], payload["q"]
+    except Exception:
+        raise ValueError("Invalid search cursor")
+    
+    if cursor_query != query_key:
+        raise ValueError("Search cursor does not belong to this query")
+    return score, document_id
+
+
+def _ranking_key(match):
+    """Sort key for ranked matches: highest score first, then document id."""
+    return (-match["matchScore"], match["documentId"])
+
+
+def _get_scored_matches(search_index, first_name, last_name, email, phone):
+    """
+    Return the scored candidates for a normalized query, reusing the result
+    of an earlier page of the same query while the index is unchanged.
+    """
+    cache_key = (first_name, last_name, email, phone, search_index.version)
+    
+    with _scored_cache_lock:
+        cached = _scored_cache.get(cache_key)
+        if cached is not None:
+            _scored_cache.move_to_end(cache_key)
+            return cached
+    
+    scored_matches = search_index.search(
+        first_name=first_name,
+        last_name=last_name,
+        email=email,
+        phone=phone
+    )
+    
+    with _scored_cache_lock:
+        _scored_cache[cache_key] = scored_matches
+        while len(_scored_cache) > SCORED_CACHE_SIZE:
+            _scored_cache.popitem(last=False)
+    return scored_matches
+
+
+def search_profiles_page(first_name=None, last_name=None, email=None, phone=None, db=None,
+                         image_mode=IMAGE_MODE_FULL, limit=None, cursor=None):
+    """
+    Search profiles and return one page of results.
+    
+    The top `limit` matches after the cursor are picked with a bounded heap
+    selection, so the cost of building a page does not depend on how many
+    profiles match. Profile images are only fetched for the returned page.
     
     Args:
         first_name (str, optional): First name to search for
@@ -25,202 +208,153 @@ def search_profiles_by_info(first_name=None, last_name=None, email=None, phone=N
         email (str, optional): Email to search for
         phone (str, optional): Phone number to search for
         db: Firestore database instance
+        image_mode (str, optional): 'full', 'thumbnail' or 'reference'
+        limit (int, optional): Maximum number of matches to return (None for all)
+        cursor (str, optional): nextCursor value from the previous page
         
     Returns:
-        list: List of all matching profile data sorted by relevance score (highest first)
+        dict: {"matches": [...], "nextCursor": str or None, "hasMore": bool}
     """
     
     try:
         # Log input parameters
-        print(f"Searching profiles with: first_name={first_name}, last_name={last_name}, email={email}, phone={phone}")
+        print(f"Searching profiles with: first_name={first_name}, last_name={last_name}, email={email}, phone={phone}, limit={limit}")
         
         # Check if we're in development mode
         if not db:
             logger.warning("Development mode - returning empty results for profile search")
             print("No database provided, returning empty list (dev mode)")
-            return []
+            return {"matches": [], "nextCursor": None, "hasMore": False}
+        
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"Invalid image mode: {image_mode}. Expected one of {', '.join(IMAGE_MODES)}")
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be a positive integer")
         
         # Normalize input for comparison
-        if first_name:
-            first_name = first_name.lower().strip()
-            print(f"Normalized first_name: {first_name}")
-        if last_name:
-            last_name = last_name.lower().strip()
-            print(f"Normalized last_name: {last_name}")
-        if email:
-            email = email.lower().strip()
-            print(f"Normalized email: {email}")
-        if phone:
-            phone = ''.join(filter(str.isdigit, phone))
-            print(f"Normalized phone: {phone}")
-        
-        matches = []
-        scored_matches = []
+        first_name = first_name.lower().strip() if first_name else ""
+        last_name = last_name.lower().strip() if last_name else ""
+        email = email.lower().strip() if email else ""
+        phone = ''.join(filter(str.isdigit, phone)) if phone else ""
+        
+        query_key = hashlib.md5(f"{first_name}|{last_name}|{email}|{phone}".encode('utf-8')).hexdigest()
+        after_key = None
+        if cursor:
+            after_score, after_id = decode_search_cursor(cursor, query_key)
+            after_key = (-after_score, after_id)
         
         # Step 1: If email is provided, do a direct lookup
-        if email:
+        if email and not cursor:
             print(f"Attempting direct email lookup for: {email}")
             doc = db.collection('user_profiles').document(email).get()
             if doc.exists:
                 profile = doc.to_dict()
                 
-                # Get profile image
-                profile_image_base64 = None
-                current_image_id = profile.get('currentProfileImageId')
-                
-                if current_image_id:
-                    print(f"Fetching profile image with ID: {current_image_id}")
-                    image_doc = db.collection('user_profiles').document(email).collection('profileImages').document(current_image_id).get()
-                    if image_doc.exists:
-                        profile_image_base64 = image_doc.to_dict().get('imageData')
-                
-                matches.append({
+                matches = [{
                     "email": email,
                     "firstName": profile.get('firstName'),
                     "lastName": profile.get('lastName'),
                     "phone": profile.get('phone'),
                     "gender": profile.get('GENDER'),
-                    "profileImage": profile_image_base64,
+                    "documentId": email,
+                    "currentProfileImageId": profile.get('currentProfileImageId'),
                     "matchScore": 100  # Perfect match score for exact email
-                })
+                }]
                 print(f"Email match found: {email}")
-                return matches  # Return immediately if email matches, as it's already perfect match
-        
-        # Create a collection of all profiles to score
-        all_profiles = []
-        
-        # Fetch all profiles
-        all_docs = db.collection('user_profiles').stream()
-        for doc in all_docs:
-            profile = doc.to_dict()
-            profile_email = doc.id
-            profile_data = {
-                "email": profile_email,
-                "firstName": profile.get('firstName', ''),
-                "lastName": profile.get('lastName', ''),
-                "phone": profile.get('phone', ''),
-                "gender": profile.get('GENDER', ''),
-                "currentProfileImageId": profile.get('currentProfileImageId')
-            }
-            all_profiles.append(profile_data)
+                # Return immediately if email matches, as it's already perfect match
+                return {
+                    "matches": hydrate_profile_images(matches, db, image_mode),
+                    "nextCursor": None,
+                    "hasMore": False
+                }
         
-        # Score and filter profiles
-        for profile in all_profiles:
-            score = 0
-            match_reasons = []
-            
-            profile_first_name = profile["firstName"].lower().strip() if profile["firstName"] else ""
-            profile_last_name = profile["lastName"].lower().strip() if profile["lastName"] else ""
-            profile_email = profile["email"].lower().strip()
-            profile_phone = ''.join(filter(str.isdigit, profile["phone"])) if profile["phone"] else ""
-            
-            # Score by field matches
-            if email and email == profile_email:
-                score += 50
-                match_reasons.append("email_exact")
-            
-            if last_name and last_name == profile_last_name:
-                score += 30
-                match_reasons.append("last_name_exact")
-            
-            if first_name and first_name == profile_first_name:
-                score += 20
-                match_reasons.append("first_name_exact")
-            
-            if phone and phone == profile_phone:
-                score += 40
-                match_reasons.append("phone_exact")
-            
-            # Add partial matching (can be improved with better string matching algorithm)
-            if email and not "email_exact" in match_reasons and email in profile_email:
-                score += 10
-                match_reasons.append("email_partial")
-            
-            if last_name and not "last_name_exact" in match_reasons and last_name in profile_last_name:
-                score += 8
-                match_reasons.append("last_name_partial")
+        # Score only the profiles the in-process index says can match,
+        # instead of streaming and scoring the whole user_profiles collection
+        search_index = get_profile_search_index(db)
+        if search_index.use_vectorized():
+            # Columnar NumPy path: scoring, cursor filtering and ranking are array operations
+            page, has_more = search_index.search_page_vectorized(
+                first_name, last_name, email, phone, limit=limit, after_key=after_key
+            )
+        else:
+            scored_matches = _get_scored_matches(search_index, first_name, last_name, email, phone)
+            print(f"Scored {len(scored_matches)} candidate profiles from search index")
             
-            if first_name and not "first_name_exact" in match_reasons and first_name in profile_first_name:
-                score += 5
-                match_reasons.append("first_name_partial")
+            if after_key is not None:
+                remaining = (match for match in scored_matches if _ranking_key(match) > after_key)
+            else:
+                remaining = scored_matches
             
-            # Only include profiles with a score > 0 or if no search criteria provided
-            if score > 0 or not (first_name or last_name or email or phone):
-                if not (first_name or last_name or email or phone):
-                    # If no criteria provided, give base score for sorting
-                    score = 1
-                
-                # Get profile image
-                profile_image_base64 = None
-                current_image_id = profile.get("currentProfileImageId")
-                
-                if current_image_id:
-                    print(f"Fetching profile image with ID: {current_image_id} for email: {profile_email}")
-                    image_doc = db.collection('user_profiles').document(profile_email).collection('profileImages').document(current_image_id).get()
-                    if image_doc.exists:
-                        profile_image_base64 = image_doc.to_dict().get('imageData')
-                
-                scored_matches.append({
-                    "email": profile_email,
-                    "firstName": profile["firstName"],
-                    "lastName": profile["lastName"],
-                    "phone": profile["phone"],
-                    "gender": profile["gender"],
-                    "profileImage": profile_image_base64,
-                    "matchScore": score,
-                    "matchReasons": match_reasons
-                })
-                print(f"Match found: {profile_email}, Score: {score}, Reasons: {match_reasons}")
-        
-        # Sort by match score in descending order
-        sorted_matches = sorted(scored_matches, key=lambda x: x["matchScore"], reverse=True)
+            # Highest scores first; ties keep document-id order like the original stream
+            if limit is None:
+                page = sorted(remaining, key=_ranking_key)
+                has_more = False
+            else:
+                page = heapq.nsmallest(limit + 1, remaining, key=_ranking_key)
+                has_more = len(page) > limit
+                page = page[:limit]
+        
+        next_cursor = encode_search_cursor(page[-1], query_key) if has_more else None
         
         # Remove score and match_reasons from the final result if not needed in the response
         final_matches = []
-        for match in sorted_matches:
+        for match in page:
             final_match = {
                 "email": match["email"],
                 "firstName": match["firstName"],
                 "lastName": match["lastName"],
                 "phone": match["phone"],
                 "gender": match["gender"],
-                "profileImage": match["profileImage"]
+                "documentId": match["documentId"],
+                "currentProfileImageId": match["currentProfileImageId"]
             }
             final_matches.append(final_match)
         
+        # Fetch images only for the results that are actually returned
+        hydrate_profile_images(final_matches, db, image_mode)
+        
         # Log total matches
-        print(f"Total matches found: {len(final_matches)}")
-        return final_matches
+        print(f"Returning {len(final_matches)} matches, hasMore={has_more}")
+        return {"matches": final_matches, "nextCursor": next_cursor, "hasMore": has_more}
     
     except Exception as e:
         logger.error(f"Error searching profiles: {e}")
         print(f"Exception occurred: {e}")
         raise e
 
+
+def search_profiles_by_info(first_name=None, last_name=None, email=None, phone=None, db=None, image_mode=IMAGE_MODE_FULL):
+    """
+    Function to search for profiles matching any combination of:
+    first name, last name, email, and phone number, or fetch all profiles if no parameters are provided.
+    Returns profiles sorted by relevance score, with highest matches first.
+    Use search_profiles_page for paginated results.
+    
+    Args:
+        first_name (str, optional): First name to search for
+        last_name (str, optional): Last name to search for
+        email (str, optional): Email to search for
+        phone (str, optional): Phone number to search for
+        db: Firestore database instance
+        image_mode (str, optional): 'full' (default) returns imageData, 'thumbnail' returns
+            a downscaled JPEG, 'reference' returns only profileImageId
+        
+    Returns:
+        list: List of all matching profile data sorted by relevance score (highest first)
+    """
+    return search_profiles_page(
+        first_name=first_name,
+        last_name=last_name,
+        email=email,
+        phone=phone,
+        db=db,
+        image_mode=image_mode
+    )["matches"]
+
 def calculate_similarity(str1, str2):
-    """Optimized similarity calculation (kept for potential future use)"""
-    print(f"Calculating similarity between '{str1}' and '{str2}'")
-    if not str1 and not str2:
-        print("Both strings empty, similarity = 1.0")
-        return 1.0
-    
-    if not str1 or not str2:
-        print("One string empty, similarity = 0.0")
-        return 0.0
-    
-    if str1 == str2:
-        print("Exact match, similarity = 1.0")
-        return 1.0
-    
-    # Use set operations for faster character comparison
-    str1_set = set(str1)
-    str2_set = set(str2)
-    print(f"str1_set: {str1_set}, str2_set: {str2_set}")
-    
-    # Calculate Jaccard similarity
-    intersection = len(str1_set.intersection(str2_set))
-    union = len(str1_set.union(str2_set))
-    similarity = intersection / union if union > 0 else 0.0
-    print(f"Intersection: {intersection}, Union: {union}, Similarity: {similarity}")
-    
-    return similarity
+    """
+    Trigram similarity between two names (0.0 - 1.0).
+    Spaces and punctuation are ignored, so "Venkateswararo" and
+    "Venkateswara Rao" score close to 1.0.
+    """
+    return trigram_similarity(str1, str2)
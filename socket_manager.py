@@ -392,6 +392,14 @@ def notify_friend_connection(sender_email, recipient_email, categories_info):
         return True
     return False
 
+def notify_render_job(user_email, job_data):
+    """Tell a user's connected clients that one of their render jobs finished."""
+    global socketio
+    if socketio:
+        socketio.emit('render_job', job_data, room=user_email)
+        return True
+    return False
+
 def get_connected_users():
     """Get list of currently connected users"""
     return list(connected_users.keys())
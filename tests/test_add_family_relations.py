@@ -0,0 +1,28 @@
+from add_family_relations import add_family_relations
+
+
+def person(person_id, parent_id=None, spouse=None, gender='male', **fields):
+    return {'id': person_id, 'parentId': parent_id, 'spouse': spouse, 'gender': gender,
+            'profileImage': 'data:image/png;base64,aGVsbG8=', **fields}
+
+
+def test_labels_without_changing_the_input():
+    relatives = {p['id']: p for p in [
+        person('gf'), person('dad', 'gf'), person('mom', spouse='dad', gender='female'),
+        person('aunt', 'gf', gender='female'), person('cousin', 'aunt'),
+        person('me', 'dad', isSelf=True), person('sis', 'dad', gender='female'), person('niece', 'sis', gender='female'),
+        person('wife', spouse='me', gender='female'), person('son', 'me'),
+        person('stranger', 'ghost'),
+    ]}
+    snapshot = {key: dict(value) for key, value in relatives.items()}
+
+    result = add_family_relations(relatives)['_j']
+
+    assert {key: value['relation'] for key, value in result.items()} == {
+        'gf': "grandfather", 'dad': "father", 'mom': "mother", 'aunt': "aunt", 'cousin': "cousin",
+        'me': "self", 'sis': "sister", 'niece': "niece", 'wife': "wife", 'son': "son",
+        'stranger': "relative",
+    }
+    assert result['gf']['profileImage'] == relatives['gf']['profileImage']
+    assert relatives == snapshot
+    assert result['me'] is not relatives['me']
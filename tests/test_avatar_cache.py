@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+pytest.importorskip('PIL')
+
+import avatar_cache
+from avatar_cache import AvatarThumbnailCache
+
+
+def _age(cache, key, seconds_ago):
+    path = cache._path(key)
+    stamp = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (stamp, stamp))
+
+
+def test_cap_holds_across_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatar_cache, 'AVATAR_CACHE_RESCAN_MISSES', 1)
+    # Two caches on one directory stand in for two render processes
+    first, second = (AvatarThumbnailCache(str(tmp_path), max_bytes=10_000) for _ in range(2))
+    for i in range(20):
+        (first if i % 2 else second).thumbnail(f"key{i}", lambda: bytes(1_000))
+    assert sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path)) <= 10_000
+
+
+def test_hits_in_another_process_keep_a_thumbnail(tmp_path):
+    first = AvatarThumbnailCache(str(tmp_path), max_bytes=2_500)
+    second = AvatarThumbnailCache(str(tmp_path), max_bytes=2_500)
+    first.thumbnail('hit', lambda: b'h' * 1_000)
+    first.thumbnail('idle', lambda: b'i' * 1_000)
+    _age(first, 'hit', 20)
+    _age(first, 'idle', 10)
+
+    second.thumbnail('hit', lambda: pytest.fail("built twice"))
+    first.thumbnail('new', lambda: b'n' * 1_000)
+
+    assert sorted(os.listdir(tmp_path)) == ['hit.png', 'new.png']
@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+import family_duplicates
+from family_duplicates import DuplicateBlockIndex, find_duplicate_members, find_duplicate_people
+
+
+class _Doc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class _Collection:
+    def __init__(self, db):
+        self.db = db
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        self.db.streams += 1
+        return [_Doc(tree_id, {'familyMembers': members}) for tree_id, members in sorted(self.db.trees.items())]
+
+    def document(self, tree_id):
+        return _Ref(self.db, tree_id)
+
+
+class _Ref:
+    def __init__(self, db, tree_id):
+        self.db = db
+        self.tree_id = tree_id
+
+    def get(self, field_paths=None):
+        members = self.db.trees.get(self.tree_id)
+        return _Doc(self.tree_id, None if members is None else {'familyMembers': members})
+
+
+class _DB:
+    def __init__(self, trees):
+        self.trees = trees
+        self.streams = 0
+
+    def collection(self, name):
+        return _Collection(self)
+
+
+def _member(node_id, name, **fields):
+    return {'id': node_id, 'name': name, 'gender': 'female', 'profileImage': 'aGVsbG8=' * 100, **fields}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(family_duplicates, 'duplicate_block_index', DuplicateBlockIndex())
+    return _DB({
+        'tree-a': [_member('a1', 'Lakshmi Reddy'), _member('a2', 'Sita Rao')],
+        'tree-b': [_member('b1', 'Laxmi Reddi', email='laxmi@example.com')],
+        'tree-c': [_member('c1', 'Seeta Rao'), _member('c2', 'Ravi Naidu')],
+    })
+
+
+def test_keys_are_streamed_once_and_follow_writes(db):
+    assert find_duplicate_people(db) == find_duplicate_members(db.trees)
+    assert db.streams == 1
+
+    db.trees['tree-d'] = [_member('d1', 'Ravee Naidu')]
+    family_duplicates.duplicate_block_index.apply_family_members_write('tree-d', db.trees['tree-d'])
+    duplicates = find_duplicate_people(db)
+    assert duplicates == find_duplicate_members(db.trees)
+    assert {'d1', 'c2'} in [{pair['first']['nodeId'], pair['second']['nodeId']} for pair in duplicates]
+    assert db.streams == 1
+
+
+def test_tree_scope_rereads_only_that_tree(db):
+    find_duplicate_people(db)
+    # Written by another app instance, the listener never saw it
+    db.trees['tree-c'] = [_member('c1', 'Seeta Rao'), _member('c3', 'Lakshmi Reddy')]
+
+    assert find_duplicate_people(db, 'tree-c') == find_duplicate_members(db.trees, 'tree-c')
+    assert db.streams == 1
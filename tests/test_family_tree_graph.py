@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+from family_tree_graph import FamilyGraph
+
+
+class _Doc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class _Ref:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def document(self, doc_id):
+        return _Ref(self, doc_id)
+
+
+class _DB:
+    """Just enough of a Firestore client for FamilyGraph."""
+
+    def __init__(self, collections):
+        self.collections = {name: _Collection(docs) for name, docs in collections.items()}
+
+    def collection(self, name):
+        return self.collections[name]
+
+    def get_all(self, refs, field_paths=None):
+        for ref in refs:
+            yield _Doc(ref.id, ref.collection.docs.get(ref.id))
+
+
+def _chain(length):
+    """Trees t0..t(length-1), the last member of each is linked to the first member of the next."""
+    trees = {}
+    for i in range(length):
+        members = [{'id': 'a', 'name': f"A{i}", 'email': f"a{i}@x"},
+                   {'id': 'b', 'name': f"B{i}", 'parentId': 'a'}]
+        relatives = {'b': {'familyTreeId': f"t{i + 1}", 'originalNodeId': 'a'}} if i + 1 < length else {}
+        trees[f"t{i}"] = {'familyMembers': members, 'relatives': relatives}
+    return trees
+
+
+def test_query_keeps_every_tree_it_read_with_a_small_max_trees():
+    graph = FamilyGraph(_DB({'family_tree': _chain(6)}), max_trees=2)
+    result = graph.relatives_within('t0', 'a', max_hops=6)
+
+    reached = {(entry['familyTreeId'], entry['nodeId']): entry for entry in result}
+    assert len(reached) == 11
+    for i in range(6):
+        assert reached.get((f"t{i}", 'b'), {}).get('name') == f"B{i}"
+        if i:
+            assert reached[(f"t{i}", 'a')]['name'] == f"A{i}"
+    # The bound applies again once the query returned
+    assert len(graph._trees) == 2
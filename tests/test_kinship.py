@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from kinship import KinshipIndex
+
+
+def member(member_id, parent_id=None, spouse=None, gender='male'):
+    return {'id': member_id, 'parentId': parent_id, 'spouse': spouse, 'gender': gender}
+
+
+def test_cousins_through_the_other_parent():
+    members = [
+        member('gf', spouse='gm'), member('gm', spouse='gf', gender='female'),
+        member('dad', 'gf'), member('unc', 'gm'),
+        member('me', 'dad'), member('c', 'unc'),
+    ]
+    index = KinshipIndex(members)
+    assert index.relation('me', 'unc') == "Uncle"
+    assert index.relation('me', 'c') == "Cousin"
+    assert index.relation('c', 'me') == "Cousin"
+
+
+def test_mixed_parent_edge_three_generations_up():
+    members = [
+        member('ggf', spouse='ggm'), member('ggm', spouse='ggf', gender='female'),
+        member('gf', 'ggf'), member('gaunt', 'ggm', gender='female'),
+        member('dad', 'gf'), member('ac', 'gaunt'),
+        member('me', 'dad'), member('acc', 'ac'),
+    ]
+    index = KinshipIndex(members)
+    assert index.relation('me', 'gaunt') == "Great-aunt"
+    assert index.relation('me', 'ac') == "First Cousin Once Removed"
+    kinship = index.kinship('me', 'acc')
+    assert kinship['relation'] == "Second Cousin"
+    assert (kinship['generationsUp'], kinship['generationsDown']) == (3, 3)
+
+
+def test_other_parent_side_when_both_partners_have_parents():
+    members = [
+        member('gf'), member('dad', 'gf', spouse='mom'), member('mom', 'mgf', spouse='dad', gender='female'),
+        member('mgf', spouse='mgm'), member('mgm', spouse='mgf', gender='female'),
+        member('maunt', 'mgm', gender='female'), member('mc', 'maunt'),
+        member('me', 'dad'), member('kid', 'me'),
+    ]
+    index = KinshipIndex(members)
+    assert index.relation('me', 'mc') == "Cousin"
+    assert index.relation('kid', 'mgm') == "Great-Grandmother"
+    assert index.relation('dad', 'mgf') == "Father-in-law"
+    assert index.relation('mom', 'gf') == "Father-in-law"
+
+
+def test_parent_cycle_cuts_one_edge():
+    index = KinshipIndex([
+        {'id': 'a', 'parentId': 'b'},
+        {'id': 'b', 'parentId': 'a'},
+        {'id': 'c', 'parentId': 'b'},
+    ])
+    a, b, c = (index.unit_of[member_id] for member_id in 'abc')
+    # b -> a closed the cycle, b is the root and a, c are its children
+    assert index.depth[b] == 0 and index.depth[a] == 1 and index.depth[c] == 1
+    assert index.up[0][a] == b and index.up[0][c] == b and index.up[0][b] == b
+    assert index.relation('a', 'b') == "Parent"
+    assert index.relation('c', 'a') == "Sibling"
+    assert index.relation('a', 'a') == "Myself"
+
+
+def in_law_chain(generations):
+    """A male line where every wife brings her own father into the tree."""
+    members = []
+    for i in range(generations):
+        members.append(member(f'a{i}', f'a{i - 1}' if i else None, spouse=f'w{i}'))
+        members.append(member(f'w{i}', f'f{i}', spouse=f'a{i}', gender='female'))
+        members.append(member(f'f{i}'))
+    return members
+
+
+@pytest.mark.parametrize('cross_generation_marriage', [False, True])
+def test_in_law_chain_scales(cross_generation_marriage):
+    members = in_law_chain(800)
+    if cross_generation_marriage:
+        # Joins two lines with different numbers of generations between them
+        members += [member('x', 'a0', spouse='y'), member('y', 'a5', spouse='x', gender='female')]
+    index = KinshipIndex(members)
+
+    started = time.perf_counter()
+    relations = {kinship['nodeId']: kinship for kinship in (index.kinship('a799', m['id']) for m in members)}
+    assert time.perf_counter() - started < 5
+
+    assert relations['a798']['relation'] == "Father"
+    assert relations['w798']['relation'] == "Mother"
+    assert relations['f798']['relation'] == "Grandfather"
+    assert relations['w799']['relation'] == "Wife"
+    assert relations['f799']['relation'] == "Father-in-law"
+    assert (relations['a0']['generationsUp'], relations['a0']['generationsDown']) == (799, 0)
+    assert index.relation('w0', 'a799') == "Great-" * 797 + "Grandson"
+    if cross_generation_marriage:
+        assert index.relation('x', 'a799') == "Great-" * 796 + "Grand-nephew"
+        assert index.relation('y', 'a6') == "Brother"
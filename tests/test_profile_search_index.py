@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from profile_search_index import ProfileColumns, ProfileSearchIndex
+
+
+def _profiles(index, count):
+    names = [('Lakshmi', 'Reddy'), ('Laxmi', 'Reddi'), ('Venkateswara Rao', 'Megadula'), ('Sita', 'Rao')]
+    for i in range(count):
+        first, last = names[i % len(names)]
+        index.upsert(f"user{i:03d}@gmail.com", {'firstName': first, 'lastName': last, 'phone': f"90000{i:05d}"})
+
+
+def _rows(columns):
+    return list(zip(columns.id_array.tolist(), columns.emails.tolist(), columns.phones.tolist(),
+                    columns.first_names.keys[columns.first_name_codes].tolist(),
+                    columns.last_names.keys[columns.last_name_codes].tolist()))
+
+
+def test_columns_follow_writes_without_rebuild():
+    index = ProfileSearchIndex()
+    _profiles(index, 40)
+    columns = index.columns()
+
+    index.upsert('user005@gmail.com', {'firstName': 'Bhavani Sankara Prasad'})
+    index.upsert('user000@gmail.com', {'phone': '1234567890123456'})
+    patched = index.columns()
+    assert patched.id_array is columns.id_array
+
+    index.upsert('user010a@gmail.com', {'firstName': 'Seeta', 'lastName': 'Rao'})
+    index.remove('user020@gmail.com')
+    index.upsert('aaa@yahoo.in', {'firstName': 'Sri', 'lastName': 'Reddy'})
+    updated = index.columns()
+
+    assert _rows(updated) == _rows(ProfileColumns(index.records, index.version))
+    assert updated.version == index.version
+
+
+@pytest.mark.parametrize('criteria', [
+    {'last_name': 'reddi'},
+    {'first_name': 'laxmi', 'last_name': 'reddy'},
+    {'first_name': 'venkateswararao'},
+    {'first_name': 'seta', 'email': 'user01'},
+    {},
+])
+def test_numpy_backend_matches_index_backend_after_writes(criteria):
+    index = ProfileSearchIndex()
+    _profiles(index, 60)
+    index.columns()
+    index.upsert('user007@gmail.com', {'firstName': 'Laxmi Devi', 'lastName': 'Reddy'})
+    index.upsert('user100@gmail.com', {'firstName': 'Venkateshwararao', 'lastName': 'Rao'})
+    index.remove('user030@gmail.com')
+
+    assert index.search(backend='numpy', **criteria) == index.search(backend='index', **criteria)
@@ -0,0 +1,35 @@
+import os
+
+from render_cache import RenderCache
+
+
+def _age(cache, key, seconds_ago):
+    path = cache._path(key)
+    stamp = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (stamp, stamp))
+
+
+def _disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def test_disk_cap_holds_across_processes(tmp_path):
+    # Two caches on one directory stand in for two worker processes
+    first, second = (RenderCache(str(tmp_path), max_bytes=0, disk_max_bytes=10_000) for _ in range(2))
+    for i in range(20):
+        (first if i % 2 else second).put(f"key{i}", bytes(1_000))
+    assert _disk_bytes(tmp_path) <= 10_000
+
+
+def test_hits_in_another_process_keep_an_image(tmp_path):
+    first = RenderCache(str(tmp_path), max_bytes=0, disk_max_bytes=2_500)
+    second = RenderCache(str(tmp_path), max_bytes=0, disk_max_bytes=2_500)
+    first.put('hit', b'o' * 1_000)
+    first.put('idle', b'x' * 1_000)
+    _age(first, 'hit', 20)
+    _age(first, 'idle', 10)
+
+    assert second.get('hit') == b'o' * 1_000
+    first.put('new', b'n' * 1_000)
+
+    assert sorted(os.listdir(tmp_path)) == ['hit.png', 'new.png']
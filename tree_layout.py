@@ -0,0 +1,285 @@
+import math
+from collections import defaultdict
+from typing import Dict, List, Any
+
+# Box of one member in layout units (pixels at 1:1)
+NODE_WIDTH = 120
+NODE_HEIGHT = 140
+# Horizontal gap between a member and their spouse inside a couple
+SPOUSE_GAP = 20
+# Horizontal gap between neighbouring siblings, and between cousins' subtrees
+SIBLING_GAP = 40
+SUBTREE_GAP = 80
+# Vertical gap between generations
+LEVEL_GAP = 80
+MARGIN = 40
+
+
+class _Unit:
+    """A member with their spouse, placed as one box with the couple's children below it."""
+
+    __slots__ = ('members', 'width', 'children', 'parent', 'number', 'depth',
+                 'prelim', 'mod', 'shift', 'change', 'thread', 'ancestor', 'midpoint', 'x')
+
+    def __init__(self, members: List[str]):
+        self.members = members
+        self.width = NODE_WIDTH * len(members) + SPOUSE_GAP * (len(members) - 1)
+        self.children = []
+        self.parent = None
+        self.number = 1
+        self.depth = 0
+        self.prelim = 0.0
+        self.mod = 0.0
+        self.shift = 0.0
+        self.change = 0.0
+        self.thread = None
+        self.ancestor = self
+        self.midpoint = None
+        self.x = 0.0
+
+    def left_sibling(self):
+        return self.parent.children[self.number - 2] if self.number > 1 else None
+
+    def next_left(self):
+        return self.children[0] if self.children else self.thread
+
+    def next_right(self):
+        return self.children[-1] if self.children else self.thread
+
+
+def _build_units(family_data: List[Dict[str, Any]]):
+    """
+    Couples and their children from parentId and spouse links.
+
+    A member and their spouse share a unit, the one with a parent in the
+    tree first. A unit's children are the units of members whose parentId
+    is either partner. Units without a parent in the tree, or only reachable
+    through a parentId cycle, are roots.
+    """
+    member_ids = []
+    parent_of = {}
+    spouse_of = {}
+    for member in family_data:
+        member_id = member.get('id')
+        if member_id is None or member_id in parent_of:
+            continue
+        member_ids.append(member_id)
+        parent_of[member_id] = member.get('parentId')
+    for member in family_data:
+        member_id, spouse_id = member.get('id'), member.get('spouse')
+        if spouse_id in parent_of and spouse_id != member_id:
+            spouse_of.setdefault(member_id, spouse_id)
+            spouse_of.setdefault(spouse_id, member_id)
+
+    unit_of = {}
+    units = []
+    for member_id in member_ids:
+        if member_id in unit_of:
+            continue
+        partner_id = spouse_of.get(member_id)
+        if partner_id in unit_of or spouse_of.get(partner_id) != member_id:
+            partner_id = None
+        members = [member_id]
+        if partner_id is not None:
+            # The partner with a parent in the tree stays under that parent
+            if parent_of[member_id] not in parent_of and parent_of[partner_id] in parent_of:
+                members = [partner_id, member_id]
+            else:
+                members.append(partner_id)
+        unit = _Unit(members)
+        units.append(unit)
+        for unit_member_id in members:
+            unit_of[unit_member_id] = unit
+
+    children = defaultdict(list)
+    for unit in units:
+        parent_id = parent_of[unit.members[0]]
+        if parent_id in unit_of and unit_of[parent_id] is not unit:
+            children[unit_of[parent_id]].append(unit)
+
+    # Link units top-down, each unit is taken once so cycles become roots
+    roots = []
+    linked = set()
+    candidates = [unit for unit in units if parent_of[unit.members[0]] not in unit_of] + units
+    for root in candidates:
+        if id(root) in linked:
+            continue
+        linked.add(id(root))
+        roots.append(root)
+        stack = [root]
+        while stack:
+            unit = stack.pop()
+            for child in children.get(unit, ()):
+                if id(child) in linked:
+                    continue
+                linked.add(id(child))
+                child.parent = unit
+                child.depth = unit.depth + 1
+                child.number = len(unit.children) + 1
+                unit.children.append(child)
+                stack.append(child)
+    return roots, units
+
+
+def _distance(left: _Unit, right: _Unit) -> float:
+    # Roots of separate trees share only the virtual forest root, which has no members
+    gap = SIBLING_GAP if left.parent is right.parent and left.parent.members else SUBTREE_GAP
+    return (left.width + right.width) / 2 + gap
+
+
+def _move_subtree(left: _Unit, right: _Unit, shift: float):
+    subtrees = right.number - left.number
+    right.change -= shift / subtrees
+    right.shift += shift
+    left.change += shift / subtrees
+    right.prelim += shift
+    right.mod += shift
+
+
+def _execute_shifts(unit: _Unit):
+    shift = change = 0.0
+    for child in reversed(unit.children):
+        child.prelim += shift
+        child.mod += shift
+        change += child.change
+        shift += child.shift + change
+
+
+def _ancestor(inner_left: _Unit, unit: _Unit, default_ancestor: _Unit) -> _Unit:
+    if inner_left.ancestor.parent is unit.parent:
+        return inner_left.ancestor
+    return default_ancestor
+
+
+def _apportion(unit: _Unit, default_ancestor: _Unit) -> _Unit:
+    """Push unit's subtree right until its left contour clears its left siblings' subtrees."""
+    left_sibling = unit.left_sibling()
+    if left_sibling is None:
+        return default_ancestor
+    inner_right = outer_right = unit
+    inner_left = left_sibling
+    outer_left = unit.parent.children[0]
+    shift_inner_right = inner_right.mod
+    shift_outer_right = outer_right.mod
+    shift_inner_left = inner_left.mod
+    shift_outer_left = outer_left.mod
+    while inner_left.next_right() and inner_right.next_left():
+        inner_left = inner_left.next_right()
+        inner_right = inner_right.next_left()
+        outer_left = outer_left.next_left()
+        outer_right = outer_right.next_right()
+        outer_right.ancestor = unit
+        shift = ((inner_left.prelim + shift_inner_left) - (inner_right.prelim + shift_inner_right)
+                 + _distance(inner_left, inner_right))
+        if shift > 0:
+            _move_subtree(_ancestor(inner_left, unit, default_ancestor), unit, shift)
+            shift_inner_right += shift
+            shift_outer_right += shift
+        shift_inner_left += inner_left.mod
+        shift_inner_right += inner_right.mod
+        shift_outer_left += outer_left.mod
+        shift_outer_right += outer_right.mod
+    if inner_left.next_right() and not outer_right.next_right():
+        outer_right.thread = inner_left.next_right()
+        outer_right.mod += shift_inner_left - shift_outer_right
+    if inner_right.next_left() and not outer_left.next_left():
+        outer_left.thread = inner_right.next_left()
+        outer_left.mod += shift_inner_right - shift_outer_left
+        default_ancestor = unit
+    return default_ancestor
+
+
+def _place(unit: _Unit):
+    """Preliminary x of a unit next to its left sibling, or centred over its children."""
+    left_sibling = unit.left_sibling()
+    if left_sibling is None:
+        unit.prelim = unit.midpoint if unit.children else 0.0
+    else:
+        unit.prelim = left_sibling.prelim + _distance(left_sibling, unit)
+        if unit.children:
+            unit.mod = unit.prelim - unit.midpoint
+
+
+def _first_walk(root: _Unit):
+    """Post-order pass of Walker's algorithm, iterative so deep trees need no recursion."""
+    stack = [(root, False)]
+    while stack:
+        unit, children_done = stack.pop()
+        if not children_done:
+            stack.append((unit, True))
+            stack.extend((child, False) for child in reversed(unit.children))
+            continue
+        if unit.children:
+            default_ancestor = unit.children[0]
+            for child in unit.children:
+                _place(child)
+                default_ancestor = _apportion(child, default_ancestor)
+            _execute_shifts(unit)
+            unit.midpoint = (unit.children[0].prelim + unit.children[-1].prelim) / 2
+    _place(root)
+
+
+def _second_walk(root: _Unit):
+    """Final x of every unit, the sum of its ancestors' modifiers plus its own prelim."""
+    stack = [(root, 0.0)]
+    while stack:
+        unit, modsum = stack.pop()
+        unit.x = unit.prelim + modsum
+        stack.extend((child, modsum + unit.mod) for child in unit.children)
+
+
+def layout_family_tree(family_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Tidy-tree coordinates of a family tree without rendering it.
+
+    Couples are laid out as one box and their children are centred below
+    them with Walker's algorithm (as improved by Buchheim, Jünger and
+    Leipert), so subtrees never overlap, identical subtrees look the same
+    and the whole layout takes time linear in the number of members.
+    Separate trees (members without a parent in the tree) are placed side
+    by side.
+
+    Args:
+        family_data: List of family members
+
+    Returns:
+        dict: 'coordinates' mapping each member id to the centre ('x', 'y'),
+        size ('width', 'height') and 'level' of its box, and the
+        'image_width' and 'image_height' of the whole layout
+    """
+    roots, units = _build_units(family_data)
+    if not roots:
+        return {'coordinates': {}, 'image_width': 0, 'image_height': 0}
+
+    # Lay out a forest as the children of one virtual root
+    forest = _Unit([])
+    for number, root in enumerate(roots, 1):
+        root.parent = forest
+        root.number = number
+    forest.children = roots
+    _first_walk(forest)
+    _second_walk(forest)
+
+    left = min(unit.x - unit.width / 2 for unit in units)
+    right = max(unit.x + unit.width / 2 for unit in units)
+    depth = max(unit.depth for unit in units)
+
+    coordinates = {}
+    for unit in units:
+        x = unit.x - unit.width / 2 - left + MARGIN + NODE_WIDTH / 2
+        y = MARGIN + NODE_HEIGHT / 2 + unit.depth * (NODE_HEIGHT + LEVEL_GAP)
+        for member_id in unit.members:
+            coordinates[member_id] = {
+                'x': round(x, 2),
+                'y': y,
+                'width': NODE_WIDTH,
+                'height': NODE_HEIGHT,
+                'level': unit.depth,
+            }
+            x += NODE_WIDTH + SPOUSE_GAP
+
+    return {
+        'coordinates': coordinates,
+        'image_width': math.ceil(right - left + 2 * MARGIN),
+        'image_height': MARGIN * 2 + (depth + 1) * NODE_HEIGHT + depth * LEVEL_GAP,
+    }
@@ -0,0 +1,36 @@
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def render_workspace(prefix: str = 'tree_render_'):
+    """
+    Private directory for the files of one render, such as the avatar
+    images referenced by node labels. It is removed with its content when
+    the render is done, so concurrent renders never share a path.
+    """
+    workspace = tempfile.mkdtemp(prefix=prefix)
+    try:
+        yield workspace
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def render_png(dot) -> bytes:
+    """Run Graphviz on a graph and return the PNG it writes to stdout."""
+    return dot.pipe(format='png')
+
+
+def save_dot_source(dot, name: str) -> str:
+    """Write the DOT source of a failed render to a new file in the temp dir and return its path."""
+    fd, path = tempfile.mkstemp(prefix=f"{name}_", suffix='.dot')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(dot.source)
+    logger.error(f"DOT source of the failed {name} render saved to {path}")
+    return path
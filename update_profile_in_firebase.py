@@ -5,6 +5,9 @@ import uuid
 import os
 import logging
 from werkzeug.utils import secure_filename
+from profile_search_index import index_profile
+from phonetic_keys import phonetic_name_keys
+from family_tree_email_index import find_family_tree_nodes, index_family_tree_members
 
 
 logging.basicConfig(level=logging.INFO) 
@@ -41,10 +44,12 @@ def update_profile_in_firebase(email, data, user_profiles_ref,db):
             "phone": phone,
             "DOB": data.get('dob'),
             "GENDER": gender.lower(),
-          
+            "updatedAt": datetime.now().isoformat()
           
         }
+        basic_profile_data.update(phonetic_name_keys(first_name, last_name))
         user_ref.update(basic_profile_data)
+        index_profile(email, basic_profile_data)
 
         # Update profile image (if provided)
         profile_image_data = None
@@ -55,6 +60,7 @@ def update_profile_in_firebase(email, data, user_profiles_ref,db):
                 "imageData": profile_image_data
             })
             user_ref.update({"currentProfileImageId": current_image_id})
+            index_profile(email, {"currentProfileImageId": current_image_id})
 
         # Update additional info (if provided)
         additional_info = data.get('additionalInfo')
@@ -102,10 +108,47 @@ def update_profile_in_firebase(email, data, user_profiles_ref,db):
             "error": str(e)
         }
 
+def _apply_profile_to_members(family_members, email, first_name, last_name, phone, gender, profile_image):
+    """
+    Copy the profile details onto every member of one tree carrying the email.
+
+    Returns:
+        bool: True if any member was updated
+    """
+    updated = False
+    for i, member in enumerate(family_members):
+        if member.get('email') == email:
+            # Create full name
+            full_name = f"{first_name} {last_name}".strip()
+            
+            # Update member details
+            family_members[i]['name'] = full_name
+            family_members[i]['firstName'] = first_name
+            family_members[i]['lastName'] = last_name
+            
+            if phone:
+                family_members[i]['phone'] = phone
+            
+            if gender:
+                family_members[i]['gender'] = gender.lower()
+            
+            if profile_image:
+                # Add base64 prefix if not already present
+                if profile_image and not profile_image.startswith('data:'):
+                    logger.info(f"Adding base64 prefix to profile image for user: {email}")
+                    family_members[i]['profileImage'] = 'data:image/jpeg;base64,' + profile_image
+                else:
+                    family_members[i]['profileImage'] = profile_image
+            
+            updated = True
+    return updated
+
 def update_user_in_family_tree(db, email, first_name, last_name, phone, gender, profile_image):
     """
     Update a user's details in ALL family trees where they exist.
-    Searches across all family trees for nodes with the specified email and updates their details.
+    Looks the user's nodes up in the email -> (familyTreeId, nodeId) index and
+    only reads those trees. Falls back to scanning every family tree while the
+    index has not been built yet.
     
     :param db: Firestore database instance
     :param email: User's email (used to find them in family trees)
@@ -116,54 +159,41 @@ def update_user_in_family_tree(db, email, first_name, last_name, phone, gender,
     :param profile_image: User's profile image data
     """
     try:
-        # Query all family trees
         family_trees_ref = db.collection('family_tree')
-        family_trees = family_trees_ref.stream()
+        indexed_trees = find_family_tree_nodes(db, email)
+        
+        if indexed_trees is None:
+            # Index not built yet - query all family trees
+            family_trees = family_trees_ref.stream()
+        else:
+            tree_refs = [family_trees_ref.document(tree_id) for tree_id in sorted(indexed_trees)]
+            family_trees = db.get_all(tree_refs) if tree_refs else []
         
         update_count = 0
         
-        # Loop through all family trees
+        # Loop through the candidate family trees
         for tree_doc in family_trees:
+            if not tree_doc.exists:
+                continue
             tree_id = tree_doc.id
             tree_data = tree_doc.to_dict()
             family_members = tree_data.get('familyMembers', [])
             
             # Check if any members in this tree have the specified email
-            updated = False
-            for i, member in enumerate(family_members):
-                if member.get('email') == email:
-                    logger.info(f"Found user {email} in family tree {tree_id}, updating details")
-                    
-                    # Create full name
-                    full_name = f"{first_name} {last_name}".strip()
-                    
-                    # Update member details
-                    family_members[i]['name'] = full_name
-                    family_members[i]['firstName'] = first_name
-                    family_members[i]['lastName'] = last_name
-                    
-                    if phone:
-                        family_members[i]['phone'] = phone
-                    
-                    if gender:
-                        family_members[i]['gender'] = gender.lower()
-                    
-                    if profile_image:
-                        # Add base64 prefix if not already present
-                        if profile_image and not profile_image.startswith('data:'):
-                            logger.info(f"Adding base64 prefix to profile image for user: {email}")
-                            family_members[i]['profileImage'] = 'data:image/jpeg;base64,' + profile_image
-                        else:
-                            family_members[i]['profileImage'] = profile_image
-                    
-                    updated = True
+            updated = _apply_profile_to_members(
+                family_members, email, first_name, last_name, phone, gender, profile_image
+            )
             
             # If any members were updated, save the changes
             if updated:
+                logger.info(f"Found user {email} in family tree {tree_id}, updating details")
                 family_trees_ref.document(tree_id).update({
                     'familyMembers': family_members
                 })
                 update_count += 1
+            elif indexed_trees is not None:
+                # Stale index entry (e.g. the email changed case) - bring it back in line
+                index_family_tree_members(tree_id, family_members, db)
         
         logger.info(f"Updated user {email} in {update_count} family trees")
         return update_count